@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS", "app/cert/serviceAccountKey.json")
+# Verify ID tokens in-process against cached signing keys; "0" delegates to firebase_admin
+LOCAL_TOKEN_VERIFICATION = os.getenv("FIREBASE_LOCAL_VERIFY", "1") == "1"
+
+_init_lock = threading.Lock()
+_initialized = False
+_token_verifier = None
+
+
+class InvalidIdTokenError(ValueError):
+    """The ID token is malformed, has a bad signature or the wrong audience/issuer."""
+
+
+class ExpiredIdTokenError(InvalidIdTokenError):
+    """The ID token was valid but has expired."""
+
+
+class TokenVerificationUnavailable(Exception):
+    """No signing keys could be loaded, so no token can be verified right now."""
+
+
+def get_firebase_auth():
+    """
+    Return the firebase_admin.auth module, initializing the Firebase app on first use.
+
+    firebase_admin and its Google auth dependencies are imported and the
+    service-account certificate is read only when a token is first verified,
+    not when app.main is imported.
+    """
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                import firebase_admin
+                from firebase_admin import credentials
+                firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS_PATH))
+                _initialized = True
+    from firebase_admin import auth
+    return auth
+
+
+def get_project_id() -> Optional[str]:
+    """Firebase project ID from FIREBASE_PROJECT_ID or the service-account file."""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    try:
+        with open(FIREBASE_CREDENTIALS_PATH) as f:
+            return json.load(f).get("project_id")
+    except (OSError, ValueError):
+        return None
+
+
+def get_token_verifier():
+    """The shared local TokenVerifier, created (and its key refresh started) on first use."""
+    global _token_verifier
+    if _token_verifier is None:
+        with _init_lock:
+            if _token_verifier is None:
+                from app.token_verifier import KeyCache, TokenVerifier
+                project_id = get_project_id()
+                if not project_id:
+                    raise TokenVerificationUnavailable("Firebase project ID is not configured")
+                keys = KeyCache()
+                keys.start()
+                _token_verifier = TokenVerifier(project_id, keys)
+    return _token_verifier
+
+
+def set_token_verifier(verifier) -> None:
+    """Replace the shared verifier, e.g. with one backed by locally generated keys."""
+    global _token_verifier
+    _token_verifier = verifier
+
+
+def verify_id_token(id_token: str) -> Dict[str, Any]:
+    """
+    Verify a Firebase ID token and return its claims.
+
+    Raises:
+        ExpiredIdTokenError: The token has expired
+        InvalidIdTokenError: The token is otherwise invalid
+        TokenVerificationUnavailable: Signing keys could not be obtained
+    """
+    if LOCAL_TOKEN_VERIFICATION:
+        return get_token_verifier().verify(id_token)
+
+    auth = get_firebase_auth()
+    try:
+        return auth.verify_id_token(id_token)
+    except auth.ExpiredIdTokenError as e:
+        raise ExpiredIdTokenError(str(e)) from e
+    except (auth.InvalidIdTokenError, ValueError) as e:
+        raise InvalidIdTokenError(str(e)) from e
+    except auth.CertificateFetchError as e:
+        raise TokenVerificationUnavailable(str(e)) from e
@@ -0,0 +1,351 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from app.crud import import_grade_rows
+from app.ingest import ParsedRow, detect_format, iter_rows
+from app.metrics import registry as metrics
+from app.validators import GradeValidator
+
+UPLOAD_DIR = "uploads"
+
+# Largest file a resumable upload may declare
+MAX_UPLOAD_SIZE = int(os.getenv("RESUMABLE_UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+# Largest single chunk PUT
+MAX_CHUNK_SIZE = int(os.getenv("RESUMABLE_UPLOAD_MAX_CHUNK_BYTES", str(16 * 1024 ** 2)))
+# Unfinished uploads untouched for this long are removed
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("RESUMABLE_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+# An import saves its progress after every chunk; one silent for this long is presumed dead
+IMPORT_LEASE_SECONDS = int(os.getenv("RESUMABLE_UPLOAD_IMPORT_LEASE_SECONDS", "600"))
+
+metrics.describe("resumable_upload_bytes_total", "counter", "Bytes accepted by resumable upload chunk PUTs")
+metrics.describe("resumable_upload_chunks_rejected_total", "counter", "Resumable upload chunks rejected, by reason")
+
+
+class UploadSessionError(Exception):
+    """A chunk or commit that does not fit the upload's current state."""
+
+    def __init__(self, message: str, status_code: int = 409):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _session_dir(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+
+def _meta_path(upload_id: str) -> str:
+    return os.path.join(_session_dir(upload_id), "upload.json")
+
+
+def _data_path(upload_id: str) -> str:
+    return os.path.join(_session_dir(upload_id), "data")
+
+
+def _save_upload(upload: Dict[str, Any]) -> None:
+    """Persist upload metadata next to its data so any worker can continue it."""
+    upload["updated_at"] = datetime.now().isoformat()
+    temp_path = _meta_path(upload["id"]) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(upload, f)
+    os.replace(temp_path, _meta_path(upload["id"]))
+
+
+def _seconds_ago(seconds: int) -> str:
+    return (datetime.now() - timedelta(seconds=seconds)).isoformat()
+
+
+def get_upload(upload_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load upload metadata, or None if the upload does not exist.
+
+    A "processing" upload whose import has not saved progress within
+    IMPORT_LEASE_SECONDS is reported as "failed": the worker running it died.
+    """
+    # Upload IDs are hex UUIDs; reject anything else so IDs cannot escape UPLOAD_DIR
+    if not upload_id.isalnum():
+        return None
+    try:
+        with open(_meta_path(upload_id)) as f:
+            upload = json.load(f)
+    except FileNotFoundError:
+        return None
+    if upload["status"] == "processing" and upload["updated_at"] < _seconds_ago(IMPORT_LEASE_SECONDS):
+        upload["status"] = "failed"
+        upload["error"] = f"Import stopped after {upload['rows_processed']} rows without finishing"
+    return upload
+
+
+def purge_expired_uploads() -> int:
+    """Remove the data of uploads that were abandoned or finished more than the TTL ago."""
+    if not os.path.isdir(UPLOAD_DIR):
+        return 0
+    cutoff = _seconds_ago(UPLOAD_SESSION_TTL_SECONDS)
+    removed = 0
+    for upload_id in os.listdir(UPLOAD_DIR):
+        upload = get_upload(upload_id)
+        if upload is not None and upload["updated_at"] < cutoff and upload["status"] != "processing":
+            shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def create_upload(
+    filename: str,
+    size: int,
+    sha256: Optional[str] = None,
+    mode: str = "insert",
+    min_grade: int = 0,
+    max_grade: int = 100,
+    created_by: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Start a resumable grade upload of ``size`` bytes.
+
+    Raises:
+        ValueError: If the file type or size is not accepted
+    """
+    if detect_format(filename) is None:
+        raise ValueError("Only CSV, Excel and NDJSON files are supported")
+    if size > MAX_UPLOAD_SIZE:
+        raise ValueError(f"File too large: maximum size is {MAX_UPLOAD_SIZE} bytes")
+    purge_expired_uploads()
+
+    upload_id = uuid.uuid4().hex
+    os.makedirs(_session_dir(upload_id))
+    open(_data_path(upload_id), "wb").close()
+    upload = {
+        "id": upload_id,
+        "filename": filename,
+        "size": size,
+        "sha256": sha256.lower() if sha256 else None,
+        "mode": mode,
+        "min_grade": min_grade,
+        "max_grade": max_grade,
+        "offset": 0,
+        "status": "receiving",
+        "created_by": created_by,
+        "created_at": datetime.now().isoformat(),
+        "rows_processed": 0,
+        "result": None,
+        "error": None,
+    }
+    _save_upload(upload)
+    return upload
+
+
+def _try_lock(lock_file) -> bool:
+    """Take an exclusive OS lock on ``lock_file`` without waiting; False if someone else holds it."""
+    # Imported here: each module exists on one platform only
+    if os.name == "nt":
+        import msvcrt
+        lock_file.seek(0)
+        try:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+    else:
+        import fcntl
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+    return True
+
+
+def _unlock(lock_file) -> None:
+    if os.name == "nt":
+        import msvcrt
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked(upload_id: str):
+    """Exclusive lock on an upload across threads and worker processes; released if the holder dies."""
+    with open(os.path.join(_session_dir(upload_id), "lock"), "a+") as lock_file:
+        if not _try_lock(lock_file):
+            raise UploadSessionError("Another request is writing to this upload")
+        try:
+            yield
+        finally:
+            _unlock(lock_file)
+
+
+def _sync(data) -> None:
+    data.flush()
+    os.fsync(data.fileno())
+
+
+async def write_chunk(upload_id: str, offset: int, chunk_sha256: str, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Append one chunk at ``offset`` while streaming it to disk.
+
+    The chunk is kept only if its SHA-256 matches ``chunk_sha256``; otherwise
+    the data file is truncated back to ``offset`` and the client resends it.
+
+    Raises:
+        UploadSessionError: Wrong offset (409), bad checksum (422), chunk too large (413) or wrong state (409)
+    """
+    # File I/O runs in the threadpool so a large chunk does not stall the event loop
+    with _locked(upload_id):
+        upload = await run_in_threadpool(get_upload, upload_id)
+        if upload["status"] != "receiving":
+            raise UploadSessionError(f"Upload is {upload['status']}")
+        if offset != upload["offset"]:
+            raise UploadSessionError(f"Expected offset {upload['offset']}, got {offset}")
+
+        digest = hashlib.sha256()
+        written = 0
+        data = await run_in_threadpool(open, _data_path(upload_id), "r+b")
+        try:
+            data.seek(offset)
+            try:
+                async for piece in body:
+                    written += len(piece)
+                    if written > MAX_CHUNK_SIZE or offset + written > upload["size"]:
+                        raise UploadSessionError("Chunk exceeds the maximum chunk size or the declared file size", 413)
+                    digest.update(piece)
+                    await run_in_threadpool(data.write, piece)
+                if digest.hexdigest() != chunk_sha256.lower():
+                    raise UploadSessionError("Chunk checksum mismatch", 422)
+                await run_in_threadpool(_sync, data)
+            except BaseException as e:
+                # Includes client disconnects: drop the partial chunk so the offset stays valid.
+                # Not awaited, so a cancelled request still truncates.
+                data.truncate(offset)
+                reason = "checksum" if isinstance(e, UploadSessionError) and e.status_code == 422 else "aborted"
+                metrics.inc("resumable_upload_chunks_rejected_total", (("reason", reason),))
+                raise
+        finally:
+            data.close()
+
+        upload["offset"] = offset + written
+        await run_in_threadpool(_save_upload, upload)
+        metrics.inc("resumable_upload_bytes_total", value=written)
+        return upload
+
+
+def _check_complete(upload: Dict[str, Any]) -> None:
+    """Raise UploadSessionError unless every byte is in and the whole-file checksum matches."""
+    if upload["offset"] != upload["size"]:
+        raise UploadSessionError(f"Upload incomplete: {upload['offset']} of {upload['size']} bytes received")
+    if upload["sha256"]:
+        digest = hashlib.sha256()
+        with open(_data_path(upload["id"]), "rb") as data:
+            for block in iter(lambda: data.read(1024 * 1024), b""):
+                digest.update(block)
+        if digest.hexdigest() != upload["sha256"]:
+            raise UploadSessionError("File checksum mismatch", 422)
+
+
+def check_upload(upload_id: str) -> Dict[str, Any]:
+    """
+    Verify a fully received upload without committing it, e.g. before a dry run.
+
+    Raises:
+        UploadSessionError: If the upload was already committed, bytes are
+            missing or the whole-file checksum does not match
+    """
+    with _locked(upload_id):
+        upload = get_upload(upload_id)
+        if upload["status"] != "receiving":
+            raise UploadSessionError(f"Upload is {upload['status']}")
+        _check_complete(upload)
+        return upload
+
+
+def iter_upload_rows(upload: Dict[str, Any]) -> Iterator[ParsedRow]:
+    """Stream a received upload's rows from disk through app.ingest without importing them."""
+    with open(_data_path(upload["id"]), "rb") as data:
+        yield from iter_rows(data, upload["filename"])
+
+
+def commit_upload(upload_id: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Mark a fully received upload for processing.
+
+    Returns:
+        Tuple of (upload, whether this call started processing); a repeated
+        commit returns the current state and False, and must not import again
+
+    Raises:
+        UploadSessionError: If bytes are missing or the whole-file checksum does not match
+    """
+    with _locked(upload_id):
+        upload = get_upload(upload_id)
+        if upload["status"] != "receiving":
+            return upload, False
+        _check_complete(upload)
+        upload["status"] = "processing"
+        _save_upload(upload)
+        return upload, True
+
+
+def abort_upload(upload_id: str) -> None:
+    with _locked(upload_id):
+        upload = get_upload(upload_id)
+        if upload["status"] == "processing":
+            raise UploadSessionError("Upload is being processed")
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+
+
+def run_upload_import(upload_id: str, session_factory: sessionmaker, changed_by: Optional[str] = None) -> None:
+    """
+    Background task: stream a committed upload from disk into the grade import.
+
+    Rows are parsed by app.ingest and written one chunk per transaction, so
+    the file is never held in memory. Progress is saved after each chunk,
+    which also renews the import's lease (see get_upload).
+    """
+    upload = get_upload(upload_id)
+    if upload is None or upload["status"] != "processing":
+        return
+    _save_upload(upload)
+    db = session_factory()
+
+    def save_progress(processed: int) -> None:
+        upload["rows_processed"] = processed
+        _save_upload(upload)
+
+    try:
+        validator = GradeValidator(min_grade=upload["min_grade"], max_grade=upload["max_grade"])
+        with open(_data_path(upload_id), "rb") as data:
+            processed, counts, errors = import_grade_rows(
+                db,
+                iter_rows(data, upload["filename"]),
+                mode=upload["mode"],
+                validator=validator,
+                changed_by=changed_by,
+                on_progress=save_progress
+            )
+        successful = counts["created"] + counts["updated"] + counts["unchanged"]
+        upload["rows_processed"] = processed
+        upload["result"] = {
+            "total_processed": processed,
+            "successful": successful,
+            "failed": processed - successful,
+            **counts,
+            "errors": errors or None,
+        }
+        upload["status"] = "done"
+    except Exception as e:
+        upload["status"] = "failed"
+        upload["error"] = str(e)
+    finally:
+        db.close()
+    _save_upload(upload)
+    # Only the metadata and result are kept
+    try:
+        os.remove(_data_path(upload_id))
+    except FileNotFoundError:
+        pass
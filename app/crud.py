@@ -1,10 +1,13 @@
 from sqlalchemy.orm import Session
-from app.database import Course, Grade, StudentCourse, Student
-from app.validators import GradeValidator
-from typing import Tuple, List, Dict, Any, Optional
+from app.database import Course, CourseCredit, Grade, StudentCourse, Student, chunked
+from app.validators import GradeValidator, StudentValidator, grade_columns
+from app.ingest import iter_chunks
+from app.versions import COURSES_SCOPE, bump_versions, course_scope, student_scope
+from app.outbox import enqueue, enqueue_activity, enqueue_many
+from typing import Tuple, List, Dict, Any, Optional, Iterable, Iterator
 from datetime import datetime
 from app.database import Grade, GradeHistory
-from sqlalchemy import func
+from sqlalchemy import func, insert
 
 # Default validator with range 0-100
 default_validator = GradeValidator(min_grade=0, max_grade=100)
@@ -15,9 +18,16 @@ def create_grade(
     subject: str, 
     grade: int,
     validator: GradeValidator = default_validator,
-    changed_by: str = None
+    changed_by: str = None,
+    activity: Optional[Dict[str, Any]] = None
 ) -> Grade:
-    """Create a new grade and record history."""
+    """
+    Create a new grade and record history.
+
+    The grade, its history entry and its outbox event are committed together.
+    ``activity`` holds log_activity arguments for the relay to log; the new
+    grade's ID is filled in as the resource_id.
+    """
     grade_data = {"student_id": student_id, "subject": subject, "grade": grade}
     is_valid, error_message = validator.validate_grade_data(grade_data)
     if not is_valid:
@@ -25,8 +35,7 @@ def create_grade(
 
     new_grade = Grade(student_id=student_id, subject=subject, grade=grade)
     db.add(new_grade)
-    db.commit()
-    db.refresh(new_grade)
+    db.flush()  # Flush to get the ID
 
     # Record history
     create_grade_history(
@@ -37,8 +46,12 @@ def create_grade(
         old_value=None,
         new_value=grade,
         action="create",
-        changed_by=changed_by
+        changed_by=changed_by,
+        activity={**activity, "resource_id": new_grade.id} if activity else None
     )
+    bump_versions(db, [student_scope(student_id)])
+    db.commit()
+    db.refresh(new_grade)
     return new_grade
 
 def update_grade(
@@ -57,8 +70,6 @@ def update_grade(
     if grade:
         old_value = grade.grade
         grade.grade = new_grade
-        db.commit()
-        db.refresh(grade)
 
         # Record history
         create_grade_history(
@@ -71,6 +82,9 @@ def update_grade(
             action="update",
             changed_by=changed_by
         )
+        bump_versions(db, [student_scope(grade.student_id)])
+        db.commit()
+        db.refresh(grade)
         return grade
     return None
 
@@ -83,7 +97,6 @@ def delete_grade(
     grade = db.query(Grade).filter(Grade.id == grade_id).first()
     if grade:
         db.delete(grade)
-        db.commit()
 
         # Record history
         create_grade_history(
@@ -96,9 +109,201 @@ def delete_grade(
             action="delete",
             changed_by=changed_by
         )
+        bump_versions(db, [student_scope(grade.student_id)])
+        db.commit()
         return grade
     return None
 
+class GradeBatchError(ValueError):
+    """A batch of grade changes failed validation; nothing was applied."""
+
+    def __init__(self, errors: List[str]):
+        super().__init__(f"{len(errors)} grade change(s) failed validation")
+        self.errors = errors
+
+def record_grade_changes(
+    db: Session,
+    action: str,
+    changes: List[Dict[str, Any]],
+    changed_by: Optional[str] = None,
+    activity: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    create_grade_history() for many changes of one action.
+
+    Adds the history rows and their outbox events to the caller's
+    transaction with one executemany insert each.
+
+    Args:
+        db: Database session
+        action: "create", "update" or "delete"
+        changes: Dicts with grade_id, student_id, subject, old_value and new_value
+        changed_by: User making the changes
+        activity: log_activity arguments for one activity log covering the
+            whole batch; the count and grade IDs are added to its details
+    """
+    if not changes:
+        return
+    timestamp = datetime.now().isoformat()
+    events = [{**change, "changed_by": changed_by, "timestamp": timestamp} for change in changes]
+    db.execute(insert(GradeHistory), [{**event, "action": action} for event in events])
+    enqueue_many(db, f"grade.{action}", events)
+    if activity:
+        enqueue_activity(db, {**activity, "details": {
+            **(activity.get("details") or {}),
+            "count": len(changes),
+            "grade_ids": [change["grade_id"] for change in changes]
+        }})
+
+def detach(db: Session, rows: List[Any]) -> None:
+    """Expunge flushed rows so the commit doesn't expire them; returning them then needs no reload queries."""
+    for row in rows:
+        db.expunge(row)
+
+def _apply_grade_updates(
+    db: Session,
+    grades: List[Grade],
+    new_values: List[Any],
+    validator: GradeValidator,
+    changed_by: Optional[str],
+    activity: Optional[Dict[str, Any]] = None
+) -> List[Grade]:
+    errors = []
+    for grade, new_value in zip(grades, new_values):
+        is_valid, error_message = validator.validate_grade(new_value)
+        if not is_valid:
+            errors.append(f"Grade {grade.id}: {error_message}")
+    if errors:
+        raise GradeBatchError(errors)
+
+    changes = []
+    for grade, new_value in zip(grades, new_values):
+        new_value = int(new_value)
+        if grade.grade == new_value:
+            continue
+        changes.append({
+            "grade_id": grade.id, "student_id": grade.student_id, "subject": grade.subject,
+            "old_value": grade.grade, "new_value": new_value
+        })
+        grade.grade = new_value
+    if changes:
+        # The unit of work sends the changed rows as one executemany UPDATE
+        record_grade_changes(db, "update", changes, changed_by, activity)
+        bump_versions(db, {student_scope(change["student_id"]) for change in changes})
+        db.flush()
+        detach(db, grades)
+        db.commit()
+    return grades
+
+def bulk_update_grades(
+    db: Session,
+    updates: List[Tuple[int, int]],
+    validator: GradeValidator = default_validator,
+    changed_by: str = None,
+    activity: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Grade], List[int]]:
+    """
+    Set many grades in one transaction.
+
+    Every new value is validated first; if any fails, GradeBatchError is
+    raised and nothing is changed. Unchanged values get no history entry.
+
+    Args:
+        db: Database session
+        updates: (grade_id, new_value) pairs; a later pair for the same grade wins
+        validator: Grade validator
+        changed_by: User making the changes
+        activity: log_activity arguments for one activity log of the changed grades
+
+    Returns:
+        Tuple of (updated grades in request order, grade IDs that were not found)
+    """
+    new_values = dict(updates)
+    grades, missing = get_grades_by_ids(db, list(new_values))
+    return _apply_grade_updates(db, grades, [new_values[grade.id] for grade in grades], validator, changed_by, activity), missing
+
+def adjust_grades(
+    db: Session,
+    subject: str,
+    delta: int,
+    course_id: Optional[int] = None,
+    clamp: bool = False,
+    validator: GradeValidator = default_validator,
+    changed_by: str = None,
+    activity: Optional[Dict[str, Any]] = None
+) -> List[Grade]:
+    """
+    Add ``delta`` to every grade in ``subject``, optionally only for students enrolled in ``course_id``.
+
+    With ``clamp`` the results are limited to the validator's range;
+    otherwise a result outside it rejects the whole adjustment.
+    """
+    query = db.query(Grade).filter(Grade.subject == subject)
+    if course_id is not None:
+        if not get_course(db, course_id):
+            raise ValueError(f"Course with ID {course_id} does not exist")
+        enrolled = db.query(StudentCourse.student_id).filter(StudentCourse.course_id == course_id)
+        query = query.filter(Grade.student_id.in_(enrolled.scalar_subquery()))
+    grades = query.order_by(Grade.id).all()
+
+    new_values = [grade.grade + delta for grade in grades]
+    if clamp:
+        new_values = [min(max(value, validator.min_grade), validator.max_grade) for value in new_values]
+    return _apply_grade_updates(db, grades, new_values, validator, changed_by, activity)
+
+def bulk_delete_grades(
+    db: Session,
+    grade_ids: List[int],
+    changed_by: str = None,
+    activity: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Grade], List[int]]:
+    """
+    Delete many grades in one transaction, recording their history in bulk.
+
+    ``activity`` holds log_activity arguments for one activity log of the deletion.
+
+    Returns:
+        Tuple of (deleted grades in request order, grade IDs that were not found)
+    """
+    grades, missing = get_grades_by_ids(db, grade_ids)
+    if grades:
+        record_grade_changes(db, "delete", [
+            {"grade_id": grade.id, "student_id": grade.student_id, "subject": grade.subject,
+             "old_value": grade.grade, "new_value": None}
+            for grade in grades
+        ], changed_by, activity)
+        for chunk in chunked([grade.id for grade in grades]):
+            db.query(Grade).filter(Grade.id.in_(chunk)).delete(synchronize_session=False)
+        bump_versions(db, {student_scope(grade.student_id) for grade in grades})
+        detach(db, grades)
+        db.commit()
+    return grades, missing
+
+def get_many_by_ids(db: Session, model: Any, ids: List[int]) -> Tuple[List[Any], List[int]]:
+    """
+    Fetch rows of ``model`` by primary key with one IN query per chunk.
+
+    Args:
+        db: Database session
+        model: SQLAlchemy model with an ``id`` column
+        ids: Requested IDs; duplicates are ignored
+
+    Returns:
+        Tuple of (rows in the order requested, IDs that were not found)
+    """
+    unique_ids = list(dict.fromkeys(ids))
+    found = {}
+    for chunk in chunked(unique_ids):
+        for row in db.query(model).filter(model.id.in_(chunk)):
+            found[row.id] = row
+    items = [found[row_id] for row_id in unique_ids if row_id in found]
+    missing = [row_id for row_id in unique_ids if row_id not in found]
+    return items, missing
+
+def get_grades_by_ids(db: Session, grade_ids: List[int]) -> Tuple[List[Grade], List[int]]:
+    """Get several grades by ID, in request order, plus the IDs not found."""
+    return get_many_by_ids(db, Grade, grade_ids)
+
 def get_grades_by_student(db: Session, student_id: int) -> List[Grade]:
     """Get all grades for a student."""
     return db.query(Grade).filter(Grade.student_id == student_id).all()
@@ -107,60 +312,46 @@ def bulk_create_grades(
     db: Session, 
     grades_data: List[Dict[str, Any]],
     validator: GradeValidator = default_validator,
-    changed_by: str = None
+    changed_by: str = None,
+    validated: bool = False
 ) -> Tuple[List[Grade], List[str]]:
-    """Bulk create grades with history tracking."""
+    """
+    Bulk create grades with history tracking.
+
+    Valid rows are inserted with one flush and their history entries with
+    one executemany, all in a single transaction. Pass ``validated=True``
+    for rows the caller already ran through the validator.
+    """
     successful_grades = []
-    errors = []
-    history_entries = []
-    
+    failed = [] if validated else validator.validate_batch(grade_columns(grades_data))
+    errors = [f"Row {idx+1}: {error_message}" for idx, error_message in failed]
+    failed_indexes = {idx for idx, _ in failed}
+
+    for idx, grade_data in enumerate(grades_data):
+        if idx in failed_indexes:
+            continue
+        successful_grades.append(Grade(
+            student_id=int(grade_data["student_id"]),
+            subject=str(grade_data["subject"]),
+            grade=int(grade_data["grade"]),
+            assessment=grade_data.get("assessment") or None
+        ))
+
+    if not successful_grades:
+        return [], errors
+
     # Start a transaction to allow rollback if needed
     try:
-        for idx, grade_data in enumerate(grades_data):
-            try:
-                # Validate the grade data
-                is_valid, error_message = validator.validate_grade_data(grade_data)
-                if not is_valid:
-                    errors.append(f"Row {idx+1}: {error_message}")
-                    continue
-                    
-                # Create grade
-                new_grade = Grade(
-                    student_id=int(grade_data["student_id"]),
-                    subject=str(grade_data["subject"]),
-                    grade=int(grade_data["grade"])
-                )
-                db.add(new_grade)
-                db.flush()  # Flush to get the ID
-                
-                # Create history entry
-                history_entry = create_grade_history(
-                    db=db,
-                    grade_id=new_grade.id,
-                    student_id=new_grade.student_id,
-                    subject=new_grade.subject,
-                    old_value=None,
-                    new_value=new_grade.grade,
-                    action="create",
-                    changed_by=changed_by
-                )
-                history_entries.append(history_entry)
-                
-                successful_grades.append(new_grade)
-                
-            except Exception as e:
-                errors.append(f"Row {idx+1}: {str(e)}")
-        
-        # Add all history entries
-        for entry in history_entries:
-            db.add(entry)
-            
-        # Commit all successful grades and history entries
-        if successful_grades:
-            db.commit()
-            for grade in successful_grades:
-                db.refresh(grade)
-                
+        db.add_all(successful_grades)
+        db.flush()  # Flush to get the IDs
+        record_grade_changes(db, "create", [
+            {"grade_id": grade.id, "student_id": grade.student_id, "subject": grade.subject,
+             "old_value": None, "new_value": grade.grade}
+            for grade in successful_grades
+        ], changed_by)
+        bump_versions(db, {student_scope(grade.student_id) for grade in successful_grades})
+        detach(db, successful_grades)
+        db.commit()
         return successful_grades, errors
         
     except Exception as e:
@@ -169,6 +360,193 @@ def bulk_create_grades(
         errors.append(f"Database error: {str(e)}")
         return [], errors
 
+def validate_grade_chunk(
+    chunk: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    validator: GradeValidator = default_validator,
+    db: Optional[Session] = None,
+    course_id: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """
+    Validate a chunk of parsed rows with GradeValidator.validate_batch.
+
+    Returns:
+        Tuple of (valid row dicts, (row_number, error_message) for the rest, in file order)
+    """
+    parsed = [(row_number, row_data) for row_number, row_data, parse_error in chunk if not parse_error]
+    errors = [(row_number, parse_error) for row_number, _, parse_error in chunk if parse_error]
+    failed = validator.validate_batch(grade_columns([row_data for _, row_data in parsed]), db=db, course_id=course_id)
+    errors.extend((parsed[index][0], error_message) for index, error_message in failed)
+    failed_indexes = {index for index, _ in failed}
+    valid = [row_data for index, (_, row_data) in enumerate(parsed) if index not in failed_indexes]
+    return valid, sorted(errors)
+
+def import_grade_rows(
+    db: Session,
+    rows: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    mode: str = "insert",
+    validator: GradeValidator = default_validator,
+    changed_by: str = None,
+    chunk_size: int = 1000,
+    max_errors: int = 1000,
+    on_progress=None
+) -> Tuple[int, Dict[str, int], List[str]]:
+    """
+    Import grades from a stream of parsed rows, one transaction per chunk.
+
+    Args:
+        db: Database session
+        rows: (row_number, row_data, parse_error) tuples, e.g. from app.ingest.iter_rows
+        mode: "insert" (bulk_create_grades) or "upsert" (upsert_grades)
+        validator: Grade validator
+        changed_by: User performing the import
+        chunk_size: Number of rows validated and written per transaction
+        max_errors: Error messages kept; further errors are only counted
+        on_progress: Called with the number of rows processed after each chunk
+
+    Returns:
+        Tuple of (rows processed, {"created", "updated", "unchanged"} counts, error messages)
+    """
+    processed = 0
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    errors = []
+    hidden_errors = 0
+
+    def report(messages: List[str]) -> None:
+        nonlocal hidden_errors
+        room = max(max_errors - len(errors), 0)
+        errors.extend(messages[:room])
+        hidden_errors += len(messages) - min(room, len(messages))
+
+    for chunk in iter_chunks(iter(rows), chunk_size):
+        processed += len(chunk)
+        valid, row_errors = validate_grade_chunk(chunk, validator)
+        chunk_errors = [f"Row {row_number}: {error_message}" for row_number, error_message in row_errors]
+
+        if valid:
+            if mode == "upsert":
+                chunk_counts, write_errors = upsert_grades(db, valid, changed_by=changed_by, validated=True)
+                for key, value in chunk_counts.items():
+                    counts[key] += value
+            else:
+                created, write_errors = bulk_create_grades(db, valid, changed_by=changed_by, validated=True)
+                counts["created"] += len(created)
+            chunk_errors.extend(write_errors)
+        report(chunk_errors)
+        if on_progress:
+            on_progress(processed)
+
+    if hidden_errors:
+        errors.append(f"... and {hidden_errors} more errors")
+    return processed, counts, errors
+
+def validate_grade_rows(
+    db: Session,
+    rows: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    validator: GradeValidator = default_validator,
+    course_id: Optional[int] = None,
+    chunk_size: int = 1000
+) -> Iterator[Tuple[int, str]]:
+    """
+    Check an upload without writing anything, yielding errors as they are found.
+
+    Besides the validator's checks, every student must exist and, with
+    ``course_id``, be enrolled in that course. Each chunk is validated as a
+    batch, so students are looked up with one IN query per chunk.
+
+    Args:
+        db: Database session
+        rows: (row_number, row_data, parse_error) tuples, e.g. from app.ingest.iter_rows
+        validator: Grade validator
+        course_id: Course the students must be enrolled in, if any
+        chunk_size: Number of rows checked per batch of lookups
+
+    Yields:
+        (row_number, error_message) for each invalid row, in file order, one chunk at a time
+    """
+    for chunk in iter_chunks(iter(rows), chunk_size):
+        _, errors = validate_grade_chunk(chunk, validator, db=db, course_id=course_id)
+        yield from errors
+
+def upsert_grades(
+    db: Session,
+    grades_data: List[Dict[str, Any]],
+    validator: GradeValidator = default_validator,
+    changed_by: str = None,
+    validated: bool = False
+) -> Tuple[Dict[str, int], List[str]]:
+    """
+    Create or update grades keyed on (student_id, subject, assessment).
+
+    Rows whose key already has a grade update it, or are skipped if the
+    value is unchanged, so re-uploading a file changes nothing. A key
+    repeated within the file keeps its last row. Existing grades are found
+    with one IN query per chunk of students, and everything is written in
+    one transaction.
+
+    Args:
+        db: Database session
+        grades_data: Rows with student_id, subject, grade and an optional assessment
+        validator: Grade validator
+        changed_by: User performing the upload
+        validated: The rows were already validated; skip the validator
+
+    Returns:
+        Tuple of ({"created", "updated", "unchanged"} counts, row error messages)
+    """
+    failed = [] if validated else validator.validate_batch(grade_columns(grades_data))
+    errors = [f"Row {idx+1}: {error_message}" for idx, error_message in failed]
+    failed_indexes = {idx for idx, _ in failed}
+    rows = {}
+    for idx, grade_data in enumerate(grades_data):
+        if idx in failed_indexes:
+            continue
+        key = (int(grade_data["student_id"]), str(grade_data["subject"]), grade_data.get("assessment") or None)
+        rows[key] = int(grade_data["grade"])
+
+    existing = {}
+    for chunk in chunked(list({student_id for student_id, _, _ in rows})):
+        for grade in db.query(Grade).filter(Grade.student_id.in_(chunk)).order_by(Grade.id):
+            # Duplicates left by earlier plain inserts: the oldest grade stands for the key
+            existing.setdefault((grade.student_id, grade.subject, grade.assessment), grade)
+
+    counts = {"created": 0, "updated": 0, "unchanged": 0}
+    new_grades = []
+    updates = []
+    for (student_id, subject, assessment), value in rows.items():
+        grade = existing.get((student_id, subject, assessment))
+        if grade is None:
+            new_grades.append(Grade(student_id=student_id, subject=subject, grade=value, assessment=assessment))
+        elif grade.grade == value:
+            counts["unchanged"] += 1
+        else:
+            updates.append({
+                "grade_id": grade.id, "student_id": student_id, "subject": subject,
+                "old_value": grade.grade, "new_value": value
+            })
+            grade.grade = value
+
+    if not new_grades and not updates:
+        db.rollback()
+        return counts, errors
+    try:
+        db.add_all(new_grades)
+        db.flush()  # Flush to get the IDs
+        record_grade_changes(db, "create", [
+            {"grade_id": grade.id, "student_id": grade.student_id, "subject": grade.subject,
+             "old_value": None, "new_value": grade.grade}
+            for grade in new_grades
+        ], changed_by)
+        record_grade_changes(db, "update", updates, changed_by)
+        bump_versions(db, {student_scope(grade.student_id) for grade in new_grades} | {student_scope(change["student_id"]) for change in updates})
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        errors.append(f"Database error: {str(e)}")
+        return {"created": 0, "updated": 0, "unchanged": counts["unchanged"]}, errors
+    counts["created"] = len(new_grades)
+    counts["updated"] = len(updates)
+    return counts, errors
+
 # Functions to get grade history
 def get_grade_history(db: Session, grade_id: int) -> List[GradeHistory]:
     """Retrieve grade history for a specific grade."""
@@ -229,6 +607,7 @@ def create_course(
         teacher_id=teacher_id
     )
     db.add(new_course)
+    bump_versions(db, [COURSES_SCOPE])
     db.commit()
     db.refresh(new_course)
     return new_course
@@ -237,10 +616,38 @@ def get_course(db: Session, course_id: int) -> Optional[Course]:
     """Get a course by ID"""
     return db.query(Course).filter(Course.id == course_id).first()
 
+def get_courses_by_ids(db: Session, course_ids: List[int]) -> Tuple[List[Course], List[int]]:
+    """Get several courses by ID, in request order, plus the IDs not found"""
+    return get_many_by_ids(db, Course, course_ids)
+
 def get_courses(db: Session, skip: int = 0, limit: int = 100) -> List[Course]:
     """Get all courses with pagination"""
     return db.query(Course).offset(skip).limit(limit).all()
 
+def set_course_credits(
+    db: Session,
+    course_id: int,
+    credit_hours: float,
+    term: Optional[str] = None,
+    term_weight: float = 1.0
+) -> CourseCredit:
+    """Create or update the credit hours and term weighting of a course"""
+    course = get_course(db, course_id)
+    if not course:
+        raise ValueError(f"Course with ID {course_id} does not exist")
+
+    credits = db.query(CourseCredit).filter(CourseCredit.course_id == course_id).first()
+    if not credits:
+        credits = CourseCredit(course_id=course_id)
+        db.add(credits)
+    credits.credit_hours = credit_hours
+    credits.term = term
+    credits.term_weight = term_weight
+    bump_versions(db, [course_scope(course_id)])
+    db.commit()
+    db.refresh(credits)
+    return credits
+
 def add_student_to_course(
     db: Session, 
     student_id: int, 
@@ -270,10 +677,83 @@ def add_student_to_course(
         added_by=added_by
     )
     db.add(enrollment)
+    enqueue(db, "enrollment.added", {"student_id": student_id, "course_id": course_id, "changed_by": added_by})
+    bump_versions(db, [student_scope(student_id), course_scope(course_id)])
     db.commit()
     db.refresh(enrollment)
     return enrollment
 
+def bulk_add_students_to_course(
+    db: Session,
+    student_ids: List[int],
+    course_id: int,
+    added_by: str = None
+) -> Tuple[List[int], List[Dict[str, Any]]]:
+    """
+    Enroll many students in a course using set-based queries.
+
+    The course is checked once, existing enrollments are found with IN
+    queries and all new enrollments are inserted with a single executemany
+    in one transaction.
+
+    Args:
+        db: Database session
+        student_ids: IDs of the students to enroll
+        course_id: ID of the course
+        added_by: User performing the enrollment
+
+    Returns:
+        Tuple of (enrolled student IDs, failures as {"student_id", "reason"} dicts)
+    """
+    course = get_course(db, course_id)
+    if not course:
+        reason = f"Course with ID {course_id} does not exist"
+        return [], [{"student_id": student_id, "reason": reason} for student_id in student_ids]
+
+    # Find students that are already enrolled
+    already_enrolled = set()
+    for chunk in chunked(list(set(student_ids))):
+        already_enrolled.update(
+            student_id for (student_id,) in db.query(StudentCourse.student_id).filter(
+                StudentCourse.course_id == course_id,
+                StudentCourse.student_id.in_(chunk)
+            )
+        )
+
+    successful = []
+    failed = []
+    for student_id in student_ids:
+        # Duplicates within the request fail the same way a second single enrollment would
+        if student_id in already_enrolled:
+            failed.append({
+                "student_id": student_id,
+                "reason": f"Student {student_id} is already enrolled in course {course_id}"
+            })
+            continue
+        already_enrolled.add(student_id)
+        successful.append(student_id)
+
+    if successful:
+        joined_at = datetime.now().isoformat()
+        try:
+            db.execute(insert(StudentCourse), [
+                {"student_id": student_id, "course_id": course_id, "joined_at": joined_at, "added_by": added_by}
+                for student_id in successful
+            ])
+            enqueue_many(db, "enrollment.added", (
+                {"student_id": student_id, "course_id": course_id, "changed_by": added_by}
+                for student_id in successful
+            ))
+            bump_versions(db, [course_scope(course_id)] + [student_scope(student_id) for student_id in successful])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            reason = f"Database error: {str(e)}"
+            failed.extend({"student_id": student_id, "reason": reason} for student_id in successful)
+            successful = []
+
+    return successful, failed
+
 def remove_student_from_course(db: Session, student_id: int, course_id: int) -> bool:
     """Remove a student from a course"""
     enrollment = db.query(StudentCourse).filter(
@@ -285,6 +765,8 @@ def remove_student_from_course(db: Session, student_id: int, course_id: int) ->
         raise ValueError(f"Student {student_id} is not enrolled in course {course_id}")
     
     db.delete(enrollment)
+    enqueue(db, "enrollment.removed", {"student_id": student_id, "course_id": course_id, "changed_by": None})
+    bump_versions(db, [student_scope(student_id), course_scope(course_id)])
     db.commit()
     return True
 
@@ -327,21 +809,39 @@ def get_grades_by_student_and_course(db: Session, student_id: int, course_id: in
     
     # For now, we'll implement a basic filtering mechanism based on course name
     # This assumes subjects might contain course name or code
-    filtered_grades = []
-    course_keywords = course.name.lower().split()
-    
+    return filter_grades_for_course(course.name, grades, subject_of=lambda grade: grade.subject)
+
+def filter_grades_for_course(course_name: str, grades: List[Any], subject_of=lambda grade: grade[0]) -> List[Any]:
+    """
+    Select the grades whose subject looks related to a course.
+
+    A grade matches when any word of the course name appears in its subject.
+    If nothing matches, all grades are returned as a safety measure since the
+    course-subject relationship is only inferred from names.
+
+    Args:
+        course_name: Name of the course
+        grades: Grade rows or (subject, grade) tuples
+        subject_of: Callable extracting the subject from an item of ``grades``
+
+    Returns:
+        The matching grades (or all grades if none match)
+    """
+    course_keywords = course_name.lower().split()
+
     # Filter grades that might be related to the course based on subject name
+    filtered_grades = []
     for grade in grades:
         # Check if any course keyword appears in the subject
-        subject_lower = grade.subject.lower()
+        subject_lower = subject_of(grade).lower()
         if any(keyword in subject_lower for keyword in course_keywords):
             filtered_grades.append(grade)
-    
+
     # If no grades match the filtering, fall back to all grades
     # This is a safety measure since our filtering is basic
     if not filtered_grades and grades:
         return grades
-        
+
     return filtered_grades
 
 def calculate_student_averages(db: Session, student_id: int, course_id: Optional[int] = None) -> Dict[str, Any]:
@@ -365,6 +865,10 @@ def calculate_student_averages(db: Session, student_id: int, course_id: Optional
         # Get all grades for student if no course filtering
         grades = get_grades_by_student(db, student_id)
     
+    return build_student_averages(db, student_id, grades, course_id)
+
+def build_student_averages(db: Session, student_id: int, grades: List[Any], course_id: Optional[int] = None) -> Dict[str, Any]:
+    """Averages response for a student from grades with ``subject`` and ``grade`` attributes."""
     if not grades:
         return {
             "student_id": student_id,
@@ -422,7 +926,12 @@ def calculate_course_averages(db: Session, course_id: int) -> Dict[str, Any]:
     # Get all students in the course
     student_ids = get_students_in_course(db, course_id)
     
-    if not student_ids:
+    # Calculate averages for each student
+    return build_course_averages(course_id, [calculate_student_averages(db, student_id) for student_id in student_ids])
+
+def build_course_averages(course_id: int, student_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Course statistics from the per-student results of build_student_averages."""
+    if not student_results:
         return {
             "course_id": course_id,
             "student_averages": [],
@@ -431,15 +940,13 @@ def calculate_course_averages(db: Session, course_id: int) -> Dict[str, Any]:
             "total_students": 0
         }
     
-    # Calculate averages for each student
     student_averages = []
     all_grades = []
     subject_grades = {}
     
-    for student_id in student_ids:
-        student_data = calculate_student_averages(db, student_id)
+    for student_data in student_results:
         student_averages.append({
-            "student_id": student_id,
+            "student_id": student_data["student_id"],
             "average": student_data["overall_average"]
         })
         
@@ -471,13 +978,97 @@ def calculate_course_averages(db: Session, course_id: int) -> Dict[str, Any]:
 def create_student(db: Session, name: str, email: str, date_of_birth: str):
     student = Student(name=name, email=email, date_of_birth=date_of_birth)
     db.add(student)
+    bump_versions(db, [])
     db.commit()
     db.refresh(student)
     return student
 
+def bulk_import_students(
+    db: Session,
+    rows: Iterable[Tuple[int, Optional[Dict[str, Any]], Optional[str]]],
+    chunk_size: int = 1000,
+    validator: StudentValidator = StudentValidator()
+) -> Tuple[int, int, List[str]]:
+    """
+    Import students from a stream of parsed rows.
+
+    Rows are validated and inserted chunk by chunk: emails in each chunk are
+    checked against the unique email index with one IN query, duplicates
+    within the file are caught in memory, and valid rows are inserted with a
+    single executemany and committed per chunk.
+
+    Args:
+        db: Database session
+        rows: (row_number, row_data, parse_error) tuples, e.g. from app.ingest.iter_rows
+        chunk_size: Number of rows validated and inserted per transaction
+        validator: Validator for individual student rows
+
+    Returns:
+        Tuple of (rows processed, students created, error messages)
+    """
+    processed = 0
+    created = 0
+    errors = []
+    seen_emails = set()
+
+    for chunk in iter_chunks(iter(rows), chunk_size):
+        processed += len(chunk)
+        candidates = []
+        for row_number, row_data, parse_error in chunk:
+            if parse_error:
+                errors.append(f"Row {row_number}: {parse_error}")
+                continue
+            is_valid, error_message = validator.validate_student_data(row_data)
+            if not is_valid:
+                errors.append(f"Row {row_number}: {error_message}")
+                continue
+            email = str(row_data["email"]).strip()
+            if email in seen_emails:
+                errors.append(f"Row {row_number}: Duplicate email in file: {email}")
+                continue
+            seen_emails.add(email)
+            candidates.append((row_number, {
+                "name": str(row_data["name"]).strip(),
+                "email": email,
+                "date_of_birth": str(row_data.get("date_of_birth") or "").strip() or None,
+            }))
+
+        if not candidates:
+            continue
+
+        # Check the whole chunk against existing students at once
+        existing = set()
+        for emails in chunked([student["email"] for _, student in candidates]):
+            existing.update(email for (email,) in db.query(Student.email).filter(Student.email.in_(emails)))
+
+        created_at = datetime.now().isoformat()
+        new_students = []
+        for row_number, student in candidates:
+            if student["email"] in existing:
+                errors.append(f"Row {row_number}: Email already registered: {student['email']}")
+                continue
+            student["created_at"] = created_at
+            new_students.append(student)
+
+        if new_students:
+            try:
+                db.execute(insert(Student), new_students)
+                bump_versions(db, [])
+                db.commit()
+                created += len(new_students)
+            except Exception as e:
+                db.rollback()
+                first_row = candidates[0][0]
+                errors.append(f"Rows {first_row}-{candidates[-1][0]}: Database error: {str(e)}")
+
+    return processed, created, errors
+
 def get_student(db: Session, student_id: int):
     return db.query(Student).filter(Student.id == student_id).first()
 
+def get_students_by_ids(db: Session, student_ids: List[int]):
+    return get_many_by_ids(db, Student, student_ids)
+
 def get_students(db: Session, skip: int = 0, limit: int = 10):
     return db.query(Student).offset(skip).limit(limit).all()
 
@@ -490,6 +1081,7 @@ def update_student(db: Session, student_id: int, name: str = None, email: str =
             student.email = email
         if date_of_birth:
             student.date_of_birth = date_of_birth
+        bump_versions(db, [student_scope(student_id)])
         db.commit()
         db.refresh(student)
     return student
@@ -498,6 +1090,7 @@ def delete_student(db: Session, student_id: int):
     student = db.query(Student).filter(Student.id == student_id).first()
     if student:
         db.delete(student)
+        bump_versions(db, [student_scope(student_id)])
         db.commit()
     return student
 
@@ -509,9 +1102,15 @@ def create_grade_history(
     old_value: Optional[int],
     new_value: Optional[int],
     action: str,
-    changed_by: Optional[str]
+    changed_by: Optional[str],
+    activity: Optional[Dict[str, Any]] = None
 ):
-    """Create a new grade history entry."""
+    """
+    Add a grade history entry and its change event to the caller's transaction.
+
+    Nothing is committed here; the caller commits the grade change, its
+    history and the outbox event in one transaction.
+    """
     history_entry = GradeHistory(
         grade_id=grade_id,
         student_id=student_id,
@@ -523,6 +1122,13 @@ def create_grade_history(
         changed_by=changed_by
     )
     db.add(history_entry)
-    db.commit()
-    db.refresh(history_entry)
-    return history_entry
\ No newline at end of file
+    enqueue(db, f"grade.{action}", {
+        "grade_id": grade_id,
+        "student_id": student_id,
+        "subject": subject,
+        "old_value": old_value,
+        "new_value": new_value,
+        "changed_by": changed_by,
+        "timestamp": history_entry.timestamp,
+    }, activity=activity)
+    return history_entry
@@ -1,5 +1,7 @@
+import hashlib
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String
+from typing import Any, List
+from sqlalchemy import create_engine, Column, Index, Integer, String, Float, delete, insert, inspect, select, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -11,6 +13,14 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Maximum number of bound parameters used in a single IN (...) clause
+IN_CLAUSE_CHUNK_SIZE = 500
+
+def chunked(items: List[Any], size: int = IN_CLAUSE_CHUNK_SIZE):
+    """Yield successive slices of at most ``size`` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 # SQLAlchemy User model (this will be used for DB persistence)
 class User(Base):
     __tablename__ = "users"
@@ -33,6 +43,9 @@ class Grade(Base):
     student_id = Column(Integer, nullable=False)  # Foreign key to User.id
     subject = Column(String, nullable=False)
     grade = Column(Integer, nullable=False)
+    assessment = Column(String, nullable=True)  # e.g. "Midterm"; with student and subject identifies a grade on upsert
+
+    __table_args__ = (Index("ix_grades_student_subject", "student_id", "subject"),)
 
 class GradeHistory(Base):
     __tablename__ = "grade_history"
@@ -43,8 +56,11 @@ class GradeHistory(Base):
     old_value = Column(Integer, nullable=True)  # Null for new grades
     new_value = Column(Integer, nullable=True)  # Null for deleted grades
     action = Column(String, nullable=False)  # "create", "update", "delete"
-    timestamp = Column(String, nullable=False)  # ISO format timestamp
+    timestamp = Column(String, nullable=False, index=True)  # ISO format timestamp
     changed_by = Column(String, nullable=True)  # User who made the change
+
+    # Point-in-time replay reads one student's changes in timestamp order
+    __table_args__ = (Index("ix_grade_history_student_timestamp", "student_id", "timestamp"),)
     
     @classmethod
     def create_log(cls, grade, old_value, new_value, action, changed_by=None):
@@ -68,6 +84,14 @@ class Course(Base):
     teacher_id = Column(Integer, nullable=True)  # Optional teacher assignment
     created_at = Column(String, default=datetime.now().isoformat())
 
+class CourseCredit(Base):
+    __tablename__ = "course_credits"
+    id = Column(Integer, primary_key=True, index=True)
+    course_id = Column(Integer, unique=True, index=True, nullable=False)
+    credit_hours = Column(Float, nullable=False, default=1.0)
+    term = Column(String, nullable=True)  # e.g. "2025-fall"
+    term_weight = Column(Float, nullable=False, default=1.0)  # Multiplier applied on top of credit hours
+
 class StudentCourse(Base):
     __tablename__ = "student_courses"
     id = Column(Integer, primary_key=True, index=True)
@@ -91,5 +115,131 @@ class ActivityLog(Base):
     user_agent = Column(String, nullable=True)
     status_code = Column(Integer, nullable=True)  # HTTP status code for API requests
 
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    scope = Column(String, primary_key=True)  # "global", "courses", "student:<id>" or "course:<id>"
+    version = Column(Integer, nullable=False, default=0)
+
+class GradeSnapshot(Base):
+    __tablename__ = "grade_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    taken_at = Column(String, nullable=False, index=True)  # Covers grade_history rows with timestamp <= taken_at
+    last_history_id = Column(Integer, nullable=False)  # Highest grade_history.id folded into the snapshot
+    created_at = Column(String, nullable=False)
+
+class GradeSnapshotRow(Base):
+    __tablename__ = "grade_snapshot_rows"
+    snapshot_id = Column(Integer, primary_key=True)
+    grade_id = Column(Integer, primary_key=True)
+    student_id = Column(Integer, nullable=False)
+    subject = Column(String, nullable=False)
+    grade = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_grade_snapshot_rows_snapshot_student", "snapshot_id", "student_id"),)
+
+class UploadReceipt(Base):
+    __tablename__ = "upload_receipts"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, nullable=False)
+    idempotency_key = Column(String, nullable=True)  # Idempotency-Key header, if the client sent one
+    content_hash = Column(String, nullable=False)  # SHA-256 of the uploaded file
+    parameters = Column(String, nullable=False)  # Upload options that change the outcome, e.g. "mode=upsert;min=0;max=100"
+    status = Column(String, nullable=False)  # "processing" or "done"
+    response = Column(String, nullable=True)  # JSON response body, once done
+    versions = Column(String, nullable=True)  # JSON data versions of the affected students right after the upload
+    created_at = Column(String, nullable=False, index=True)
+
+    __table_args__ = (
+        Index("ix_upload_receipts_user_key", "user_id", "idempotency_key", unique=True),
+        Index("ix_upload_receipts_user_hash", "user_id", "content_hash"),
+    )
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True)
+    event_type = Column(String, nullable=False)  # "grade.create", "enrollment.added", ...
+    payload = Column(String, nullable=False)  # JSON: {"data": {...}, "activity": {...} or null}
+    created_at = Column(String, nullable=False)
+
+class SchemaState(Base):
+    __tablename__ = "schema_state"
+    fingerprint = Column(String, primary_key=True)  # Hash of the table/column/index definitions
+    applied_at = Column(String, nullable=False)
+
+
+def schema_fingerprint() -> str:
+    """Stable hash of the tables, columns and indexes declared on Base.metadata."""
+    parts = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type}:{column.nullable}" for column in table.columns)
+        parts.extend(sorted(f"index:{index.name}" for index in table.indexes))
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def _add_missing_columns(conn) -> List[str]:
+    """ALTER TABLE ... ADD COLUMN for declared columns missing from existing tables."""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(
+                    f"Cannot add NOT NULL column {table.name}.{column.name} without a server default"
+                )
+            column_type = column.type.compile(dialect=conn.dialect)
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            conn.execute(text(ddl))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def ensure_schema(bind=None) -> bool:
+    """
+    Bring the database up to the declared schema, once per schema version.
+
+    The fingerprint of the applied schema is stored in schema_state, so once
+    a deployment has migrated the database every other worker's startup check
+    is a single primary-key lookup. Otherwise missing tables and indexes are
+    created and missing nullable columns are added to existing tables.
+
+    Returns:
+        True if the schema had to be checked and applied, False if it was current
+    """
+    bind = bind or engine
+    fingerprint = schema_fingerprint()
+    with bind.connect() as conn:
+        if inspect(conn).has_table(SchemaState.__tablename__):
+            applied = conn.execute(
+                select(SchemaState.fingerprint).where(SchemaState.fingerprint == fingerprint)
+            ).first()
+            if applied:
+                return False
+
+    with bind.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+        _add_missing_columns(conn)
+        # create_all skips indexes on tables that already existed
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        conn.execute(delete(SchemaState))
+        conn.execute(insert(SchemaState).values(fingerprint=fingerprint, applied_at=datetime.now().isoformat()))
+    return True
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    ensure_schema()
+
+
+if __name__ == "__main__":
+    # Run as a deployment step: python -m app.database
+    print("Schema updated" if ensure_schema() else "Schema already current")
\ No newline at end of file
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Optional, Set, Tuple
+from app.metrics import registry as metrics
+
+# Events kept for Last-Event-ID resume; older positions get a "reset" event instead
+RING_SIZE = int(os.getenv("EVENT_RING_SIZE", "10000"))
+# Events buffered per subscriber before it is considered too slow and disconnected
+SUBSCRIBER_QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+
+
+class ChangeEvent:
+    __slots__ = ("seq", "id", "type", "topics", "data")
+
+    def __init__(self, seq: int, event_id: str, event_type: str, topics: Tuple[str, ...], data: Dict[str, Any]):
+        self.seq = seq
+        self.id = event_id
+        self.type = event_type
+        self.topics = topics
+        self.data = data
+
+    def encode(self) -> str:
+        """Server-sent events wire format."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    __slots__ = ("topics", "queue", "overflowed")
+
+    def __init__(self, topics: Tuple[str, ...]):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+
+class ChangeBroker:
+    """
+    In-process publish/subscribe for change events, delivered over SSE.
+
+    Publishers may run on any thread (the outbox relay publishes from its own);
+    each event is handed to the event loop once and fanned out there to the
+    subscribers of its topics, so idle subscribers cost one queue each and
+    no thread. Event IDs are "<broker epoch>-<sequence>": a client resuming
+    with an ID from another worker or process, or one older than the ring
+    buffer, is told to reset and refetch.
+    """
+
+    def __init__(self, ring_size: int = RING_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._ring: Deque[ChangeEvent] = deque(maxlen=ring_size)
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def has_subscribers(self, prefix: str = "") -> bool:
+        """Whether anyone is listening on a topic starting with ``prefix``."""
+        return any(topic.startswith(prefix) for topic in list(self._subscribers))
+
+    def subscriber_count(self) -> int:
+        return len({subscription for subscriptions in list(self._subscribers.values()) for subscription in subscriptions})
+
+    def publish(self, event_type: str, topics: Iterable[str], data: Dict[str, Any]) -> ChangeEvent:
+        """Record an event and deliver it to current subscribers of any of ``topics``."""
+        with self._lock:
+            self._seq += 1
+            event = ChangeEvent(self._seq, f"{self.epoch}-{self._seq}", event_type, tuple(topics), data)
+            self._ring.append(event)
+        metrics.inc("change_events_published_total", (("type", event_type),))
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, event)
+        return event
+
+    def _fan_out(self, event: ChangeEvent) -> None:
+        delivered: Set[Subscription] = set()
+        for topic in event.topics:
+            for subscription in self._subscribers.get(topic, ()):
+                if subscription in delivered or subscription.overflowed:
+                    continue
+                delivered.add(subscription)
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    subscription.overflowed = True
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        """Register a subscriber; must be called from the event loop that serves it."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(tuple(topics))
+        for topic in subscription.topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def replay(self, topics: Iterable[str], last_event_id: str) -> Optional[List[ChangeEvent]]:
+        """
+        Events on ``topics`` published after ``last_event_id``.
+
+        Returns None if the ID cannot be resumed from this broker (another
+        epoch, malformed, or already evicted from the ring buffer).
+        """
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        topics = set(topics)
+        with self._lock:
+            events = list(self._ring)
+        if seq > self._seq or (events and events[0].seq > seq + 1):
+            return None
+        return [event for event in events if event.seq > seq and topics.intersection(event.topics)]
+
+
+broker = ChangeBroker()
+
+metrics.describe("change_events_published_total", "counter", "Change events published to the in-process broker")
+metrics.register_gauge("change_event_subscribers", broker.subscriber_count, "Open server-sent event subscriptions")
+
+
+def _reset_event() -> str:
+    # Clients drop their Last-Event-ID and refetch current state on "reset"
+    return "event: reset\ndata: {}\n\n"
+
+
+async def stream_events(
+    topics: List[str],
+    last_event_id: Optional[str] = None,
+    change_broker: ChangeBroker = broker,
+    heartbeat: float = HEARTBEAT_SECONDS
+) -> AsyncIterator[str]:
+    """
+    Server-sent event stream of changes on ``topics``.
+
+    The subscription is registered before the ring buffer is replayed, so no
+    event published in between is lost; events already replayed are skipped
+    when they also arrive live.
+    """
+    subscription = change_broker.subscribe(topics)
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        last_seq = 0
+        if last_event_id:
+            missed = change_broker.replay(topics, last_event_id)
+            if missed is None:
+                yield _reset_event()
+            else:
+                for event in missed:
+                    last_seq = event.seq
+                    yield event.encode()
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event.seq > last_seq:
+                last_seq = event.seq
+                yield event.encode()
+            if subscription.overflowed and subscription.queue.empty():
+                # Too slow to keep up: let the client reconnect and resume or reset
+                yield _reset_event()
+                return
+    finally:
+        change_broker.unsubscribe(subscription)
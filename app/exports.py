@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+import uuid
+from datetime import datetime
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session, sessionmaker
+from app.database import Grade, Student, StudentCourse
+from app.metrics import registry as metrics
+
+EXPORT_DIR = "exports"
+
+# Number of aggregated rows fetched from the database at a time
+FETCH_SIZE = 1000
+
+metrics.describe("export_jobs_queued", "gauge", "Report-card export jobs waiting or running in this worker")
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(EXPORT_DIR, f"{job_id}.json")
+
+
+def _save_job(job: Dict[str, Any]) -> None:
+    """Persist job metadata next to the export so any worker can serve it."""
+    temp_path = _job_path(job["id"]) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(temp_path, _job_path(job["id"]))
+
+
+def create_export_job(export_format: str, course_id: Optional[int] = None, requested_by: Optional[str] = None) -> Dict[str, Any]:
+    """Register a new pending report-card export job."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    if not os.path.exists(EXPORT_DIR):
+        os.makedirs(EXPORT_DIR)
+
+    job_id = uuid.uuid4().hex
+    _, extension = EXPORT_FORMATS[export_format]
+    scope = f"course_{course_id}" if course_id else "school"
+    job = {
+        "id": job_id,
+        "status": "pending",
+        "format": export_format,
+        "course_id": course_id,
+        "requested_by": requested_by,
+        "created_at": datetime.now().isoformat(),
+        "completed_at": None,
+        "students": 0,
+        "filename": f"report_cards_{scope}_{datetime.now().strftime('%Y%m%d')}.{extension}",
+        "file": os.path.join(EXPORT_DIR, f"{job_id}.{extension}"),
+        "error": None,
+    }
+    _save_job(job)
+    metrics.gauge_add("export_jobs_queued", 1)
+    return job
+
+
+def get_export_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Load job metadata, or None if the job does not exist."""
+    # Job IDs are hex UUIDs; reject anything else so IDs cannot escape EXPORT_DIR
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def get_report_card_subjects(db: Session, course_id: Optional[int] = None) -> List[str]:
+    """Get the sorted list of subjects graded within the export scope."""
+    query = db.query(Grade.subject).distinct()
+    if course_id:
+        cohort = db.query(StudentCourse.student_id).filter(StudentCourse.course_id == course_id)
+        query = query.filter(Grade.student_id.in_(cohort))
+    return sorted(subject for (subject,) in query.all())
+
+
+def iter_report_cards(db: Session, course_id: Optional[int] = None) -> Iterator[Tuple[int, Optional[str], Dict[str, float], float, int]]:
+    """
+    Stream per-student report cards from a single aggregated query.
+
+    The database groups grades by (student, subject) and rows are fetched in
+    batches of FETCH_SIZE, so memory use does not depend on the number of
+    students. Course scope includes all grades of the students enrolled in the
+    course, matching calculate_course_averages.
+
+    Yields:
+        Tuples of (student_id, student_name, subject_averages, overall_average, total_grades)
+    """
+    query = db.query(
+        Grade.student_id,
+        Student.name,
+        Grade.subject,
+        func.sum(Grade.grade),
+        func.count(Grade.id)
+    ).outerjoin(Student, Student.id == Grade.student_id)
+
+    if course_id:
+        cohort = db.query(StudentCourse.student_id).filter(StudentCourse.course_id == course_id)
+        query = query.filter(Grade.student_id.in_(cohort))
+
+    rows = query.group_by(
+        Grade.student_id, Student.name, Grade.subject
+    ).order_by(Grade.student_id, Grade.subject).yield_per(FETCH_SIZE)
+
+    for student_id, student_rows in groupby(rows, key=lambda row: row[0]):
+        subject_averages = {}
+        grade_sum = 0
+        grade_count = 0
+        name = None
+        for _, name, subject, subject_sum, subject_count in student_rows:
+            subject_averages[subject] = subject_sum / subject_count
+            grade_sum += subject_sum
+            grade_count += subject_count
+        yield student_id, name, subject_averages, grade_sum / grade_count, grade_count
+
+
+def _report_card_rows(db: Session, subjects: List[str], course_id: Optional[int]) -> Iterator[List[Any]]:
+    """Flatten report cards into spreadsheet rows in header order."""
+    for student_id, name, subject_averages, overall, total in iter_report_cards(db, course_id):
+        row = [student_id, name or ""]
+        for subject in subjects:
+            average = subject_averages.get(subject)
+            row.append(round(average, 2) if average is not None else "")
+        row.extend([round(overall, 2), total])
+        yield row
+
+
+def write_report_cards(db: Session, path: str, export_format: str, course_id: Optional[int] = None) -> int:
+    """
+    Write the report-card gradebook to a file.
+
+    CSV rows are written as they are produced; XLSX uses an openpyxl
+    write-only workbook so rows are flushed to disk instead of kept in memory.
+
+    Returns:
+        Number of students written
+    """
+    subjects = get_report_card_subjects(db, course_id)
+    header = ["student_id", "student_name"] + subjects + ["overall_average", "total_grades"]
+    students = 0
+
+    if export_format == "xlsx":
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Report Cards")
+        sheet.append(header)
+        for row in _report_card_rows(db, subjects, course_id):
+            sheet.append(row)
+            students += 1
+        workbook.save(path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for row in _report_card_rows(db, subjects, course_id):
+                writer.writerow(row)
+                students += 1
+
+    return students
+
+
+def run_export_job(job_id: str, session_factory: sessionmaker) -> None:
+    """Background task: generate the export file for a pending job."""
+    job = get_export_job(job_id)
+    if job is None:
+        metrics.gauge_add("export_jobs_queued", -1)
+        return
+
+    job["status"] = "running"
+    _save_job(job)
+
+    db = session_factory()
+    temp_path = job["file"] + ".part"
+    try:
+        job["students"] = write_report_cards(db, temp_path, job["format"], job["course_id"])
+        os.replace(temp_path, job["file"])
+        job["status"] = "complete"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    finally:
+        db.close()
+        job["completed_at"] = datetime.now().isoformat()
+        _save_job(job)
+        metrics.gauge_add("export_jobs_queued", -1)
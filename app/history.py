@@ -0,0 +1,242 @@
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Set
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+from app.crud import build_course_averages, build_student_averages, filter_grades_for_course, get_course
+from app.database import GradeHistory, GradeSnapshot, GradeSnapshotRow, SessionLocal, StudentCourse, chunked
+from app.metrics import registry as metrics
+
+# A snapshot is due once this many grade changes have accumulated since the last one
+SNAPSHOT_INTERVAL_CHANGES = int(os.getenv("GRADE_SNAPSHOT_INTERVAL_CHANGES", "10000"))
+# Snapshots only cover history older than this, so a change committed late (its timestamp is
+# taken before the commit) still lands after the snapshot it belongs to
+SNAPSHOT_SETTLE_SECONDS = int(os.getenv("GRADE_SNAPSHOT_SETTLE_SECONDS", "300"))
+# Snapshot retention. Each snapshot is a full copy of the gradebook, so only a bounded number
+# are kept: the newest SNAPSHOT_KEEP, then about SNAPSHOT_KEEP more for every doubling of age
+# (see snapshots_to_keep). Moments before a dropped snapshot replay from an older one, or from
+# the start of the history: slower, never wrong.
+SNAPSHOT_KEEP = int(os.getenv("GRADE_SNAPSHOT_KEEP", "4"))
+
+# A grade as it stood at some point in time; ``id`` is the grade ID
+GradeState = namedtuple("GradeState", ["id", "student_id", "subject", "grade"])
+
+# Only the columns replay needs; rows are read as tuples rather than ORM objects
+CHANGE_COLUMNS = (
+    GradeHistory.id, GradeHistory.grade_id, GradeHistory.student_id,
+    GradeHistory.subject, GradeHistory.new_value, GradeHistory.action
+)
+
+metrics.describe("grade_snapshots_total", "counter", "Grade history snapshots taken")
+
+
+def history_timestamp(moment: datetime) -> str:
+    """A datetime as comparable with grade_history.timestamp (naive local ISO format)."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def _state_after(change) -> Optional[GradeState]:
+    if change.action == "delete" or change.new_value is None:
+        return None
+    return GradeState(change.grade_id, change.student_id, change.subject, change.new_value)
+
+
+def _apply(state: Dict[int, GradeState], change) -> None:
+    grade = _state_after(change)
+    if grade is None:
+        state.pop(change.grade_id, None)
+    else:
+        state[change.grade_id] = grade
+
+
+def latest_snapshot(db: Session, as_of: str) -> Optional[GradeSnapshot]:
+    """The most recent snapshot covering no history after ``as_of``."""
+    return db.query(GradeSnapshot).filter(
+        GradeSnapshot.taken_at <= as_of
+    ).order_by(GradeSnapshot.taken_at.desc()).first()
+
+
+def grades_as_of(db: Session, student_ids: Iterable[int], as_of: str) -> Dict[int, List[GradeState]]:
+    """
+    Reconstruct the grades of ``student_ids`` as they stood at ``as_of``.
+
+    Starts from the latest snapshot taken at or before ``as_of`` and replays
+    only the history recorded between the snapshot and ``as_of``, using the
+    (student_id, timestamp) index.
+
+    Args:
+        db: Database session
+        student_ids: Students to reconstruct
+        as_of: ISO timestamp (see history_timestamp)
+
+    Returns:
+        Grades per student ID, ordered by grade ID; students without grades are omitted
+    """
+    snapshot = latest_snapshot(db, as_of)
+    state: Dict[int, GradeState] = {}
+    for chunk in chunked(list(dict.fromkeys(student_ids))):
+        if snapshot is not None:
+            rows = db.query(
+                GradeSnapshotRow.grade_id, GradeSnapshotRow.student_id, GradeSnapshotRow.subject, GradeSnapshotRow.grade
+            ).filter(GradeSnapshotRow.snapshot_id == snapshot.id, GradeSnapshotRow.student_id.in_(chunk))
+            for row in rows:
+                state[row.grade_id] = GradeState(*row)
+
+        changes = db.query(*CHANGE_COLUMNS).filter(GradeHistory.student_id.in_(chunk), GradeHistory.timestamp <= as_of)
+        if snapshot is not None:
+            changes = changes.filter(GradeHistory.timestamp > snapshot.taken_at)
+        for change in changes.order_by(GradeHistory.timestamp, GradeHistory.id):
+            _apply(state, change)
+
+    result: Dict[int, List[GradeState]] = {}
+    for grade_id in sorted(state):
+        grade = state[grade_id]
+        result.setdefault(grade.student_id, []).append(grade)
+    return result
+
+
+def students_in_course_as_of(db: Session, course_id: int, as_of: str) -> List[int]:
+    """
+    Students enrolled in a course at ``as_of``.
+
+    Enrollments have no history of their own: a student who has since been
+    removed from the course is not included.
+    """
+    rows = db.query(StudentCourse.student_id).filter(
+        StudentCourse.course_id == course_id, StudentCourse.joined_at <= as_of
+    )
+    return [student_id for (student_id,) in rows]
+
+
+def student_averages_as_of(db: Session, student_id: int, as_of: str, course_id: Optional[int] = None) -> Dict[str, Any]:
+    """calculate_student_averages() as of a past moment."""
+    grades = grades_as_of(db, [student_id], as_of).get(student_id, [])
+    if course_id:
+        course = get_course(db, course_id)
+        if not course or student_id not in students_in_course_as_of(db, course_id, as_of):
+            grades = []
+        else:
+            grades = filter_grades_for_course(course.name, grades, subject_of=attrgetter("subject"))
+    return build_student_averages(db, student_id, grades, course_id)
+
+
+def course_averages_as_of(db: Session, course_id: int, as_of: str) -> Dict[str, Any]:
+    """calculate_course_averages() as of a past moment, reconstructing all students in one pass."""
+    student_ids = students_in_course_as_of(db, course_id, as_of)
+    grades = grades_as_of(db, student_ids, as_of)
+    return build_course_averages(course_id, [
+        build_student_averages(db, student_id, grades.get(student_id, [])) for student_id in student_ids
+    ])
+
+
+def snapshots_to_keep(snapshot_ids: Iterable[int], keep: int = SNAPSHOT_KEEP) -> Set[int]:
+    """
+    The snapshots retained out of ``snapshot_ids`` (snapshot IDs increase with each one taken).
+
+    The newest ``keep`` are retained; beyond that, a snapshot ``age`` IDs
+    behind the newest is retained only if its ID is a multiple of the
+    largest power of two not above ``age / keep``. About ``keep`` snapshots
+    survive per doubling of age, so storage grows with the logarithm of the
+    snapshot count, and a snapshot once dropped would never be kept again.
+    """
+    snapshot_ids = list(snapshot_ids)
+    if not snapshot_ids:
+        return set()
+    newest = max(snapshot_ids)
+    kept = set()
+    for snapshot_id in snapshot_ids:
+        step = 1
+        while step * 2 * keep <= newest - snapshot_id:
+            step *= 2
+        if snapshot_id % step == 0:
+            kept.add(snapshot_id)
+    return kept
+
+
+def take_grade_snapshot(db: Session, taken_at: Optional[str] = None) -> GradeSnapshot:
+    """
+    Store the state of every grade at ``taken_at``.
+
+    Built incrementally: the previous snapshot's rows are copied inside the
+    database and only the grades changed since it are rewritten, so memory
+    grows with the number of changes rather than the number of grades.
+    Snapshots outside snapshots_to_keep are deleted in the same transaction.
+    Defaults to SNAPSHOT_SETTLE_SECONDS ago rather than now.
+    """
+    taken_at = taken_at or history_timestamp(datetime.now() - timedelta(seconds=SNAPSHOT_SETTLE_SECONDS))
+    previous = latest_snapshot(db, taken_at)
+    snapshot = GradeSnapshot(
+        taken_at=taken_at,
+        last_history_id=previous.last_history_id if previous is not None else 0,
+        created_at=datetime.now().isoformat()
+    )
+    db.add(snapshot)
+    db.flush()
+
+    changes = db.query(*CHANGE_COLUMNS).filter(GradeHistory.timestamp <= taken_at)
+    if previous is not None:
+        columns = [GradeSnapshotRow.grade_id, GradeSnapshotRow.student_id, GradeSnapshotRow.subject, GradeSnapshotRow.grade]
+        db.execute(insert(GradeSnapshotRow).from_select(
+            [GradeSnapshotRow.snapshot_id] + columns,
+            select(literal(snapshot.id), *columns).where(GradeSnapshotRow.snapshot_id == previous.id)
+        ))
+        changes = changes.filter(GradeHistory.timestamp > previous.taken_at)
+    # Each changed grade's state after its last change; None once deleted
+    changed: Dict[int, Optional[GradeState]] = {}
+    for change in changes.order_by(GradeHistory.timestamp, GradeHistory.id).yield_per(1000):
+        changed[change.grade_id] = _state_after(change)
+        snapshot.last_history_id = max(snapshot.last_history_id, change.id)
+
+    for chunk in chunked(list(changed)):
+        db.query(GradeSnapshotRow).filter(
+            GradeSnapshotRow.snapshot_id == snapshot.id, GradeSnapshotRow.grade_id.in_(chunk)
+        ).delete(synchronize_session=False)
+    current = [grade for grade in changed.values() if grade is not None]
+    if current:
+        db.execute(insert(GradeSnapshotRow), [
+            {"snapshot_id": snapshot.id, "grade_id": grade.id, "student_id": grade.student_id,
+             "subject": grade.subject, "grade": grade.grade}
+            for grade in current
+        ])
+
+    snapshot_ids = [snapshot_id for (snapshot_id,) in db.query(GradeSnapshot.id)]
+    expired = sorted(set(snapshot_ids) - snapshots_to_keep(snapshot_ids))
+    for chunk in chunked(expired):
+        db.query(GradeSnapshotRow).filter(GradeSnapshotRow.snapshot_id.in_(chunk)).delete(synchronize_session=False)
+        db.query(GradeSnapshot).filter(GradeSnapshot.id.in_(chunk)).delete(synchronize_session=False)
+    db.commit()
+    metrics.inc("grade_snapshots_total")
+    return snapshot
+
+
+def snapshot_due(db: Session) -> bool:
+    """Whether SNAPSHOT_INTERVAL_CHANGES changes have been recorded since the last snapshot."""
+    latest_change = db.query(func.max(GradeHistory.id)).scalar() or 0
+    previous = db.query(GradeSnapshot).order_by(GradeSnapshot.taken_at.desc()).first()
+    if previous is None:
+        return latest_change >= SNAPSHOT_INTERVAL_CHANGES
+    # The settle window is not covered by a snapshot yet; don't retake one before it has passed
+    settled = history_timestamp(datetime.now() - timedelta(seconds=2 * SNAPSHOT_SETTLE_SECONDS))
+    return latest_change - previous.last_history_id >= SNAPSHOT_INTERVAL_CHANGES and previous.taken_at <= settled
+
+
+def maybe_take_grade_snapshot(session_factory=SessionLocal) -> Optional[GradeSnapshot]:
+    db = session_factory()
+    try:
+        return take_grade_snapshot(db) if snapshot_due(db) else None
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    # Run from a scheduler or by hand: python -m app.history
+    db = SessionLocal()
+    try:
+        snapshot = take_grade_snapshot(db)
+        print(f"Snapshot {snapshot.id} taken at {snapshot.taken_at} (history up to #{snapshot.last_history_id})")
+    finally:
+        db.close()
@@ -0,0 +1,120 @@
+import codecs
+import csv
+import json
+from datetime import date, datetime
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+# (row number, row data, parse error); row numbers count the header as row 1 like a spreadsheet
+ParsedRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+SUPPORTED_EXTENSIONS = {
+    ".csv": "csv",
+    ".xlsx": "excel",
+    ".xls": "excel",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """Return "csv", "excel" or "ndjson" based on the file extension, or None."""
+    lowered = filename.lower()
+    for extension, file_format in SUPPORTED_EXTENSIONS.items():
+        if lowered.endswith(extension):
+            return file_format
+    return None
+
+
+def _cell_to_str(value: Any) -> str:
+    """Convert a spreadsheet cell to the string form used for CSV rows."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.date().isoformat() if value.time() == datetime.min.time() else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def iter_csv_rows(stream: BinaryIO) -> Iterator[ParsedRow]:
+    """Stream rows from a UTF-8 CSV file without loading it into memory."""
+    text = codecs.getreader("utf-8-sig")(stream)
+    reader = csv.DictReader(text)
+    try:
+        for row_number, row in enumerate(reader, 2):
+            yield row_number, row, None
+    except UnicodeDecodeError:
+        raise ValueError("File encoding error: Please ensure your CSV file uses UTF-8 encoding")
+    if reader.fieldnames is None:
+        raise ValueError("Invalid CSV format: could not detect column headers")
+
+
+def iter_excel_rows(stream: BinaryIO) -> Iterator[ParsedRow]:
+    """Stream rows from the active sheet of an XLSX file using openpyxl read-only mode."""
+    import openpyxl
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise ValueError("The file is not a valid Excel file")
+
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header_row = next(rows, None)
+        if header_row is None:
+            raise ValueError("Excel file is empty or missing data rows")
+        headers = [_cell_to_str(value) for value in header_row]
+
+        for row_number, values in enumerate(rows, 2):
+            if all(value is None for value in values):
+                continue  # Skip empty rows
+            yield row_number, {header: _cell_to_str(value) for header, value in zip(headers, values)}, None
+    finally:
+        workbook.close()
+
+
+def iter_ndjson_rows(stream: BinaryIO) -> Iterator[ParsedRow]:
+    """Stream rows from a newline-delimited JSON file (one object per line)."""
+    for row_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"Invalid JSON: {str(e)}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, row, None
+
+
+def iter_rows(stream: BinaryIO, filename: str) -> Iterator[ParsedRow]:
+    """
+    Stream rows from a CSV, Excel or NDJSON upload.
+
+    Raises:
+        ValueError: If the file type is unsupported or the file cannot be parsed
+    """
+    file_format = detect_format(filename)
+    if file_format == "csv":
+        return iter_csv_rows(stream)
+    if file_format == "excel":
+        return iter_excel_rows(stream)
+    if file_format == "ndjson":
+        return iter_ndjson_rows(stream)
+    raise ValueError("Only CSV, Excel and NDJSON files are supported")
+
+
+def iter_chunks(rows: Iterator[ParsedRow], size: int) -> Iterator[List[ParsedRow]]:
+    """Group a row stream into lists of at most ``size`` rows."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
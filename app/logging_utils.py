@@ -4,6 +4,40 @@ from typing import Optional, Any, Dict, Union
 from sqlalchemy.orm import Session
 from app.database import ActivityLog
 
+def activity_log_values(
+    action: str,
+    user_id: Optional[str] = None,
+    user_email: Optional[str] = None,
+    resource_type: Optional[str] = None,
+    resource_id: Optional[Union[str, int]] = None,
+    details: Optional[Dict[str, Any]] = None,
+    ip_address: Optional[str] = None,
+    user_agent: Optional[str] = None,
+    status_code: Optional[int] = None,
+    timestamp: Optional[str] = None
+) -> Dict[str, Any]:
+    """Column values of an activity log row, for ActivityLog(**values) or a bulk insert."""
+    # Convert details to JSON string if provided
+    details_json = None
+    if details:
+        try:
+            details_json = json.dumps(details)
+        except:
+            details_json = str(details)
+
+    return {
+        "user_id": user_id,
+        "user_email": user_email,
+        "timestamp": timestamp or datetime.now().isoformat(),
+        "action": action,
+        "resource_type": resource_type,
+        "resource_id": str(resource_id) if resource_id is not None else None,
+        "details": details_json,
+        "ip_address": ip_address,
+        "user_agent": user_agent,
+        "status_code": status_code
+    }
+
 def log_activity(
     db: Session,
     action: str,
@@ -31,27 +65,18 @@ def log_activity(
         user_agent: User agent string from the request
         status_code: HTTP status code of the response
     """
-    # Convert details to JSON string if provided
-    details_json = None
-    if details:
-        try:
-            details_json = json.dumps(details)
-        except:
-            details_json = str(details)
-
     # Create log entry
-    log_entry = ActivityLog(
+    log_entry = ActivityLog(**activity_log_values(
+        action=action,
         user_id=user_id,
         user_email=user_email,
-        timestamp=datetime.now().isoformat(),
-        action=action,
         resource_type=resource_type,
-        resource_id=str(resource_id) if resource_id is not None else None,
-        details=details_json,
+        resource_id=resource_id,
+        details=details,
         ip_address=ip_address,
         user_agent=user_agent,
         status_code=status_code
-    )
+    ))
     
     db.add(log_entry)
     db.commit()
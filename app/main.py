@@ -1,50 +1,71 @@
-from fastapi import Body, FastAPI, HTTPException, Depends, Path, Query, status, Security
+from fastapi import Body, FastAPI, Header, HTTPException, Depends, Path, Query, status, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr, validator, Field
 import re
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from requests import request
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
 from typing import Any, List
 from app.crud import calculate_course_averages, calculate_student_averages, create_grade, get_grades_by_student, update_grade, delete_grade, bulk_create_grades
 from typing import Optional
 from fastapi import UploadFile, File
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, PlainTextResponse, Response
+from fastapi import BackgroundTasks
 import csv
 import io
 import os
-from typing import Dict, List, Optional
-import openpyxl
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 from tempfile import NamedTemporaryFile
-from app.validators import GradeValidator
-from app.crud import create_student, get_student, get_students, update_student, delete_student
+from app.validators import REQUIRED_FIELDS, GradeValidator
+from app.crud import create_student, get_student, get_students, get_students_by_ids, update_student, delete_student, set_course_credits, bulk_import_students
+from app.ingest import ParsedRow, iter_rows
+from app.transcripts import GradeScale, load_transcript_inputs, compute_transcripts, get_student_transcript, shutdown_executor
+from app.exports import EXPORT_FORMATS, create_export_job, get_export_job, run_export_job
+from app.upload_templates import UploadTemplate, grade_template, roster_templates
+from app.chunked_uploads import UploadSessionError, abort_upload, check_upload, commit_upload, create_upload, get_upload, iter_upload_rows, run_upload_import, write_chunk
 from apscheduler.schedulers.background import BackgroundScheduler
 from app.backup import create_backup
 
-import firebase_admin
-from firebase_admin import credentials, auth
+from app.auth import ExpiredIdTokenError, InvalidIdTokenError, TokenVerificationUnavailable, verify_id_token
+from app.passwords import PasswordHasherBusy, password_hasher
+from app.permissions import Principal, Role, role_mask
+from app.serialization import encode_json, etag_headers, etag_matches, make_etag, negotiated_response, not_modified, response_fields, rows_to_dicts
+from app.versions import COURSES_SCOPE, course_scope, get_versions, student_scope
+from app.events import stream_events
+from app.outbox import relay as outbox_relay
+from app.history import course_averages_as_of, grades_as_of, history_timestamp, maybe_take_grade_snapshot, student_averages_as_of
+from functools import lru_cache
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager
 
-from app.database import GradeHistory, init_db, SessionLocal, User as DBUser
+from app.database import GradeHistory, ensure_schema, SessionLocal, User as DBUser
 
 from app.crud import get_grade_history, get_student_grade_history
+from app.crud import GradeBatchError, adjust_grades, bulk_delete_grades, bulk_update_grades, upsert_grades, validate_grade_rows
+from app.uploads import IdempotencyKeyReused, UploadInProgress, abandon_receipt, begin_receipt, complete_receipt, content_hash, find_replay
 from app.crud import (
     create_course, get_course, get_courses,
-    add_student_to_course, remove_student_from_course,
-    get_students_in_course, get_courses_for_student
+    add_student_to_course, bulk_add_students_to_course, remove_student_from_course,
+    get_students_in_course, get_courses_for_student,
+    get_courses_by_ids, get_grades_by_ids
 )
 from app.database import Course, StudentCourse
 
 import time
 from fastapi import Request
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.base import BaseHTTPMiddleware
 from app.logging_utils import log_activity, get_request_ip
 
 from app.logging_utils import get_logs
+from app.metrics import MetricsMiddleware, registry as metrics_registry
+from app import profiling
 from app.database import ActivityLog
 
 DATABASE_URL = "sqlite:///app.db"  # Update with your actual database URL
 
+MAX_REPORTED_IMPORT_ERRORS = 1000
+MAX_BATCH_IDS = 1000
+
 def schedule_backups():
     """Schedule daily backups."""
     scheduler = BackgroundScheduler()
@@ -64,6 +85,9 @@ def is_excel_file(filename: str) -> bool:
 
 def parse_excel_file(content: bytes):
     """Parse Excel file content and convert to list of dictionaries."""
+    # Imported on first use; an ImportError here reaches the caller's handler
+    import openpyxl
+
     # Create temp file to hold Excel data
     with NamedTemporaryFile(suffix='.xlsx', delete=False) as temp:
         temp_path = temp.name
@@ -113,12 +137,6 @@ def parse_excel_file(content: bytes):
         if os.path.exists(temp_path):
             os.unlink(temp_path)
 
-# ----------------------------
-# Firebase Admin Initialization
-# ----------------------------
-cred = credentials.Certificate("app/cert/serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
-
 # ----------------------------
 # FastAPI App and Database Setup
 # ----------------------------
@@ -126,7 +144,7 @@ firebase_admin.initialize_app(cred)
 class ActivityLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Skip logging for some paths like health checks
-        if request.url.path in ["/docs", "/redoc", "/openapi.json", "/favicon.ico"]:
+        if request.url.path in ["/docs", "/redoc", "/openapi.json", "/favicon.ico", "/metrics"]:
             return await call_next(request)
         
         # Get the start time
@@ -138,7 +156,14 @@ class ActivityLoggingMiddleware(BaseHTTPMiddleware):
         ip_address = get_request_ip(request)
         user_agent = request.headers.get("user-agent")
         
-        # Extract user from authorization header if present
+        # Process the request
+        response = await call_next(request)
+        
+        # Calculate processing time
+        processing_time = time.time() - start_time
+        
+        # Extract user from authorization header if present; done after the endpoint ran,
+        # so a token its auth dependency already verified is a cache hit
         user_id = None
         user_email = None
         if "authorization" in request.headers:
@@ -148,19 +173,12 @@ class ActivityLoggingMiddleware(BaseHTTPMiddleware):
                 user_email = "test@example.com"
             else:
                 try:
-                    from firebase_admin import auth
-                    decoded_token = auth.verify_id_token(token)
+                    decoded_token = verify_id_token(token)
                     user_id = decoded_token.get("uid")
                     user_email = decoded_token.get("email")
                 except:
                     pass  # Token verification failed, continue without user info
         
-        # Process the request
-        response = await call_next(request)
-        
-        # Calculate processing time
-        processing_time = time.time() - start_time
-        
         # Log the activity asynchronously to avoid blocking
         try:
             # Get a new DB session (middleware can't use the dependency injection)
@@ -197,12 +215,29 @@ class ActivityLoggingMiddleware(BaseHTTPMiddleware):
         
         return response
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Firebase and openpyxl are loaded on first use; only the schema is checked at startup,
+    # and that is a single lookup once this schema version has been applied
+    ensure_schema()
+    outbox_relay.start()
+    yield
+    outbox_relay.stop()
+    shutdown_executor()
+    password_hasher.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
-# After creating the app instance
-app = FastAPI()
+# Grade snapshots for as_of queries are taken by the outbox relay once enough changes have accumulated
+outbox_relay.on_relayed.append(maybe_take_grade_snapshot)
+
+# Routes can only be profiled when profiling is enabled at startup; otherwise endpoints run unwrapped
+if profiling.PROFILING_ENABLED:
+    app.router.route_class = profiling.ProfilingRoute
 
 app.add_middleware(ActivityLoggingMiddleware)
+# Added last so it is the outermost middleware and times the whole request
+app.add_middleware(MetricsMiddleware)
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -219,12 +254,10 @@ async def global_exception_handler(request, exc):
         content={"detail": error_message},
     )
 
-init_db()  # Create tables if they don't exist
-
 # ----------------------------
 # Local Security (for signup password hashing)
 # ----------------------------
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing runs in app.passwords' bounded process pool
 # For Firebase token extraction from headers.
 firebase_scheme = HTTPBearer()
 
@@ -297,8 +330,30 @@ class BulkUploadResponse(BaseModel):
     total_processed: int
     successful: int
     failed: int
+    created: Optional[int] = None
+    updated: Optional[int] = None  # upsert mode only
+    unchanged: Optional[int] = None  # upsert mode only
     errors: Optional[List[str]] = None
 
+class ResumableUploadCreate(BaseModel):
+    filename: str = Field(..., min_length=1)
+    size: int = Field(..., gt=0)  # Total bytes that will be sent
+    sha256: Optional[str] = Field(None, pattern="^[0-9a-fA-F]{64}$")  # Whole-file checksum, verified on commit
+    mode: str = Field("insert", pattern="^(insert|upsert)$")
+    min_grade: int = Field(0, ge=0, le=100)
+    max_grade: int = Field(100, ge=0, le=100)
+
+class ResumableUploadResponse(BaseModel):
+    id: str
+    filename: str
+    size: int
+    offset: int
+    status: str  # "receiving", "processing", "done" or "failed"
+    mode: str
+    rows_processed: int
+    result: Optional[BulkUploadResponse] = None
+    error: Optional[str] = None
+
 class GradeHistoryResponse(BaseModel):
     id: int
     grade_id: int
@@ -321,6 +376,9 @@ class PaginatedResponse(BaseModel):
     pages: int
     limit: int
 
+GRADE_FIELDS = response_fields(GradeResponse)
+GRADE_HISTORY_FIELDS = response_fields(GradeHistoryResponse)
+
 class CourseBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=100)
     description: Optional[str] = None
@@ -337,6 +395,8 @@ class CourseResponse(CourseBase):
         orm_mode = True
         from_attributes = True
 
+COURSE_FIELDS = response_fields(CourseResponse)
+
 class StudentCourseResponse(BaseModel):
     id: int
     student_id: int
@@ -365,15 +425,95 @@ class CourseAverageResponse(BaseModel):
     overall_average: Optional[float]
     total_students: int
 
+class CourseCreditUpdate(BaseModel):
+    credit_hours: float = Field(..., gt=0, le=30)
+    term: Optional[str] = Field(None, max_length=50)
+    term_weight: float = Field(1.0, gt=0, le=10)
+
+class CourseCreditResponse(CourseCreditUpdate):
+    course_id: int
+
+    class Config:
+        orm_mode = True
+        from_attributes = True
+
+class TranscriptCourse(BaseModel):
+    course_id: int
+    course_name: str
+    term: Optional[str]
+    credit_hours: float
+    average: float
+    letter: str
+    grade_points: float
+
+class TranscriptResponse(BaseModel):
+    student_id: int
+    courses: List[TranscriptCourse]
+    gpa: Optional[float]
+    weighted_average: Optional[float]
+    total_credits: float
+    class_rank: Optional[int]
+    cohort_size: int
+    percentile: Optional[float]
+
+class TranscriptBatchRequest(BaseModel):
+    student_ids: Optional[List[int]] = Field(None, max_length=100000)
+    course_id: Optional[int] = Field(None, gt=0)
+    scale: str = "standard"
+
+class TranscriptBatchResponse(BaseModel):
+    scale: str
+    total_students: int
+    transcripts: List[TranscriptResponse]
+
+class ExportJobResponse(BaseModel):
+    id: str
+    status: str
+    format: str
+    course_id: Optional[int]
+    created_at: str
+    completed_at: Optional[str]
+    students: int
+    error: Optional[str]
+    download_url: Optional[str] = None
+
 class Student(BaseModel):
     id: int
     name: str
     email: str
-    date_of_birth: str
+    date_of_birth: Optional[str]
 
     class Config:
         orm_mode = True
 
+class BatchGetRequest(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class StudentBatchResponse(BaseModel):
+    items: List[Student]
+    missing: List[int]
+
+class CourseBatchResponse(BaseModel):
+    items: List[CourseResponse]
+    missing: List[int]
+
+class GradeBatchResponse(BaseModel):
+    items: List[GradeResponse]
+    missing: List[int]
+
+class GradeBatchUpdateItem(BaseModel):
+    grade_id: int = Field(..., gt=0)
+    grade: int
+
+class GradeBatchUpdateRequest(BaseModel):
+    updates: List[GradeBatchUpdateItem] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+
+class GradeAdjustRequest(BaseModel):
+    subject: str = Field(..., min_length=1)
+    delta: int
+    course_id: Optional[int] = Field(None, gt=0)
+    clamp: bool = False  # Limit results to 0-100 instead of rejecting the adjustment
+
 class ActivityLogResponse(BaseModel):
     id: int
     user_id: Optional[str]
@@ -407,14 +547,39 @@ def get_db():
     finally:
         db.close()
 
+def parse_id_list(ids: str) -> List[int]:
+    """Parse a comma-separated ``ids`` query parameter into a list of IDs."""
+    try:
+        parsed = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if not parsed:
+        raise HTTPException(status_code=400, detail="ids must contain at least one ID")
+    if len(parsed) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids: maximum is {MAX_BATCH_IDS}")
+    return parsed
+
 # ----------------------------
 # Utility Functions (Local Password Handling)
 # ----------------------------
+def _password_pool_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Password service is busy, please retry shortly",
+        headers={"Retry-After": "1"}
+    )
+
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    try:
+        return password_hasher.hash(password)
+    except (PasswordHasherBusy, FutureTimeoutError):
+        raise _password_pool_unavailable()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    try:
+        return password_hasher.verify(plain_password, hashed_password)
+    except (PasswordHasherBusy, FutureTimeoutError):
+        raise _password_pool_unavailable()
 
 # ----------------------------
 # Firebase Authentication Dependencies
@@ -440,22 +605,23 @@ def get_current_firebase_user(token: HTTPAuthorizationCredentials = Depends(fire
     
     
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
+        decoded_token = verify_id_token(token.credentials)
         return decoded_token
-    except auth.ExpiredIdTokenError:
+    except ExpiredIdTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication token has expired. Please log in again."
         )
-    except auth.InvalidIdTokenError:
+    except InvalidIdTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication token. Please log in again."
         )
-    except auth.RevokedIdTokenError:
+    except TokenVerificationUnavailable:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Authentication token has been revoked. Please log in again."
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Token verification is temporarily unavailable",
+            headers={"Retry-After": "30"}
         )
     except Exception as e:
         raise HTTPException(
@@ -463,24 +629,45 @@ def get_current_firebase_user(token: HTTPAuthorizationCredentials = Depends(fire
             detail=f"Authentication error: {str(e)}"
         )
     
+def get_principal(user: dict = Depends(get_current_firebase_user)) -> Principal:
+    """Resolve the token's roles once per request; FastAPI caches this dependency per request."""
+    return Principal(user)
+
 def require_roles(required_roles: List[str]):
     """
     Dependency generator that checks whether the Firebase token includes at least one
     of the required roles (e.g., "admin", "teacher", "student"). It assumes that the
     Firebase custom claims include a "roles" key.
     """
-    def role_checker(user: dict = Depends(get_current_firebase_user)) -> dict:
-        roles = user.get("roles", [])
-        if isinstance(roles, str):
-            roles = [roles]
-        if not any(role in roles for role in required_roles):
+    return _role_checker(role_mask(required_roles))
+
+@lru_cache(maxsize=None)
+def _role_checker(required_mask: int):
+    # One checker per distinct role set, shared by every route that requires it
+    def role_checker(principal: Principal = Depends(get_principal)) -> Principal:
+        if not principal.role_mask & required_mask:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Insufficient permissions"
             )
-        return user
+        return principal
     return role_checker
 
+@lru_cache(maxsize=None)
+def require_student_access(resource: str):
+    """
+    Dependency generator for per-student routes: any role may call them, but
+    students only for their own ``student_id`` (see Principal.can_access_student).
+    """
+    def student_access_checker(
+        student_id: int = Path(..., gt=0),
+        principal: Principal = Depends(require_roles(["admin", "teacher", "student"]))
+    ) -> Principal:
+        if not principal.can_access_student(student_id):
+            raise HTTPException(status_code=403, detail=f"You can only view your own {resource}")
+        return principal
+    return student_access_checker
+
 @app.post("/backup", response_model=dict)
 def manual_backup(
     db_url: str = DATABASE_URL,
@@ -544,6 +731,15 @@ def manual_backup(
         )
         raise HTTPException(status_code=500, detail=f"Backup failed: {str(e)}")
 # ----------------------------
+# Metrics Endpoint
+# ----------------------------
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics_endpoint():
+    """Expose request, database, queue and cache metrics in Prometheus text format."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# ----------------------------
 # Authentication Endpoints
 # ----------------------------
 
@@ -553,7 +749,9 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
     existing_user = db.query(DBUser).filter(DBUser.username == user.username).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    
+    # Return the connection to the pool while the password is hashed
+    db.rollback()
+
     # Create new user locally (storing hashed password for local reference)
     hashed_password = get_password_hash(user.password)
     new_user = DBUser(username=user.username, email=user.email, hashed_password=hashed_password)
@@ -572,7 +770,7 @@ def login(
 ):
     try:
         # Verify the Firebase token sent by the client
-        decoded_token = auth.verify_id_token(credentials.credentials)
+        decoded_token = verify_id_token(credentials.credentials)
         
         # Log successful login with detailed user info
         log_activity(
@@ -609,7 +807,7 @@ def login(
 # Dependency to retrieve the current user from Firebase token and match with local DB
 def get_current_user(token: HTTPAuthorizationCredentials = Depends(firebase_scheme), db: Session = Depends(get_db)) -> DBUser:
     try:
-        decoded_token = auth.verify_id_token(token.credentials)
+        decoded_token = verify_id_token(token.credentials)
         username = decoded_token.get("sub")  # Using the 'sub' claim as username
         if username is None:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token: no subject")
@@ -655,30 +853,27 @@ def add_grade(
         # Extract user identifier (email or UID)
         user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
         
+        # Grade creation is logged by the outbox relay, from the same transaction as the grade
         created_grade = create_grade(
             db, 
             student_id=grade.student_id, 
             subject=grade.subject, 
             grade=grade.grade,
-            changed_by=user_identifier
-        )
-        
-        # Log grade creation
-        log_activity(
-            db=db,
-            action="create_grade",
-            user_id=current_user.get("uid"),
-            user_email=user_identifier,
-            resource_type="grade",
-            resource_id=created_grade.id,
-            details={
-                "student_id": grade.student_id,
-                "subject": grade.subject,
-                "grade": grade.grade
-            },
-            ip_address=get_request_ip(request),
-            user_agent=request.headers.get("user-agent") if request else None,
-            status_code=201
+            changed_by=user_identifier,
+            activity={
+                "action": "create_grade",
+                "user_id": current_user.get("uid"),
+                "user_email": user_identifier,
+                "resource_type": "grade",
+                "details": {
+                    "student_id": grade.student_id,
+                    "subject": grade.subject,
+                    "grade": grade.grade
+                },
+                "ip_address": get_request_ip(request),
+                "user_agent": request.headers.get("user-agent") if request else None,
+                "status_code": 201
+            }
         )
         
         return GradeResponse.from_orm(created_grade)
@@ -702,10 +897,117 @@ def add_grade(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.get("/grades", response_model=GradeBatchResponse)
+def list_grades_by_ids(
+    ids: str = Query(..., description="Comma-separated grade IDs"),
+    db: Session = Depends(get_db)
+):
+    """Get several grades by ID in one request."""
+    items, missing = get_grades_by_ids(db, parse_id_list(ids))
+    return {"items": items, "missing": missing}
+
+@app.post("/grades:batchGet", response_model=GradeBatchResponse)
+def batch_get_grades(batch: BatchGetRequest, db: Session = Depends(get_db)):
+    """Get several grades by ID in one request."""
+    items, missing = get_grades_by_ids(db, batch.ids)
+    return {"items": items, "missing": missing}
+
+def grade_batch_rejected(error: GradeBatchError) -> HTTPException:
+    return HTTPException(status_code=400, detail={"message": str(error), "errors": error.errors})
+
+def grade_batch_activity(request: Request, current_user: dict, action: str, details: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """log_activity arguments for the single activity log of a batch grade change."""
+    return {
+        "action": action,
+        "user_id": current_user.get("uid"),
+        "user_email": current_user.get("email", current_user.get("uid", "unknown")),
+        "resource_type": "grade",
+        "details": details,
+        "ip_address": get_request_ip(request),
+        "user_agent": request.headers.get("user-agent"),
+        "status_code": 200
+    }
+
+@app.post("/grades:batchUpdate", response_model=GradeBatchResponse)
+def batch_update_grades(
+    request: Request,
+    batch: GradeBatchUpdateRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Set several grades in one transaction; if any new value is invalid, none are changed."""
+    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+    try:
+        items, missing = bulk_update_grades(
+            db,
+            [(item.grade_id, item.grade) for item in batch.updates],
+            changed_by=user_identifier,
+            activity=grade_batch_activity(request, current_user, "batch_update_grades")
+        )
+    except GradeBatchError as e:
+        raise grade_batch_rejected(e)
+    return {"items": items, "missing": missing}
+
+@app.post("/grades:adjust", response_model=GradeBatchResponse)
+def adjust_subject_grades(
+    request: Request,
+    adjustment: GradeAdjustRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Add ``delta`` to every grade in a subject, e.g. to curve an exam.
+
+    With ``course_id`` only students enrolled in that course are adjusted.
+    """
+    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+    try:
+        items = adjust_grades(
+            db,
+            subject=adjustment.subject,
+            delta=adjustment.delta,
+            course_id=adjustment.course_id,
+            clamp=adjustment.clamp,
+            changed_by=user_identifier,
+            activity=grade_batch_activity(request, current_user, "adjust_grades", adjustment.model_dump())
+        )
+    except GradeBatchError as e:
+        raise grade_batch_rejected(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "missing": []}
+
+@app.post("/grades:batchDelete", response_model=GradeBatchResponse)
+def batch_delete_grades(
+    request: Request,
+    batch: BatchGetRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Delete several grades in one transaction; returns the deleted grades."""
+    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+    items, missing = bulk_delete_grades(
+        db, batch.ids, changed_by=user_identifier,
+        activity=grade_batch_activity(request, current_user, "batch_delete_grades")
+    )
+    return {"items": items, "missing": missing}
+
 @app.get("/grades/{student_id}", response_model=List[GradeResponse])
-def list_grades(student_id: int = Path(..., gt=0, description="The student ID"), db: Session = Depends(get_db)):
+def list_grades(
+    request: Request,
+    student_id: int = Path(..., gt=0, description="The student ID"),
+    as_of: Optional[datetime] = Query(None, description="Return the grades as they stood at this moment"),
+    db: Session = Depends(get_db)
+):
+    if as_of is not None:
+        grades = grades_as_of(db, [student_id], history_timestamp(as_of)).get(student_id, [])
+        return negotiated_response(request, [grade._asdict() for grade in grades])
+    # Versions are read before the data, so a concurrent change can only make the ETag older than the body
+    etag = make_etag(request, get_versions(db, [student_scope(student_id)]))
+    if etag_matches(request, etag):
+        return not_modified(etag)
     grades = get_grades_by_student(db, student_id)
-    return [GradeResponse.from_orm(grade) for grade in grades]
+    return negotiated_response(request, rows_to_dicts(grades, GRADE_FIELDS), etag=etag)
 
 
 @app.put("/grades/{grade_id}", response_model=GradeResponse)
@@ -746,16 +1048,140 @@ def remove_grade(
     return GradeResponse.from_orm(deleted_grade)
 
 
+# Largest number of data rows accepted by POST /grades/upload
+GRADE_UPLOAD_MAX_ROWS = 1000
+
+def check_grade_upload_format(filename: str) -> None:
+    """Reject files POST /grades/upload cannot parse."""
+    if not (is_excel_file(filename) or filename.endswith('.csv')):
+        raise HTTPException(
+            status_code=400, 
+            detail="Only CSV and Excel files are supported"
+        )
+
+def check_grade_upload_rows(grades_data: List[Dict[str, Any]]) -> None:
+    """Reject parsed uploads that are empty, too long or missing required columns."""
+    # Check for empty file
+    if not grades_data:
+        raise HTTPException(
+            status_code=400,
+            detail="File contains no data rows"
+        )
+        
+    # Enforce maximum number of rows
+    if len(grades_data) > GRADE_UPLOAD_MAX_ROWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many rows in file: maximum is {GRADE_UPLOAD_MAX_ROWS}, found {len(grades_data)}"
+        )
+        
+    # Validate required columns
+    if not all(col in grades_data[0] for col in REQUIRED_FIELDS):
+        missing = [col for col in REQUIRED_FIELDS if col not in grades_data[0]]
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required columns: {', '.join(missing)}"
+        )
+
+def parse_grade_upload(filename: str, content: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse an uploaded CSV or Excel file into grade rows, raising HTTPException for unusable files.
+
+    Uploads and dry runs both go through here, so a file passing a dry run
+    is not rejected by the upload itself.
+    """
+    check_grade_upload_format(filename)
+    # Check file type and parse accordingly
+    if is_excel_file(filename):
+        try:
+            grades_data = parse_excel_file(content)
+        except ImportError:
+            raise HTTPException(
+                status_code=400,
+                detail="Excel support requires the openpyxl package. Install with: pip install openpyxl"
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    elif filename.endswith('.csv'):
+        # Parse as CSV
+        try:
+            content_str = content.decode('utf-8')
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=400, 
+                detail="File encoding error: Please ensure your CSV file uses UTF-8 encoding"
+            )
+            
+        csv_reader = csv.DictReader(io.StringIO(content_str))
+        grades_data = list(csv_reader)
+        
+        # Check if CSV parsing succeeded
+        if not csv_reader.fieldnames:
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid CSV format: could not detect column headers"
+            )
+
+    check_grade_upload_rows(grades_data)
+    return grades_data
+
+def upload_student_ids(grades_data: List[Dict[str, Any]]) -> List[int]:
+    """Student IDs named by the well-formed rows of an upload."""
+    student_ids = []
+    for row in grades_data:
+        try:
+            student_ids.append(int(row["student_id"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return student_ids
+
+def grade_validation_stream(
+    session_factory: sessionmaker,
+    rows: Iterable[ParsedRow],
+    validator: GradeValidator,
+    course_id: Optional[int]
+) -> Iterator[bytes]:
+    """
+    NDJSON lines for a dry-run upload: one per invalid row, then a summary line.
+
+    Rows are checked as they are read, 1000 at a time, so a stream from
+    app.ingest is never held in memory.
+    """
+    # The request's session is closed once the response starts; the stream uses its own
+    db = session_factory()
+    total = 0
+    invalid = 0
+
+    def counted():
+        nonlocal total
+        for row in rows:
+            total += 1
+            yield row
+
+    try:
+        for row_number, error in validate_grade_rows(db, counted(), validator=validator, course_id=course_id):
+            invalid += 1
+            yield encode_json({"row": row_number, "error": error}) + b"\n"
+    except ValueError as e:
+        # The file itself could not be read past this point
+        yield encode_json({"error": str(e)}) + b"\n"
+    finally:
+        db.close()
+    yield encode_json({"summary": {"total_processed": total, "valid": total - invalid, "invalid": invalid}}) + b"\n"
+
 @app.post("/grades/upload", response_model=BulkUploadResponse)
 async def upload_grades(
+    request: Request,
     file: UploadFile = File(...),
     min_grade: int = Query(0, ge=0, le=100),
     max_grade: int = Query(100, ge=0, le=100),
+    mode: str = Query("insert", pattern="^(insert|upsert)$", description="upsert: update grades matched on (student_id, subject, assessment) and skip unchanged rows"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    dry_run: bool = Query(False, description="Only validate the file and stream its errors as NDJSON; nothing is written"),
+    course_id: Optional[int] = Query(None, gt=0, description="With dry_run, also require students to be enrolled in this course"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_roles(["admin", "teacher"]))
 ):
-    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
-
     """
     Upload grades from a CSV or Excel file with comprehensive error handling.
     
@@ -763,7 +1189,21 @@ async def upload_grades(
     - student_id: The student ID (integer)
     - subject: Subject name (string)
     - grade: Grade value (integer, min_grade-max_grade)
+    - assessment: Optional assessment name, e.g. "Midterm"
+
+    Retries are answered from a stored receipt instead of being applied again:
+    always when they repeat an Idempotency-Key, and for the same file and
+    options as long as the students it touched have not changed since.
+    Replayed responses carry an Idempotent-Replayed header.
+
+    With dry_run=true the file is only checked, including that every student
+    exists, and the response is an NDJSON stream: {"row", "error"} lines as
+    invalid rows are found, then a {"summary"} line. A dry run accepts the
+    same files as an upload; check larger files with the dry run of
+    POST /grades/uploads/{id}/commit.
     """
+    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+
     # Check if file is empty
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
@@ -781,7 +1221,9 @@ async def upload_grades(
             "filename": file.filename,
             "content_type": file.content_type,
             "min_grade": min_grade,
-            "max_grade": max_grade
+            "max_grade": max_grade,
+            "mode": mode,
+            "dry_run": dry_run
         },
         ip_address=get_request_ip(request) if request else None,
         user_agent=request.headers.get("user-agent") if request else None,
@@ -809,92 +1251,6 @@ async def upload_grades(
                 status_code=400,
                 detail=f"File too large: maximum size is 10MB"
             )
-            
-        # Process based on file type
-        try:
-            # Check file type and parse accordingly
-            if is_excel_file(file.filename):
-                try:
-                    grades_data = parse_excel_file(content)
-                except ImportError:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Excel support requires the openpyxl package. Install with: pip install openpyxl"
-                    )
-                except ValueError as e:
-                    raise HTTPException(status_code=400, detail=str(e))
-            elif file.filename.endswith('.csv'):
-                # Parse as CSV
-                try:
-                    content_str = content.decode('utf-8')
-                except UnicodeDecodeError:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="File encoding error: Please ensure your CSV file uses UTF-8 encoding"
-                    )
-                    
-                csv_reader = csv.DictReader(io.StringIO(content_str))
-                grades_data = list(csv_reader)
-                
-                # Check if CSV parsing succeeded
-                if not csv_reader.fieldnames:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Invalid CSV format: could not detect column headers"
-                    )
-            else:
-                raise HTTPException(
-                    status_code=400, 
-                    detail="Only CSV and Excel files are supported"
-                )
-            
-            # Check for empty file
-            if not grades_data:
-                raise HTTPException(
-                    status_code=400,
-                    detail="File contains no data rows"
-                )
-                
-            # Enforce maximum number of rows
-            MAX_ROWS = 1000
-            if len(grades_data) > MAX_ROWS:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Too many rows in file: maximum is {MAX_ROWS}, found {len(grades_data)}"
-                )
-                
-            # Validate required columns
-            required_columns = ['student_id', 'subject', 'grade']
-            if not all(col in grades_data[0] for col in required_columns):
-                missing = [col for col in required_columns if col not in grades_data[0]]
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Missing required columns: {', '.join(missing)}"
-                )
-            
-            # Bulk create grades with specified validator
-            successful_grades, errors = bulk_create_grades(db, grades_data, validator=validator, changed_by=user_identifier)
-            
-            # Prepare response
-            response = {
-                "total_processed": len(grades_data),
-                "successful": len(successful_grades),
-                "failed": len(grades_data) - len(successful_grades),
-            }
-            
-            # Add errors if any
-            if errors:
-                response["errors"] = errors
-                
-            return response
-                
-        except Exception as e:
-            # Handle other unexpected errors during file processing
-            raise HTTPException(
-                status_code=500,
-                detail=f"Error processing file: {str(e)}"
-            )
-                
     except HTTPException:
         # Re-raise HTTP exceptions directly
         raise
@@ -905,19 +1261,235 @@ async def upload_grades(
             detail=f"Error reading file: {str(e)}"
         )
 
+    if dry_run:
+        if course_id and not get_course(db, course_id):
+            raise HTTPException(status_code=404, detail="Course not found")
+        # Same parsing and file-level checks as a real upload; only the rows are reported instead of written
+        grades_data = parse_grade_upload(file.filename, content)
+        # Data rows are numbered from 1, as in the errors of a real upload
+        rows = ((idx + 1, grade_data, None) for idx, grade_data in enumerate(grades_data))
+        return StreamingResponse(
+            grade_validation_stream(sessionmaker(bind=db.get_bind()), rows, validator, course_id),
+            media_type="application/x-ndjson"
+        )
+
+    # A retry of an upload that already went through is answered without parsing the file again
+    uploader = str(current_user.get("uid", user_identifier))
+    digest = content_hash(content)
+    parameters = f"mode={mode};min={min_grade};max={max_grade};format={'excel' if is_excel_file(file.filename) else 'csv'}"
+    try:
+        replay = find_replay(db, uploader, digest, parameters, idempotency_key)
+        if replay is not None:
+            return JSONResponse(replay, headers={"Idempotent-Replayed": "true"})
+        receipt = begin_receipt(db, uploader, digest, parameters, idempotency_key)
+    except UploadInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail="The same upload is still being processed",
+            headers={"Retry-After": "1"}
+        )
+    except IdempotencyKeyReused:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different file or different options"
+        )
+
+    try:
+        grades_data = parse_grade_upload(file.filename, content)
+
+        if mode == "upsert":
+            counts, errors = upsert_grades(db, grades_data, validator=validator, changed_by=user_identifier)
+            successful = counts["created"] + counts["updated"] + counts["unchanged"]
+        else:
+            # Bulk create grades with specified validator
+            successful_grades, errors = bulk_create_grades(db, grades_data, validator=validator, changed_by=user_identifier)
+            successful = len(successful_grades)
+            counts = {"created": successful}
+
+        # Prepare response
+        response = {
+            "total_processed": len(grades_data),
+            "successful": successful,
+            "failed": len(grades_data) - successful,
+            **counts
+        }
+        
+        # Add errors if any
+        if errors:
+            response["errors"] = errors
+
+        # Stored as the response model renders it, so a replay returns the same body
+        body = BulkUploadResponse(**response).model_dump()
+        complete_receipt(db, receipt, body, upload_student_ids(grades_data))
+        return body
+            
+    except HTTPException:
+        abandon_receipt(db, receipt)
+        raise
+    except Exception as e:
+        abandon_receipt(db, receipt)
+        # Handle other unexpected errors during file processing
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error processing file: {str(e)}"
+        )
+
+# ----------------------------
+# Resumable Grade Uploads
+# ----------------------------
+
+def _owned_upload(upload_id: str, principal: Principal) -> dict:
+    upload = get_upload(upload_id)
+    # Teachers only see their own uploads; a 404 doesn't reveal that someone else's exists
+    if not upload or not (principal.has_any(Role.ADMIN) or upload["created_by"] == principal.uid):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+def _upload_session_failed(error: UploadSessionError, upload_id: str) -> HTTPException:
+    upload = get_upload(upload_id)
+    headers = {"Upload-Offset": str(upload["offset"])} if upload else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
+
+@app.post("/grades/uploads", response_model=ResumableUploadResponse, status_code=201)
+def start_resumable_upload(
+    upload: ResumableUploadCreate,
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Start a resumable grade upload for files too large for POST /grades/upload.
+
+    Send the file with PUT /grades/uploads/{id} in chunks, each with an
+    Upload-Offset header and the chunk's SHA-256 in Chunk-SHA256. After a
+    dropped connection, GET the upload to learn the offset to resume from.
+    POST /grades/uploads/{id}/commit once all bytes are in.
+    """
+    if upload.min_grade > upload.max_grade:
+        raise HTTPException(
+            status_code=400,
+            detail=f"min_grade ({upload.min_grade}) cannot be greater than max_grade ({upload.max_grade})"
+        )
+    try:
+        return create_upload(
+            upload.filename,
+            upload.size,
+            sha256=upload.sha256,
+            mode=upload.mode,
+            min_grade=upload.min_grade,
+            max_grade=upload.max_grade,
+            created_by=current_user.uid
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/grades/uploads/{upload_id}", response_model=ResumableUploadResponse)
+def get_resumable_upload(
+    upload_id: str,
+    response: Response,
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
+):
+    """Get an upload's offset, processing progress and, once done, its result."""
+    upload = _owned_upload(upload_id, current_user)
+    response.headers["Upload-Offset"] = str(upload["offset"])
+    return upload
+
+@app.put("/grades/uploads/{upload_id}", response_model=ResumableUploadResponse)
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0),
+    chunk_sha256: str = Header(..., alias="Chunk-SHA256", pattern="^[0-9a-fA-F]{64}$"),
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Append the request body at Upload-Offset.
+
+    The chunk is stored only if it matches Chunk-SHA256. A wrong offset is
+    answered with 409 and the expected offset in the Upload-Offset header.
+    """
+    await run_in_threadpool(_owned_upload, upload_id, current_user)
+    try:
+        upload = await write_chunk(upload_id, upload_offset, chunk_sha256, request.stream())
+    except UploadSessionError as e:
+        raise await run_in_threadpool(_upload_session_failed, e, upload_id)
+    response.headers["Upload-Offset"] = str(upload["offset"])
+    return upload
+
+@app.post("/grades/uploads/{upload_id}/commit", response_model=ResumableUploadResponse, status_code=202)
+def commit_resumable_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    dry_run: bool = Query(False, description="Only validate the file and stream its errors as NDJSON; the upload stays uncommitted"),
+    course_id: Optional[int] = Query(None, gt=0, description="With dry_run, also require students to be enrolled in this course"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Verify a complete upload and import it in the background.
+
+    Poll GET /grades/uploads/{id} until the status is "done" or "failed".
+    Committing again returns the current state without importing twice.
+
+    With dry_run=true nothing is written and the upload can still be
+    committed afterwards. The file is streamed from disk and checked like
+    POST /grades/upload?dry_run=true, with the same NDJSON response; rows
+    are numbered by file line, as in the errors of the import.
+    """
+    _owned_upload(upload_id, current_user)
+    if dry_run:
+        if course_id and not get_course(db, course_id):
+            raise HTTPException(status_code=404, detail="Course not found")
+        try:
+            upload = check_upload(upload_id)
+        except UploadSessionError as e:
+            raise _upload_session_failed(e, upload_id)
+        validator = GradeValidator(min_grade=upload["min_grade"], max_grade=upload["max_grade"])
+        return StreamingResponse(
+            grade_validation_stream(sessionmaker(bind=db.get_bind()), iter_upload_rows(upload), validator, course_id),
+            media_type="application/x-ndjson"
+        )
+    try:
+        upload, started = commit_upload(upload_id)
+    except UploadSessionError as e:
+        raise _upload_session_failed(e, upload_id)
+    if started:
+        user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+        # The import gets its own sessions; this request's session is closed once the response is sent
+        background_tasks.add_task(run_upload_import, upload_id, sessionmaker(bind=db.get_bind()), user_identifier)
+    return upload
+
+@app.delete("/grades/uploads/{upload_id}", status_code=204)
+def abort_resumable_upload(
+    upload_id: str,
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
+):
+    """Abandon an upload and delete its data."""
+    _owned_upload(upload_id, current_user)
+    try:
+        abort_upload(upload_id)
+    except UploadSessionError as e:
+        raise _upload_session_failed(e, upload_id)
+    return Response(status_code=204)
+
+def template_response(request: Request, template: UploadTemplate, cache_control: str) -> Response:
+    # The cached bytes are sent as they are: no copy, no re-encoding
+    headers = {
+        "ETag": template.etag,
+        "Cache-Control": cache_control,
+        "Content-Disposition": f"attachment; filename={template.filename}"
+    }
+    if etag_matches(request, template.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(template.content, media_type=template.media_type, headers=headers)
+
 @app.get("/grades/upload/template")
 async def get_grade_upload_template(
+    request: Request,
     format: str = Query("csv", pattern="^(csv|excel)$"),
     min_grade: int = Query(0, ge=0, le=100),
     max_grade: int = Query(100, ge=0, le=100),
     _: dict = Depends(require_roles(["admin", "teacher"]))
 ):
-    # Ensure min_grade <= max_grade
-    if min_grade > max_grade:
-        raise HTTPException(
-            status_code=400,
-            detail=f"min_grade ({min_grade}) cannot be greater than max_grade ({max_grade})"
-        )
     """
     Get a template file for bulk grade upload.
     
@@ -925,89 +1497,39 @@ async def get_grade_upload_template(
     - format: "csv" or "excel" (default: "csv")
     - min_grade: Minimum allowed grade (default: 0)
     - max_grade: Maximum allowed grade (default: 100)
+
+    Templates are rendered once per format and range and then served from
+    memory; their content never changes, so clients may cache them for a day.
     """
-    # Sample data
-    sample_data = [
-        {"student_id": "1", "subject": f"Math (Range: {min_grade}-{max_grade})", "grade": str(min(95, max_grade))},
-        {"student_id": "2", "subject": "Science", "grade": str(min(87, max_grade))},
-        {"student_id": "3", "subject": "History", "grade": str(min(78, max_grade))}
-    ]
-    
-    # If Excel format is requested
-    if format.lower() == "excel":
-        try:
-            # Create Excel workbook and active sheet
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            
-            # Add headers
-            headers = ["student_id", "subject", "grade"]
-            for col_idx, header in enumerate(headers, 1):
-                sheet.cell(row=1, column=col_idx, value=header)
-            
-            # Add sample data
-            for row_idx, data_row in enumerate(sample_data, 2):
-                for col_idx, header in enumerate(headers, 1):
-                    sheet.cell(row=row_idx, column=col_idx, value=data_row[header])
-            
-            # Save to temporary file
-            with NamedTemporaryFile(delete=False, suffix='.xlsx') as temp:
-                temp_path = temp.name
-                workbook.save(temp_path)
-                
-            # Read the file and return it
-            with open(temp_path, "rb") as f:
-                excel_data = f.read()
-                
-            # Clean up the temporary file
-            import os
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-                
-            return StreamingResponse(
-                io.BytesIO(excel_data),
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": "attachment; filename=grade_upload_template.xlsx"}
-            )
-        except ImportError:
-            raise HTTPException(
-                status_code=400,
-                detail="Excel template requires the openpyxl package. Install with: pip install openpyxl"
-            )
-    
-    # Default to CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['student_id', 'subject', 'grade'])
-    
-    # Write sample data
-    for row in sample_data:
-        writer.writerow([row['student_id'], row['subject'], row['grade']])
-    
-    # Reset buffer position
-    output.seek(0)
-    
-    # Return CSV file
-    return StreamingResponse(
-        output, 
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=grade_upload_template.csv"}
-    )
+    # Ensure min_grade <= max_grade
+    if min_grade > max_grade:
+        raise HTTPException(
+            status_code=400,
+            detail=f"min_grade ({min_grade}) cannot be greater than max_grade ({max_grade})"
+        )
+    try:
+        template = grade_template(format.lower(), min_grade, max_grade)
+    except ImportError:
+        raise HTTPException(
+            status_code=400,
+            detail="Excel template requires the openpyxl package. Install with: pip install openpyxl"
+        )
+    return template_response(request, template, "private, max-age=86400, immutable")
 
 @app.get("/grades/{grade_id}/history", response_model=List[GradeHistoryResponse])
 def get_history_for_grade(
+    request: Request,
     grade_id: int = Path(..., gt=0), 
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_roles(["admin", "teacher"]))
 ):
     """Get the history/audit log for a specific grade."""
     history = get_grade_history(db, grade_id)
-    return [GradeHistoryResponse.from_orm(entry) for entry in history]
+    return negotiated_response(request, rows_to_dicts(history, GRADE_HISTORY_FIELDS))
 
 @app.get("/students/{student_id}/grades/history", response_model=List[GradeHistoryResponse])
 def get_history_for_student(
+    request: Request,
     student_id: int = Path(..., gt=0),
     subject: Optional[str] = None,
     start_date: Optional[str] = Query(None, description="Filter by start date (ISO format)"),
@@ -1017,10 +1539,11 @@ def get_history_for_student(
 ):
     """Get the grade history for a specific student with optional filters."""
     history = get_student_grade_history(db, student_id, subject, start_date, end_date)
-    return [GradeHistoryResponse.from_orm(entry) for entry in history]
+    return negotiated_response(request, rows_to_dicts(history, GRADE_HISTORY_FIELDS))
 
 @app.get("/admin/grades/history", response_model=PaginatedResponse)
 def get_all_grade_history_endpoint(  # ← Renamed function to avoid conflict
+    request: Request,
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     action: Optional[str] = Query(None),
@@ -1047,18 +1570,18 @@ def get_all_grade_history_endpoint(  # ← Renamed function to avoid conflict
     # Get paginated results - use imported function from crud.py
     from app.crud import get_all_grade_history as crud_get_all_grade_history  # Import with alias
     history = crud_get_all_grade_history(db, start_date, end_date, action, limit, offset)
-    history_responses = [GradeHistoryResponse.from_orm(entry) for entry in history]
+    history_responses = rows_to_dicts(history, GRADE_HISTORY_FIELDS)
     
     # Calculate total pages (safely)
     total_pages = (total + limit - 1) // limit if total > 0 else 1
     
-    return {
+    return negotiated_response(request, {
         "items": history_responses,
         "total": total,
         "page": page,
         "pages": total_pages,
         "limit": limit
-    }
+    })
 
 # ----------------------------
 # User Profile Endpoints
@@ -1186,14 +1709,14 @@ def create_new_course(
     course: CourseCreate,
     request: Request = None,
     db: Session = Depends(get_db),
-    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+    current_user: Principal = Depends(require_roles(["admin", "teacher"]))
 ):
     """Create a new course (admin and teachers only)"""
     user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
     
     # If a teacher is creating the course, automatically assign themselves
     teacher_id = None
-    if "teacher" in current_user.get("roles", []) and "admin" not in current_user.get("roles", []):
+    if current_user.has_any(Role.TEACHER) and not current_user.has_any(Role.ADMIN):
         teacher_id = course.teacher_id
     
     created_course = create_course(
@@ -1223,15 +1746,38 @@ def create_new_course(
     
     return created_course
 
-@app.get("/courses/", response_model=List[CourseResponse])
+@app.get("/courses/", response_model=Union[List[CourseResponse], CourseBatchResponse])
 def list_courses(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    ids: Optional[str] = Query(None, description="Comma-separated course IDs to fetch in one request"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_roles(["admin", "teacher", "student"]))
 ):
-    """List all available courses"""
-    return get_courses(db, skip=skip, limit=limit)
+    """
+    List all available courses.
+
+    With ``ids``, returns just those courses (in the requested order) and the
+    IDs that were not found.
+    """
+    etag = make_etag(request, get_versions(db, [COURSES_SCOPE]))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if ids is not None:
+        items, missing = get_courses_by_ids(db, parse_id_list(ids))
+        return negotiated_response(request, {"items": rows_to_dicts(items, COURSE_FIELDS), "missing": missing}, etag=etag)
+    return negotiated_response(request, rows_to_dicts(get_courses(db, skip=skip, limit=limit), COURSE_FIELDS), etag=etag)
+
+@app.post("/courses:batchGet", response_model=CourseBatchResponse)
+def batch_get_courses(
+    batch: BatchGetRequest,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher", "student"]))
+):
+    """Get several courses by ID in one request."""
+    items, missing = get_courses_by_ids(db, batch.ids)
+    return {"items": items, "missing": missing}
 
 @app.get("/courses/{course_id}", response_model=CourseResponse)
 def get_course_by_id(
@@ -1333,20 +1879,72 @@ def list_students_in_course(
     """Get all student IDs enrolled in a course (admin and teachers only)"""
     return get_students_in_course(db, course_id)
 
+@app.get("/courses/{course_id}/grade-template")
+def get_course_grade_template(
+    request: Request,
+    course_id: int = Path(..., gt=0),
+    format: str = Query("csv", pattern="^(csv|excel)$"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Get a grade upload template pre-filled with the course's enrolled students.
+
+    The template is cached until the course's enrollment changes; clients
+    revalidate it with If-None-Match.
+    """
+    course = get_course(db, course_id)
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    try:
+        template = roster_templates.get(db, course, format)
+    except ImportError:
+        raise HTTPException(
+            status_code=400,
+            detail="Excel template requires the openpyxl package. Install with: pip install openpyxl"
+        )
+    return template_response(request, template, "private, no-cache")
+
 @app.get("/students/{student_id}/courses", response_model=List[CourseResponse])
 def list_student_courses(
     student_id: int = Path(..., gt=0),
     db: Session = Depends(get_db),
-    current_user: dict = Depends(require_roles(["admin", "teacher", "student"]))
+    current_user: Principal = Depends(require_student_access("courses"))
 ):
     """Get all courses for a student"""
-    # If student is requesting, only show their own courses
-    if "student" in current_user.get("roles", []) and not any(role in ["admin", "teacher"] for role in current_user.get("roles", [])):
-        if str(current_user.get("uid")) != str(student_id):
-            raise HTTPException(status_code=403, detail="You can only view your own courses")
-        
     return get_courses_for_student(db, student_id)
 
+def event_stream_response(topics: List[str], last_event_id: Optional[str]) -> StreamingResponse:
+    # No database session is held for the life of the stream: these endpoints must not depend on get_db
+    return StreamingResponse(
+        stream_events(topics, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/students/{student_id}/events")
+def student_events(
+    student_id: int = Path(..., gt=0),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: Principal = Depends(require_student_access("events"))
+):
+    """
+    Server-sent event stream of a student's grade and enrollment changes.
+
+    Reconnecting clients send Last-Event-ID to receive the events they missed;
+    a "reset" event means the position is gone and current state must be refetched.
+    """
+    return event_stream_response([student_scope(student_id)], last_event_id)
+
+@app.get("/courses/{course_id}/events")
+def course_events(
+    course_id: int = Path(..., gt=0),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Server-sent event stream of a course's enrollment changes and its students' grade changes (admin and teachers only)"""
+    return event_stream_response([course_scope(course_id)], last_event_id)
+
 # Batch enrollment endpoint - useful for adding multiple students at once
 @app.post("/courses/{course_id}/students", response_model=dict)
 def batch_add_students(
@@ -1358,15 +1956,7 @@ def batch_add_students(
     """Add multiple students to a course at once"""
     user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
     
-    successful = []
-    failed = []
-    
-    for student_id in student_ids:
-        try:
-            add_student_to_course(db, student_id, course_id, added_by=user_identifier)
-            successful.append(student_id)
-        except ValueError as e:
-            failed.append({"student_id": student_id, "reason": str(e)})
+    successful, failed = bulk_add_students_to_course(db, student_ids, course_id, added_by=user_identifier)
     
     return {
         "message": f"Added {len(successful)} students to course {course_id}",
@@ -1380,27 +1970,35 @@ def batch_add_students(
 
 @app.get("/students/{student_id}/averages", response_model=StudentAverageResponse)
 def get_student_averages(
+    request: Request,
+    response: Response,
     student_id: int = Path(..., gt=0),
     course_id: Optional[int] = Query(None, description="Filter averages by course ID"),
+    as_of: Optional[datetime] = Query(None, description="Compute the averages from the grades as they stood at this moment"),
     db: Session = Depends(get_db),
-    current_user: dict = Depends(require_roles(["admin", "teacher", "student"]))
+    current_user: Principal = Depends(require_student_access("grade averages"))
 ):
     """
     Get a student's grade averages by subject and overall.
     
     Optionally filter by course if specified.
     """
-    # If student is requesting, only show their own averages
-    if "student" in current_user.get("roles", []) and not any(role in ["admin", "teacher"] for role in current_user.get("roles", [])):
-        if str(current_user.get("uid")) != str(student_id):
-            raise HTTPException(status_code=403, detail="You can only view your own grade averages")
-    
+    if as_of is not None:
+        return student_averages_as_of(db, student_id, history_timestamp(as_of), course_id)
+
+    scopes = [student_scope(student_id)] + ([course_scope(course_id)] if course_id else [])
+    etag = make_etag(request, get_versions(db, scopes))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(etag_headers(etag))
+
     # Calculate and return the averages
     return calculate_student_averages(db, student_id, course_id)
 
 @app.get("/courses/{course_id}/averages", response_model=CourseAverageResponse)
 def get_course_averages(
     course_id: int = Path(..., gt=0),
+    as_of: Optional[datetime] = Query(None, description="Compute the averages from the grades as they stood at this moment"),
     db: Session = Depends(get_db),
     current_user: dict = Depends(require_roles(["admin", "teacher"]))
 ):
@@ -1418,8 +2016,141 @@ def get_course_averages(
         raise HTTPException(status_code=404, detail="Course not found")
     
     # Calculate and return the averages
+    if as_of is not None:
+        return course_averages_as_of(db, course_id, history_timestamp(as_of))
     return calculate_course_averages(db, course_id)
 
+# ----------------------------
+# Transcript Endpoints
+# ----------------------------
+
+@app.put("/courses/{course_id}/credits", response_model=CourseCreditResponse)
+def update_course_credits(
+    course_id: int = Path(..., gt=0),
+    credits: CourseCreditUpdate = Body(...),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Set the credit hours and term weighting used for weighted GPA."""
+    try:
+        return set_course_credits(
+            db,
+            course_id,
+            credit_hours=credits.credit_hours,
+            term=credits.term,
+            term_weight=credits.term_weight
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/students/{student_id}/transcript", response_model=TranscriptResponse)
+def get_transcript(
+    student_id: int = Path(..., gt=0),
+    scale: str = Query("standard", description="Letter-grade scale to apply"),
+    db: Session = Depends(get_db),
+    current_user: Principal = Depends(require_student_access("transcript"))
+):
+    """
+    Get a student's weighted GPA transcript and class standing.
+
+    Standing is computed against every enrolled student in the school.
+    """
+    try:
+        grade_scale = GradeScale.named(scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return get_student_transcript(db, student_id, grade_scale)
+
+@app.post("/transcripts/batch", response_model=TranscriptBatchResponse)
+def batch_transcripts(
+    batch: TranscriptBatchRequest = Body(...),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Compute transcripts for a whole cohort in one pass.
+
+    The cohort is every enrolled student, optionally narrowed to the given
+    student IDs and/or the students of one course. Class standing is ranked
+    within the cohort. Large cohorts are computed across a process pool.
+    """
+    try:
+        grade_scale = GradeScale.named(batch.scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    inputs = load_transcript_inputs(db, student_ids=batch.student_ids, course_id=batch.course_id)
+    transcripts = compute_transcripts(inputs, grade_scale)
+
+    return {
+        "scale": batch.scale,
+        "total_students": len(transcripts),
+        "transcripts": transcripts
+    }
+
+# ----------------------------
+# Report Card Export Endpoints
+# ----------------------------
+
+def _export_job_response(job: dict) -> dict:
+    """Add the download link to finished export jobs."""
+    response = dict(job)
+    if job["status"] == "complete":
+        response["download_url"] = f"/exports/{job['id']}/download"
+    return response
+
+@app.post("/exports/report-cards", response_model=ExportJobResponse, status_code=202)
+def export_report_cards(
+    background_tasks: BackgroundTasks,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    course_id: Optional[int] = Query(None, gt=0, description="Limit the export to one course"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """
+    Start a report-card export for a course or the whole school.
+
+    The gradebook (per-student, per-subject and overall averages) is generated
+    in the background. Poll GET /exports/{job_id} until it is complete and then
+    download it from the returned download_url.
+    """
+    if course_id and not get_course(db, course_id):
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    user_identifier = current_user.get("email", current_user.get("uid", "unknown"))
+    job = create_export_job(format, course_id=course_id, requested_by=user_identifier)
+
+    # The request session is closed before background tasks run, so the job opens its own
+    background_tasks.add_task(run_export_job, job["id"], sessionmaker(bind=db.get_bind()))
+    return _export_job_response(job)
+
+@app.get("/exports/{job_id}", response_model=ExportJobResponse)
+def get_export_status(
+    job_id: str = Path(...),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Get the status of a report-card export job."""
+    job = get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return _export_job_response(job)
+
+@app.get("/exports/{job_id}/download")
+def download_export(
+    job_id: str = Path(...),
+    current_user: dict = Depends(require_roles(["admin", "teacher"]))
+):
+    """Download a finished report-card export."""
+    job = get_export_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job["status"] != "complete":
+        raise HTTPException(status_code=409, detail=f"Export is not ready (status: {job['status']})")
+
+    media_type, _ = EXPORT_FORMATS[job["format"]]
+    return FileResponse(job["file"], media_type=media_type, filename=job["filename"])
+
 # ----------------------------
 # Student Management Endpoints
 # ----------------------------
@@ -1428,6 +2159,59 @@ def get_course_averages(
 def create_student_endpoint(name: str, email: str, date_of_birth: str, db: Session = Depends(get_db)):
     return create_student(db, name, email, date_of_birth)
 
+@app.post("/students/import", response_model=BulkUploadResponse)
+def import_students(
+    file: UploadFile = File(...),
+    request: Request = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """
+    Bulk import students from a CSV, Excel or NDJSON file.
+
+    The file needs name and email columns and may include date_of_birth
+    (YYYY-MM-DD). It is parsed as a stream and inserted in chunks; rows that
+    fail validation or use an already registered email are reported per row.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    try:
+        rows = iter_rows(file.file, file.filename)
+        processed, created, errors = bulk_import_students(db, rows)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    log_activity(
+        db=db,
+        action="import_students",
+        user_id=current_user.get("uid"),
+        user_email=current_user.get("email", current_user.get("uid", "unknown")),
+        resource_type="student",
+        details={
+            "filename": file.filename,
+            "processed": processed,
+            "created": created,
+            "failed": processed - created
+        },
+        ip_address=get_request_ip(request) if request else None,
+        user_agent=request.headers.get("user-agent") if request else None,
+        status_code=200
+    )
+
+    response = {
+        "total_processed": processed,
+        "successful": created,
+        "failed": processed - created,
+    }
+    if errors:
+        # Keep the response bounded for very large files
+        if len(errors) > MAX_REPORTED_IMPORT_ERRORS:
+            hidden = len(errors) - MAX_REPORTED_IMPORT_ERRORS
+            errors = errors[:MAX_REPORTED_IMPORT_ERRORS] + [f"... and {hidden} more errors"]
+        response["errors"] = errors
+    return response
+
 @app.get("/students/{student_id}", response_model=Student)
 def get_student_endpoint(student_id: int, db: Session = Depends(get_db)):
     student = get_student(db, student_id)
@@ -1435,10 +2219,24 @@ def get_student_endpoint(student_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Student not found")
     return student
 
-@app.get("/students", response_model=List[Student])
-def get_students_endpoint(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
+@app.get("/students", response_model=Union[List[Student], StudentBatchResponse])
+def get_students_endpoint(
+    skip: int = 0,
+    limit: int = 10,
+    ids: Optional[str] = Query(None, description="Comma-separated student IDs to fetch in one request"),
+    db: Session = Depends(get_db)
+):
+    if ids is not None:
+        items, missing = get_students_by_ids(db, parse_id_list(ids))
+        return {"items": items, "missing": missing}
     return get_students(db, skip, limit)
 
+@app.post("/students:batchGet", response_model=StudentBatchResponse)
+def batch_get_students(batch: BatchGetRequest, db: Session = Depends(get_db)):
+    """Get several students by ID in one request, e.g. to render a course roster."""
+    items, missing = get_students_by_ids(db, batch.ids)
+    return {"items": items, "missing": missing}
+
 @app.put("/students/{student_id}", response_model=Student)
 def update_student_endpoint(student_id: int, name: str = None, email: str = None, date_of_birth: str = None, db: Session = Depends(get_db)):
     student = update_student(db, student_id, name, email, date_of_birth)
@@ -1583,6 +2381,82 @@ def export_logs(
             headers={"Content-Disposition": f"attachment; filename=logs_{datetime.now().strftime('%Y%m%d')}.csv"}
         )
 
+# ----------------------------
+# Profiling Endpoints
+# ----------------------------
+
+class RequestProfileRequest(BaseModel):
+    route: str = Field(..., description="Route template to profile, e.g. /grades/{student_id}")
+    count: int = Field(1, ge=1, le=profiling.MAX_PROFILED_REQUESTS)
+
+def require_profiling_enabled():
+    """Hide the profiling endpoints unless PROFILING_ENABLED=1."""
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/admin/profile/cpu", response_class=PlainTextResponse, dependencies=[Depends(require_profiling_enabled)])
+async def profile_cpu(
+    seconds: float = Query(5, gt=0, le=profiling.MAX_SAMPLE_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """Sample all worker threads for a while and return collapsed stacks."""
+    return await profiling.sample_cpu_in_thread(seconds, interval_ms / 1000)
+
+@app.post("/admin/profile/requests", response_model=dict, dependencies=[Depends(require_profiling_enabled)])
+def arm_request_profiler(
+    profile_request: RequestProfileRequest,
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """Capture a cProfile of the next N requests matching a route template."""
+    routes = {route.path for route in app.routes}
+    if profile_request.route not in routes:
+        raise HTTPException(status_code=400, detail=f"Unknown route: {profile_request.route}")
+    profiling.request_profiler.arm(profile_request.route, profile_request.count)
+    return profiling.request_profiler.status()
+
+@app.get("/admin/profile/requests", response_class=PlainTextResponse, dependencies=[Depends(require_profiling_enabled)])
+def get_request_profile(
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls)$"),
+    limit: int = Query(50, ge=1, le=500),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """Return the combined pstats output of the captured requests."""
+    status_line = profiling.request_profiler.status()
+    return f"{status_line}\n\n" + profiling.request_profiler.report(sort, limit)
+
+@app.delete("/admin/profile/requests", response_model=dict, dependencies=[Depends(require_profiling_enabled)])
+def reset_request_profiler(current_user: dict = Depends(require_roles(["admin"]))):
+    """Disarm the request profiler and discard captured profiles."""
+    profiling.request_profiler.reset()
+    return profiling.request_profiler.status()
+
+@app.post("/admin/profile/memory/start", response_model=dict, dependencies=[Depends(require_profiling_enabled)])
+def start_memory_tracking(
+    frames: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """Start tracemalloc and take the baseline snapshot."""
+    profiling.memory_tracker.start(frames)
+    return {"message": "Memory tracking started"}
+
+@app.get("/admin/profile/memory/diff", response_class=PlainTextResponse, dependencies=[Depends(require_profiling_enabled)])
+def memory_diff(
+    limit: int = Query(25, ge=1, le=500),
+    current_user: dict = Depends(require_roles(["admin"]))
+):
+    """Compare the current allocations with the baseline snapshot."""
+    try:
+        return profiling.memory_tracker.diff(limit)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/profile/memory/stop", response_model=dict, dependencies=[Depends(require_profiling_enabled)])
+def stop_memory_tracking(current_user: dict = Depends(require_roles(["admin"]))):
+    """Stop tracemalloc and drop the baseline snapshot."""
+    profiling.memory_tracker.stop()
+    return {"message": "Memory tracking stopped"}
+
 # ----------------------------
 # HTTPS Entry Point
 # ----------------------------
@@ -0,0 +1,259 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Set, Tuple
+from app.query_stats import QueryStats, current_query_stats, request_observers
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """
+    In-process metrics registry rendered in Prometheus text format.
+
+    Every thread writes to its own shard, so recording a counter or histogram
+    sample never takes a lock. Shards are only merged when /metrics is
+    scraped. A lock is taken once per thread, when its shard is created.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards: List[Dict[str, dict]] = []
+        self._shards_lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._callbacks: Dict[str, Callable[[], float]] = {}
+
+    def _shard(self) -> Dict[str, dict]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {"counter": {}, "gauge": {}, "histogram": {}}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def describe(self, name: str, metric_type: str, help_text: str) -> None:
+        """Register the TYPE and HELP lines of a metric."""
+        self._help[name] = (metric_type, help_text)
+
+    def inc(self, name: str, labels: LabelSet = (), value: float = 1.0) -> None:
+        """Increment a counter."""
+        counters = self._shard()["counter"]
+        key = (name, labels)
+        counters[key] = counters.get(key, 0.0) + value
+
+    def gauge_add(self, name: str, delta: float, labels: LabelSet = ()) -> None:
+        """Move a gauge up or down (e.g. +1 when a job is queued, -1 when it finishes)."""
+        gauges = self._shard()["gauge"]
+        key = (name, labels)
+        gauges[key] = gauges.get(key, 0.0) + delta
+
+    def register_gauge(self, name: str, callback: Callable[[], float], help_text: str = "") -> None:
+        """Register a gauge whose value is read from ``callback`` at scrape time."""
+        self.describe(name, "gauge", help_text)
+        self._callbacks[name] = callback
+
+    def observe(self, name: str, value: float, labels: LabelSet = ()) -> None:
+        """Record a histogram sample."""
+        histograms = self._shard()["histogram"]
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            # Bucket counts (last one is +Inf), then sum and count
+            histogram = histograms[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        histogram[bisect_left(self.buckets, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+    def record_cache(self, cache: str, hit: bool) -> None:
+        """Count a cache lookup; hit ratios are derived from these counters."""
+        self.inc("cache_requests_total", (("cache", cache), ("result", "hit" if hit else "miss")))
+
+    def _merged(self):
+        counters: Dict[tuple, float] = {}
+        gauges: Dict[tuple, float] = {}
+        histograms: Dict[tuple, list] = {}
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # list() snapshots a dict atomically under the GIL
+            for key, value in list(shard["counter"].items()):
+                counters[key] = counters.get(key, 0.0) + value
+            for key, value in list(shard["gauge"].items()):
+                gauges[key] = gauges.get(key, 0.0) + value
+            for key, values in list(shard["histogram"].items()):
+                values = list(values)
+                merged = histograms.get(key)
+                histograms[key] = values if merged is None else [a + b for a, b in zip(merged, values)]
+        return counters, gauges, histograms
+
+    def snapshot(self) -> Dict[str, Dict[tuple, float]]:
+        """Merged counter and gauge values keyed by (name, labels), mainly for tests."""
+        counters, gauges, _ = self._merged()
+        return {"counters": counters, "gauges": gauges}
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        counters, gauges, histograms = self._merged()
+        lines: List[str] = []
+        described = set()
+
+        def header(name: str, default_type: str) -> None:
+            if name in described:
+                return
+            described.add(name)
+            metric_type, help_text = self._help.get(name, (default_type, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, callback in sorted(self._callbacks.items()):
+            try:
+                value = callback()
+            except Exception:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name} {_format_value(value)}")
+
+        for (name, labels), values in sorted(histograms.items()):
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+registry = MetricsRegistry()
+
+registry.describe("http_requests_total", "counter", "HTTP requests by method, route template and status")
+registry.describe("http_request_duration_seconds", "histogram", "HTTP request latency by method, route template and status")
+registry.describe("http_request_db_seconds", "histogram", "Database time spent per HTTP request by route template")
+registry.describe("cache_requests_total", "counter", "Cache lookups by cache and result (hit or miss)")
+registry.describe("db_queries_total", "counter", "SQL statements executed by route template")
+registry.describe("db_rows_total", "counter", "Rows written or ORM rows loaded by route template")
+registry.describe("db_repeated_statement_requests_total", "counter", "Requests that ran one statement shape more than QUERY_REPEAT_THRESHOLD times")
+
+# ----------------------------
+# ASGI middleware
+# ----------------------------
+
+DEBUG_HEADERS = os.getenv("DEBUG") == "1"
+# Distinct (route, statement) N+1 warnings printed per process; the counter keeps counting after that
+MAX_REPEAT_WARNINGS = 1000
+
+
+class MetricsMiddleware:
+    """
+    Record request counts, latency, queries and DB time per route template and status.
+
+    Implemented as a plain ASGI middleware (no BaseHTTPMiddleware task
+    switching) so that instrumentation stays cheap. In debug mode
+    (DEBUG=1) the query statistics are also returned as response headers.
+    Possible N+1 patterns are counted on every request but printed only
+    once per route and statement shape.
+    """
+
+    def __init__(self, app, metrics: MetricsRegistry = registry):
+        self.app = app
+        self.metrics = metrics
+        self._warned: Set[Tuple[str, str]] = set()
+        self._warned_lock = threading.Lock()
+
+    def _first_warning(self, route_label: str, shape: str) -> bool:
+        key = (route_label, shape)
+        if key in self._warned:
+            return False
+        with self._warned_lock:
+            if key in self._warned or len(self._warned) >= MAX_REPEAT_WARNINGS:
+                return False
+            self._warned.add(key)
+            return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_holder = [500]
+        stats = QueryStats()
+        token = current_query_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                if DEBUG_HEADERS:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + _debug_headers(stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_stats.reset(token)
+            elapsed = time.perf_counter() - start_time
+            route = scope.get("route")
+            # Use the route template (e.g. /grades/{student_id}) to keep label cardinality bounded
+            route_label = getattr(route, "path", None) or "unmatched"
+            route_labels = (("route", route_label),)
+            labels = (("method", scope["method"]), route_labels[0], ("status", str(status_holder[0])))
+            self.metrics.inc("http_requests_total", labels)
+            self.metrics.observe("http_request_duration_seconds", elapsed, labels)
+            self.metrics.observe("http_request_db_seconds", stats.db_time, route_labels)
+            self.metrics.inc("db_queries_total", route_labels, stats.count)
+            self.metrics.inc("db_rows_total", route_labels, stats.rows)
+
+            repeated = stats.repeated_statements()
+            if repeated:
+                self.metrics.inc("db_repeated_statement_requests_total", route_labels)
+                shape, count = repeated[0]
+                if self._first_warning(route_label, shape):
+                    print(f"Possible N+1 in {scope['method']} {route_label}: statement ran {count} times: {shape[:200]}")
+
+            for observer in request_observers:
+                observer(scope, stats)
+
+
+def _debug_headers(stats: QueryStats) -> List[Tuple[bytes, bytes]]:
+    headers = [
+        (b"x-query-count", str(stats.count).encode()),
+        (b"x-query-rows", str(stats.rows).encode()),
+        (b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()),
+    ]
+    repeated = stats.repeated_statements()
+    if repeated:
+        headers.append((b"x-query-repeated", str(repeated[0][1]).encode()))
+    return headers
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from app.database import ActivityLog, OutboxEvent, SessionLocal, StudentCourse
+from app.events import ChangeBroker, broker
+from app.logging_utils import activity_log_values
+from app.metrics import registry as metrics
+from app.versions import course_scope, student_scope
+
+# Outbox rows relayed per transaction
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Upper bound on relay latency if a commit's wake-up is missed (e.g. written by another process)
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "1.0"))
+
+# Outbox events that only carry an activity log
+ACTIVITY_EVENT = "activity"
+
+metrics.describe("outbox_events_relayed_total", "counter", "Outbox events relayed to activity logs and the change feed")
+metrics.describe("outbox_relay_errors_total", "counter", "Outbox relay batches that failed and will be retried")
+
+
+def enqueue(db: Session, event_type: str, data: Dict[str, Any], activity: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Record a side effect of the caller's write in the same transaction.
+
+    Nothing is committed here: the event becomes visible to the relay
+    together with the change it describes, or not at all. ``activity`` holds
+    log_activity keyword arguments; the relay writes them as an activity log.
+    """
+    db.add(OutboxEvent(
+        event_type=event_type,
+        payload=json.dumps({"data": data, "activity": activity}),
+        created_at=datetime.now().isoformat()
+    ))
+    db.info["outbox_pending"] = True
+
+
+def enqueue_many(db: Session, event_type: str, items: Iterable[Dict[str, Any]]) -> None:
+    """enqueue() for many events of one type, as a single executemany insert."""
+    created_at = datetime.now().isoformat()
+    rows = [
+        {"event_type": event_type, "payload": json.dumps({"data": data, "activity": None}), "created_at": created_at}
+        for data in items
+    ]
+    if rows:
+        db.execute(insert(OutboxEvent), rows)
+        db.info["outbox_pending"] = True
+
+
+def enqueue_activity(db: Session, activity: Dict[str, Any]) -> None:
+    """enqueue() an activity log on its own, e.g. one summarizing a batch; it is not published to the change feed."""
+    enqueue(db, ACTIVITY_EVENT, {}, activity)
+
+
+def _course_topics_by_student(db: Session, student_ids: List[int]) -> Dict[int, List[str]]:
+    # Course feeds carry their students' grade changes; only look up enrollments while someone listens
+    topics = defaultdict(list)
+    if student_ids and broker.has_subscribers("course:"):
+        rows = db.query(StudentCourse.student_id, StudentCourse.course_id).filter(StudentCourse.student_id.in_(student_ids))
+        for student_id, course_id in rows:
+            topics[student_id].append(course_scope(course_id))
+    return topics
+
+
+def _event_topics(event_type: str, data: Dict[str, Any], course_topics: Dict[int, List[str]]) -> List[str]:
+    if event_type.startswith("enrollment."):
+        return [student_scope(data["student_id"]), course_scope(data["course_id"])]
+    return [student_scope(data["student_id"])] + course_topics.get(data["student_id"], [])
+
+
+def process_outbox(db: Session, batch_size: int = OUTBOX_BATCH_SIZE, change_broker: ChangeBroker = broker) -> int:
+    """
+    Relay one batch of outbox events; returns how many were relayed.
+
+    The batch's activity logs are inserted and its outbox rows deleted in
+    one transaction. Rows are claimed by that delete, so a second relay
+    racing for the same rows rolls back instead of logging them twice.
+    Change-feed events are published after the commit: the feed is
+    in-memory and best effort, while activity logs are written exactly once.
+    """
+    rows = db.query(OutboxEvent).order_by(OutboxEvent.id).limit(batch_size).all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    events = [(row.event_type, json.loads(row.payload), row.created_at) for row in rows]
+    ids = [row.id for row in rows]
+    claimed = db.query(OutboxEvent).filter(OutboxEvent.id.in_(ids)).delete(synchronize_session=False)
+    if claimed != len(ids):
+        db.rollback()
+        return 0
+
+    logs = [
+        activity_log_values(timestamp=created_at, **payload["activity"])
+        for _, payload, created_at in events
+        if payload["activity"]
+    ]
+    if logs:
+        db.execute(insert(ActivityLog), logs)
+    course_topics = _course_topics_by_student(db, list({
+        payload["data"]["student_id"] for event_type, payload, _ in events if event_type.startswith("grade.")
+    }))
+    db.commit()
+
+    for event_type, payload, _ in events:
+        if event_type == ACTIVITY_EVENT:
+            continue
+        change_broker.publish(event_type, _event_topics(event_type, payload["data"], course_topics), payload["data"])
+    metrics.inc("outbox_events_relayed_total", value=len(events))
+    return len(events)
+
+
+class OutboxRelay:
+    """
+    Background thread that drains the outbox.
+
+    Commits that enqueued events wake it immediately (see _wake_relay);
+    otherwise it polls every ``poll_seconds``. Callables in ``on_relayed``
+    run on the relay thread, with the session factory, after a drain that
+    relayed anything.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = OUTBOX_BATCH_SIZE, poll_seconds: float = OUTBOX_POLL_SECONDS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.on_relayed: List[Callable[[Any], Any]] = []
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def drain(self) -> int:
+        """Relay until the outbox is empty; returns the number of events relayed."""
+        total = 0
+        db = self.session_factory()
+        try:
+            while True:
+                relayed = process_outbox(db, self.batch_size)
+                if not relayed:
+                    return total
+                total += relayed
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            try:
+                if self.drain():
+                    for callback in self.on_relayed:
+                        callback(self.session_factory)
+            except Exception as e:
+                # The rows stay in the outbox and are retried on the next poll
+                metrics.inc("outbox_relay_errors_total")
+                print(f"Error relaying outbox events: {str(e)}")
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread, then relay whatever is still pending."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+
+
+relay = OutboxRelay()
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay(session: Session) -> None:
+    if session.info.pop("outbox_pending", False):
+        relay.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_pending(session: Session) -> None:
+    session.info.pop("outbox_pending", None)
@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+from passlib.context import CryptContext
+from app.metrics import registry as metrics
+
+# bcrypt runs in worker processes so a burst of signups cannot occupy the request threadpool
+# or hold the GIL; 0 workers hashes inline on the request thread
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hash requests allowed in flight (running or queued) before new ones are rejected with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(PASSWORD_HASH_WORKERS, 1) * 4)))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+metrics.describe("password_hash_pending", "gauge", "Password hash/verify operations running or queued in the hashing pool")
+metrics.describe("password_hash_rejected_total", "counter", "Password hash/verify operations rejected because the pool was saturated")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing pool already has the maximum number of operations in flight."""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords in a bounded process pool.
+
+    At most ``max_pending`` operations are admitted at once; further calls
+    fail immediately with PasswordHasherBusy instead of queueing, so request
+    threads never pile up behind bcrypt.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING, timeout: float = PASSWORD_HASH_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _release(self, _: Optional[Future] = None) -> None:
+        metrics.gauge_add("password_hash_pending", -1)
+        self._slots.release()
+
+    def _run(self, func: Callable[..., Any], *args) -> Any:
+        if self.workers <= 0:
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            metrics.inc("password_hash_rejected_total")
+            raise PasswordHasherBusy(f"{self.max_pending} password operations already in flight")
+        metrics.gauge_add("password_hash_pending", 1)
+        try:
+            future = self._get_executor().submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        # The slot is held until the worker finishes, even if this caller times out
+        future.add_done_callback(self._release)
+        return future.result(timeout=self.timeout)
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run(_verify, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,54 @@
+from enum import IntFlag
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Union
+
+
+class Role(IntFlag):
+    ADMIN = 1
+    TEACHER = 2
+    STUDENT = 4
+
+
+ROLE_BITS = {role.name.lower(): role for role in Role}
+
+# Roles that may read any student's records
+STAFF = Role.ADMIN | Role.TEACHER
+
+
+@lru_cache(maxsize=1024)
+def _mask_for(roles: tuple) -> int:
+    mask = 0
+    for role in roles:
+        mask |= ROLE_BITS.get(role, 0)
+    return mask
+
+
+def role_mask(roles: Union[str, Iterable[str], None]) -> int:
+    """Bitset of the known roles in a "roles" claim (a single role name or a list)."""
+    if not roles:
+        return 0
+    if isinstance(roles, str):
+        roles = (roles,)
+    return _mask_for(tuple(roles))
+
+
+class Principal(dict):
+    """
+    Verified token claims with the caller's roles resolved to a bitset.
+
+    Still a dict of the original claims, so endpoints reading
+    ``current_user.get("email")`` keep working; permission checks use
+    ``role_mask`` instead of re-scanning the "roles" list.
+    """
+
+    def __init__(self, claims: Dict[str, Any]):
+        super().__init__(claims)
+        self.uid = str(claims.get("uid"))
+        self.role_mask = role_mask(claims.get("roles"))
+
+    def has_any(self, mask: int) -> bool:
+        return bool(self.role_mask & mask)
+
+    def can_access_student(self, student_id: int) -> bool:
+        """Ownership rule: staff see every student, students only themselves."""
+        return self.has_any(STAFF) or self.uid == str(student_id)
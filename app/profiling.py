@@ -0,0 +1,197 @@
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+from fastapi.routing import APIRoute
+
+# Profiling is opt-in: nothing in this module touches the request path unless enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "1"
+
+MAX_SAMPLE_SECONDS = 30
+MAX_PROFILED_REQUESTS = 100
+
+
+def sample_cpu(seconds: float, interval: float = 0.01) -> str:
+    """
+    Sample the stacks of all other threads and return them as collapsed stacks.
+
+    The output has one "frame;frame;frame count" line per distinct stack,
+    outermost frame first, ready for flamegraph tools.
+
+    Args:
+        seconds: How long to sample for
+        interval: Delay between samples in seconds
+    """
+    own_thread = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+async def sample_cpu_in_thread(seconds: float, interval: float = 0.01) -> str:
+    """
+    sample_cpu() on a thread of its own.
+
+    Running it in the request threadpool would take a worker away from the
+    requests being sampled for the whole duration.
+    """
+    loop = asyncio.get_running_loop()
+    result: asyncio.Future = loop.create_future()
+
+    def run() -> None:
+        try:
+            stacks = sample_cpu(seconds, interval)
+        except BaseException as e:
+            loop.call_soon_threadsafe(result.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(result.set_result, stacks)
+
+    threading.Thread(target=run, name="cpu-sampler", daemon=True).start()
+    return await result
+
+
+class RequestProfiler:
+    """Captures cProfile data for the next N requests to one route template."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.route: Optional[str] = None
+        self.remaining = 0
+        self.captured: List[pstats.Stats] = []
+
+    def arm(self, route: str, count: int) -> None:
+        with self._lock:
+            self.route = route
+            self.remaining = count
+            self.captured = []
+
+    def reset(self) -> None:
+        with self._lock:
+            self.route = None
+            self.remaining = 0
+            self.captured = []
+
+    def claim(self, route: str) -> bool:
+        """Reserve one capture slot for a request to ``route``."""
+        if self.route != route:
+            return False
+        with self._lock:
+            if self.route != route or self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def record(self, profile: cProfile.Profile) -> None:
+        with self._lock:
+            self.captured.append(pstats.Stats(profile))
+
+    def status(self) -> Dict[str, Any]:
+        return {"route": self.route, "remaining": self.remaining, "captured": len(self.captured)}
+
+    def report(self, sort: str = "cumulative", limit: int = 50) -> str:
+        """Combined pstats output of all captured requests."""
+        with self._lock:
+            captured = list(self.captured)
+        if not captured:
+            return "No requests captured yet\n"
+        output = io.StringIO()
+        stats = pstats.Stats(stream=output)
+        stats.add(*captured)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfilingRoute(APIRoute):
+    """
+    APIRoute that can profile its endpoint when armed by request_profiler.
+
+    Only installed as the router's route_class when PROFILING_ENABLED is set,
+    so disabled deployments run the original endpoint functions unchanged.
+    The profiler wraps the endpoint call itself, which for sync endpoints
+    runs in the worker thread that cProfile needs to observe.
+    """
+
+    def get_route_handler(self) -> Callable:
+        endpoint = self.dependant.call
+        route = self.path
+
+        if asyncio.iscoroutinefunction(endpoint):
+            @wraps(endpoint)
+            async def profiled_endpoint(*args, **kwargs):
+                if not request_profiler.claim(route):
+                    return await endpoint(*args, **kwargs)
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    return await endpoint(*args, **kwargs)
+                finally:
+                    profile.disable()
+                    request_profiler.record(profile)
+        else:
+            @wraps(endpoint)
+            def profiled_endpoint(*args, **kwargs):
+                if not request_profiler.claim(route):
+                    return endpoint(*args, **kwargs)
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(endpoint, *args, **kwargs)
+                finally:
+                    request_profiler.record(profile)
+
+        self.dependant.call = profiled_endpoint
+        return super().get_route_handler()
+
+
+class MemoryTracker:
+    """tracemalloc baseline and diff helper for hunting memory growth."""
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames: int = 10) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self) -> None:
+        self.baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def diff(self, limit: int = 25) -> str:
+        """Top allocation differences between the baseline and now."""
+        if self.baseline is None or not tracemalloc.is_tracing():
+            raise ValueError("Memory tracking is not started")
+        current = tracemalloc.take_snapshot()
+        differences = current.compare_to(self.baseline, "lineno")
+        current_size, peak_size = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: current={current_size} bytes, peak={peak_size} bytes"]
+        lines.extend(str(difference) for difference in differences[:limit])
+        return "\n".join(lines) + "\n"
+
+
+memory_tracker = MemoryTracker()
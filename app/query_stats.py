@@ -0,0 +1,75 @@
+import os
+import re
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+# A request running the same statement shape more than this many times is flagged as a likely N+1
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "10"))
+
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)")
+_NUMBER = re.compile(r"\b\d+\b")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Normalize SQL so statements differing only in IN-list length or literals compare equal."""
+    shape = _PLACEHOLDER_LIST.sub("(?)", statement)
+    shape = _NUMBER.sub("N", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """Queries, rows and database time accumulated during one request."""
+
+    __slots__ = ("count", "rows", "db_time", "shapes", "_starts")
+
+    def __init__(self):
+        self.count = 0
+        self.rows = 0  # Rows written (cursor rowcount) plus ORM instances loaded
+        self.db_time = 0.0
+        self.shapes: Dict[str, int] = {}
+        self._starts: List[float] = []
+
+    def repeated_statements(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes executed more than ``threshold`` times, most frequent first."""
+        repeated = [(shape, count) for shape, count in self.shapes.items() if count > threshold]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+
+# Set by the metrics middleware for the duration of a request. Sync endpoints
+# run in a threadpool with a copy of the context, so they update the same object.
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+# Callables notified with (scope, stats) after every request, e.g. by the query_budget test fixture
+request_observers: List[Callable[[dict, QueryStats], None]] = []
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats._starts.append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is None or not stats._starts:
+        return
+    stats.db_time += time.perf_counter() - stats._starts.pop()
+    stats.count += 1
+    if cursor.rowcount and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    shape = statement_shape(statement)
+    stats.shapes[shape] = stats.shapes.get(shape, 0) + 1
+
+
+@event.listens_for(Mapper, "load")
+def _on_instance_load(target, context):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.rows += 1
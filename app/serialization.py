@@ -0,0 +1,97 @@
+import hashlib
+import json
+from operator import attrgetter, itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt, stdlib json is the fallback
+    orjson = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def response_fields(model: Type[BaseModel]) -> Tuple[str, ...]:
+    """Field names of a response model, in declaration order."""
+    return tuple(model.model_fields)
+
+
+def rows_to_dicts(rows: Iterable[Any], fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """
+    Copy the given attributes of trusted ORM rows into plain dicts.
+
+    This replaces ``Model.from_orm(row)`` per row for list endpoints whose
+    rows come straight from our own tables, so no validation is needed.
+    """
+    fields = tuple(fields)
+    # Loaded column values sit in the instance __dict__; reading them there skips the
+    # instrumented attribute descriptors. Expired or deferred attributes fall back to getattr.
+    read_loaded = itemgetter(*fields)
+    read_attributes = attrgetter(*fields)
+    if len(fields) == 1:
+        read_loaded = lambda values, _get=read_loaded: (_get(values),)
+        read_attributes = lambda row, _get=read_attributes: (_get(row),)
+    result = []
+    for row in rows:
+        try:
+            values = read_loaded(row.__dict__)
+        except KeyError:
+            values = read_attributes(row)
+        result.append(dict(zip(fields, values)))
+    return result
+
+
+def encode_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+
+def negotiated_response(request: Request, content: Any, status_code: int = 200, etag: Optional[str] = None) -> Response:
+    """
+    Encode ``content`` as msgpack if the client asked for it, otherwise as JSON.
+
+    The endpoint's ``response_model`` still documents the shape; returning a
+    Response skips FastAPI re-validating and re-encoding every row.
+    """
+    headers = {"Vary": "Accept"}
+    if etag:
+        headers.update(etag_headers(etag))
+    if wants_msgpack(request):
+        import msgpack
+        return Response(msgpack.packb(content), status_code=status_code, media_type="application/msgpack", headers=headers)
+    return Response(encode_json(content), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def make_etag(request: Request, versions: Dict[str, int]) -> str:
+    """Strong ETag for a representation built from data at the given scope versions."""
+    representation = "msgpack" if wants_msgpack(request) else "json"
+    state = ",".join(f"{scope}={version}" for scope, version in sorted(versions.items()))
+    return '"' + hashlib.sha1(f"{representation}|{state}".encode()).hexdigest() + '"'
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    # no-cache: browsers may keep the body but must revalidate it on every poll
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match already names ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"Vary": "Accept", **etag_headers(etag)})
@@ -0,0 +1,216 @@
+import json
+import os
+import re
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+import jwt
+from cryptography import x509
+from app.auth import ExpiredIdTokenError, InvalidIdTokenError, TokenVerificationUnavailable
+from app.metrics import registry as metrics
+
+# Google's x509 certificates for Firebase ID tokens, keyed by "kid"
+SECURETOKEN_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+
+KEY_CACHE_PATH = os.getenv("FIREBASE_KEY_CACHE", ".cache/securetoken_certs.json")
+# Refresh this long before the certificates' max-age runs out
+REFRESH_MARGIN = 300
+# Wait between retries after a failed refresh, growing up to the maximum
+RETRY_MIN_SECONDS = 30
+RETRY_MAX_SECONDS = 600
+# An unknown "kid" triggers an immediate refresh at most this often
+UNKNOWN_KID_REFRESH_INTERVAL = 60
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+
+# (certificates as {kid: PEM}, max-age in seconds)
+CertificateFetcher = Callable[[], Tuple[Dict[str, str], int]]
+
+metrics.describe("token_key_refresh_total", "counter", "Signing certificate refreshes by result")
+
+
+def fetch_securetoken_certificates(timeout: float = 5.0) -> Tuple[Dict[str, str], int]:
+    """Download Google's signing certificates and their Cache-Control max-age."""
+    with urllib.request.urlopen(SECURETOKEN_CERTS_URL, timeout=timeout) as response:
+        certificates = json.loads(response.read())
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return certificates, int(match.group(1)) if match else 3600
+
+
+class KeyCache:
+    """
+    Signing keys by "kid", refreshed in the background and persisted to disk.
+
+    Certificates are parsed into public key objects once per refresh, not per
+    token. When a refresh fails the previous keys stay in use, even past their
+    max-age, and the refresh is retried with backoff. The on-disk copy lets a
+    restarted worker verify tokens before its first fetch completes.
+    """
+
+    def __init__(self, fetch: CertificateFetcher = fetch_securetoken_certificates, cache_path: Optional[str] = KEY_CACHE_PATH):
+        self.fetch = fetch
+        self.cache_path = cache_path
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._last_attempt = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._load_from_disk()
+
+    def _install(self, certificates: Dict[str, str], expires_at: float) -> None:
+        keys = {
+            kid: x509.load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in certificates.items()
+        }
+        with self._lock:
+            self._keys = keys
+            self._expires_at = expires_at
+
+    def _load_from_disk(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                cached = json.load(f)
+            self._install(cached["certificates"], cached["expires_at"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable signing key cache {self.cache_path}: {e}")
+
+    def _save_to_disk(self, certificates: Dict[str, str], expires_at: float) -> None:
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+            temp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"certificates": certificates, "expires_at": expires_at}, f)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not persist signing key cache: {e}")
+
+    def refresh(self) -> bool:
+        """Fetch fresh certificates; on failure keep serving the current keys."""
+        self._last_attempt = time.time()
+        try:
+            certificates, max_age = self.fetch()
+            expires_at = time.time() + max_age
+            self._install(certificates, expires_at)
+        except Exception as e:
+            metrics.inc("token_key_refresh_total", (("result", "error"),))
+            print(f"Signing key refresh failed, keeping {len(self._keys)} cached keys: {e}")
+            return False
+        metrics.inc("token_key_refresh_total", (("result", "ok"),))
+        self._save_to_disk(certificates, expires_at)
+        return True
+
+    def _refresh_loop(self) -> None:
+        retry = RETRY_MIN_SECONDS
+        while not self._stopped.is_set():
+            delay = self._expires_at - REFRESH_MARGIN - time.time()
+            if delay > 0:
+                self._stopped.wait(delay)
+                continue
+            if self.refresh():
+                retry = RETRY_MIN_SECONDS
+            else:
+                self._stopped.wait(retry)
+                retry = min(retry * 2, RETRY_MAX_SECONDS)
+
+    def start(self) -> None:
+        """Start the background refresh thread if it is not running."""
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="signing-key-refresh", daemon=True)
+                self._refresher.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def get(self, kid: str) -> Any:
+        """Public key for ``kid``, fetching synchronously only when it is unknown."""
+        key = self._keys.get(kid)
+        if key is None and time.time() - self._last_attempt >= UNKNOWN_KID_REFRESH_INTERVAL:
+            # Tokens may be signed with a newly rotated key before the scheduled refresh
+            self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            if not self._keys:
+                raise TokenVerificationUnavailable("No signing keys available")
+            raise InvalidIdTokenError(f"Unknown signing key: {kid}")
+        return key
+
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens locally against cached signing keys.
+
+    Verified tokens are remembered until they expire, so the activity
+    logging middleware and the authentication dependency verifying the same
+    token in one request only pay for the RSA check once.
+    """
+
+    def __init__(self, project_id: str, keys: KeyCache, clock_skew_seconds: int = 0, cache_size: int = TOKEN_CACHE_SIZE):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.keys = keys
+        self.clock_skew_seconds = clock_skew_seconds
+        self.cache_size = cache_size
+        self._verified: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, id_token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            claims = self._verified.get(id_token)
+            if claims is None:
+                return None
+            if claims["exp"] + self.clock_skew_seconds <= time.time():
+                del self._verified[id_token]
+                return None
+            self._verified.move_to_end(id_token)
+            return claims
+
+    def _remember(self, id_token: str, claims: Dict[str, Any]) -> None:
+        with self._lock:
+            self._verified[id_token] = claims
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+
+    def verify(self, id_token: str) -> Dict[str, Any]:
+        """Return the token's claims (with "uid" set), or raise InvalidIdTokenError."""
+        claims = self._cached(id_token)
+        metrics.record_cache("id_token", claims is not None)
+        if claims is not None:
+            return dict(claims)
+
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise InvalidIdTokenError(str(e)) from e
+        if header.get("alg") != "RS256" or not header.get("kid"):
+            raise InvalidIdTokenError("ID token must be RS256-signed and carry a key ID")
+
+        try:
+            claims = jwt.decode(
+                id_token,
+                self.keys.get(header["kid"]),
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=self.clock_skew_seconds,
+                options={"require": ["exp", "iat", "sub"]}
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise ExpiredIdTokenError(str(e)) from e
+        except jwt.PyJWTError as e:
+            raise InvalidIdTokenError(str(e)) from e
+
+        if not isinstance(claims["sub"], str) or not claims["sub"] or len(claims["sub"]) > 128:
+            raise InvalidIdTokenError("ID token has an invalid subject")
+        if claims.get("auth_time", 0) > time.time() + self.clock_skew_seconds:
+            raise InvalidIdTokenError("ID token has an authentication time in the future")
+        claims["uid"] = claims["sub"]
+        self._remember(id_token, claims)
+        return dict(claims)
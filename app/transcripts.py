@@ -0,0 +1,361 @@
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.crud import filter_grades_for_course
+from app.database import Course, CourseCredit, Grade, StudentCourse, chunked
+from app.metrics import registry as metrics
+from app.versions import GLOBAL_SCOPE, get_versions
+
+# Letter-grade scales as (minimum percentage, letter, grade points), highest first
+GRADE_SCALES = {
+    "standard": [
+        (90, "A", 4.0),
+        (80, "B", 3.0),
+        (70, "C", 2.0),
+        (60, "D", 1.0),
+        (0, "F", 0.0),
+    ],
+    "plus_minus": [
+        (93, "A", 4.0),
+        (90, "A-", 3.7),
+        (87, "B+", 3.3),
+        (83, "B", 3.0),
+        (80, "B-", 2.7),
+        (77, "C+", 2.3),
+        (73, "C", 2.0),
+        (70, "C-", 1.7),
+        (67, "D+", 1.3),
+        (60, "D", 1.0),
+        (0, "F", 0.0),
+    ],
+}
+
+# Cohorts smaller than this are computed inline; process start-up would cost more than it saves
+PARALLEL_THRESHOLD = int(os.getenv("TRANSCRIPT_PARALLEL_THRESHOLD", "5000"))
+CHUNK_SIZE = int(os.getenv("TRANSCRIPT_CHUNK_SIZE", "2000"))
+MAX_WORKERS = int(os.getenv("TRANSCRIPT_WORKERS", str(os.cpu_count() or 1)))
+# School-wide class standings kept in memory (one per grade scale)
+STANDING_CACHE_SIZE = int(os.getenv("TRANSCRIPT_STANDING_CACHE_SIZE", "8"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+metrics.describe("transcript_pool_pending_chunks", "gauge", "Transcript chunks submitted to the process pool and not yet finished")
+
+
+class GradeScale:
+    """Maps a percentage average to a letter grade and grade points."""
+
+    def __init__(self, bands: Sequence[Tuple[float, str, float]]):
+        """
+        Initialize the scale from (minimum percentage, letter, points) bands.
+
+        Args:
+            bands: Bands in any order; the lowest band must start at 0
+        """
+        ordered = sorted(bands, key=lambda band: band[0])
+        if not ordered or ordered[0][0] > 0:
+            raise ValueError("Grade scale must include a band starting at 0")
+        self.bands = [tuple(band) for band in ordered]
+        # Precomputed thresholds for bisect lookups
+        self._thresholds = [band[0] for band in ordered]
+
+    @classmethod
+    def named(cls, name: str) -> "GradeScale":
+        """Build one of the predefined scales in GRADE_SCALES."""
+        if name not in GRADE_SCALES:
+            raise ValueError(f"Unknown grade scale '{name}'. Available: {', '.join(GRADE_SCALES)}")
+        return cls(GRADE_SCALES[name])
+
+    def lookup(self, average: float) -> Tuple[str, float]:
+        """Return (letter, grade points) for a percentage average."""
+        index = max(bisect_right(self._thresholds, average) - 1, 0)
+        _, letter, points = self.bands[index]
+        return letter, points
+
+
+def load_transcript_inputs(
+    db: Session,
+    student_ids: Optional[Iterable[int]] = None,
+    course_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Load everything needed to build transcripts in one batched pass.
+
+    Runs three queries (courses with credits, enrollments, grades) for the
+    whole school, or one per chunk of IDs when students are named, and
+    returns plain Python structures that can be shipped to worker processes.
+
+    Args:
+        db: Database session
+        student_ids: Restrict the cohort to these students (default: every enrolled student);
+            without course_id, requested students with no enrollments are included
+        course_id: Restrict the cohort to students enrolled in this course, so
+            requested students outside it are left out
+
+    Returns:
+        Dictionary with "courses", "enrollments" and "grades" lookups
+    """
+    # Courses with their credit configuration (courses without one count as 1 credit, weight 1)
+    courses = {}
+    course_rows = db.query(
+        Course.id, Course.name, CourseCredit.credit_hours, CourseCredit.term, CourseCredit.term_weight
+    ).outerjoin(CourseCredit, CourseCredit.course_id == Course.id).all()
+    for cid, name, credit_hours, term, term_weight in course_rows:
+        courses[cid] = (
+            name,
+            credit_hours if credit_hours is not None else 1.0,
+            term,
+            term_weight if term_weight is not None else 1.0,
+        )
+
+    # Enrollments for the cohort
+    enrollment_query = db.query(StudentCourse.student_id, StudentCourse.course_id)
+    if course_id is not None:
+        cohort = db.query(StudentCourse.student_id).filter(StudentCourse.course_id == course_id)
+        enrollment_query = enrollment_query.filter(StudentCourse.student_id.in_(cohort))
+    if student_ids is not None:
+        student_ids = sorted(set(student_ids))
+        # Named students are looked up in chunks to stay under SQLite's bound parameter limit
+        enrollment_rows = [
+            row for ids in chunked(student_ids)
+            for row in enrollment_query.filter(StudentCourse.student_id.in_(ids)).order_by(StudentCourse.student_id)
+        ]
+    else:
+        enrollment_rows = enrollment_query.order_by(StudentCourse.student_id).all()
+
+    enrollments: Dict[int, List[int]] = {}
+    for sid, cid in enrollment_rows:
+        enrollments.setdefault(sid, []).append(cid)
+
+    # Explicitly requested students appear even when they have no enrollments
+    if student_ids is not None and course_id is None:
+        for sid in student_ids:
+            enrollments.setdefault(sid, [])
+
+    # Grades for the cohort
+    grades: Dict[int, List[Tuple[str, int]]] = {sid: [] for sid in enrollments}
+    if enrollments:
+        grade_query = db.query(Grade.student_id, Grade.subject, Grade.grade)
+        if student_ids is not None or course_id is not None:
+            grade_rows = [
+                row for ids in chunked(list(enrollments))
+                for row in grade_query.filter(Grade.student_id.in_(ids))
+            ]
+        else:
+            grade_rows = grade_query.all()
+        for sid, subject, value in grade_rows:
+            if sid in grades:
+                grades[sid].append((subject, value))
+
+    return {"courses": courses, "enrollments": enrollments, "grades": grades}
+
+
+def compute_transcript(
+    student_id: int,
+    course_ids: List[int],
+    grades: List[Tuple[str, int]],
+    courses: Dict[int, Tuple[str, float, Optional[str], float]],
+    scale: GradeScale
+) -> Dict[str, Any]:
+    """
+    Compute a single student's transcript from preloaded data.
+
+    Each enrolled course is graded from the subjects matching the course name
+    (see crud.filter_grades_for_course). Course grade points are weighted by
+    credit hours multiplied by the course's term weight.
+    """
+    course_entries = []
+    weighted_points = 0.0
+    weighted_percent = 0.0
+    total_weight = 0.0
+    total_credits = 0.0
+
+    for cid in course_ids:
+        if cid not in courses:
+            continue
+        name, credit_hours, term, term_weight = courses[cid]
+        course_grades = filter_grades_for_course(name, grades)
+        if not course_grades:
+            continue
+
+        average = sum(value for _, value in course_grades) / len(course_grades)
+        letter, points = scale.lookup(average)
+        weight = credit_hours * term_weight
+
+        course_entries.append({
+            "course_id": cid,
+            "course_name": name,
+            "term": term,
+            "credit_hours": credit_hours,
+            "average": average,
+            "letter": letter,
+            "grade_points": points,
+        })
+        weighted_points += points * weight
+        weighted_percent += average * weight
+        total_weight += weight
+        total_credits += credit_hours
+
+    return {
+        "student_id": student_id,
+        "courses": course_entries,
+        "gpa": weighted_points / total_weight if total_weight else None,
+        "weighted_average": weighted_percent / total_weight if total_weight else None,
+        "total_credits": total_credits,
+    }
+
+
+def _compute_chunk(
+    chunk: List[Tuple[int, List[int], List[Tuple[str, int]]]],
+    courses: Dict[int, Tuple[str, float, Optional[str], float]],
+    bands: List[Tuple[float, str, float]]
+) -> List[Dict[str, Any]]:
+    """Worker entry point: compute transcripts for a chunk of students."""
+    scale = GradeScale(bands)
+    return [compute_transcript(sid, cids, grades, courses, scale) for sid, cids, grades in chunk]
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily create the shared process pool."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
+
+
+def shutdown_executor() -> None:
+    """Stop the process pool if it was started; called on application shutdown."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def assign_class_standing(transcripts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Rank transcripts by GPA (highest first) and add class standing fields.
+
+    Students with equal GPA share a rank. Students without a GPA are unranked.
+    """
+    ranked = sorted(
+        (t for t in transcripts if t["gpa"] is not None),
+        key=lambda t: t["gpa"],
+        reverse=True
+    )
+    cohort_size = len(ranked)
+    previous_gpa = None
+    rank = 0
+    for position, transcript in enumerate(ranked, 1):
+        if transcript["gpa"] != previous_gpa:
+            rank = position
+            previous_gpa = transcript["gpa"]
+        transcript["class_rank"] = rank
+        transcript["cohort_size"] = cohort_size
+        transcript["percentile"] = round(100.0 * (cohort_size - rank + 1) / cohort_size, 2)
+
+    for transcript in transcripts:
+        if transcript["gpa"] is None:
+            transcript["class_rank"] = None
+            transcript["cohort_size"] = cohort_size
+            transcript["percentile"] = None
+    return transcripts
+
+
+def compute_transcripts(inputs: Dict[str, Any], scale: GradeScale, parallel: bool = True) -> List[Dict[str, Any]]:
+    """
+    Compute transcripts and class standing for every student in the inputs.
+
+    Large cohorts are split into chunks and spread across a process pool.
+
+    Args:
+        inputs: Output of load_transcript_inputs
+        scale: Letter-grade scale to apply
+        parallel: Allow the process pool to be used for large cohorts
+
+    Returns:
+        List of transcripts ordered by student ID
+    """
+    courses = inputs["courses"]
+    rows = [
+        (sid, inputs["enrollments"][sid], inputs["grades"].get(sid, []))
+        for sid in sorted(inputs["enrollments"])
+    ]
+
+    if parallel and MAX_WORKERS > 1 and len(rows) >= PARALLEL_THRESHOLD:
+        chunks = [rows[i:i + CHUNK_SIZE] for i in range(0, len(rows), CHUNK_SIZE)]
+        executor = _get_executor()
+        futures = [executor.submit(_compute_chunk, chunk, courses, scale.bands) for chunk in chunks]
+        metrics.gauge_add("transcript_pool_pending_chunks", len(futures))
+        for future in futures:
+            future.add_done_callback(lambda _: metrics.gauge_add("transcript_pool_pending_chunks", -1))
+        transcripts = [transcript for future in futures for transcript in future.result()]
+    else:
+        transcripts = [compute_transcript(sid, cids, grades, courses, scale) for sid, cids, grades in rows]
+
+    return assign_class_standing(transcripts)
+
+
+class ClassStandingCache:
+    """
+    Class standing of every student in the school, per grade scale.
+
+    Standing needs every student's GPA, so computing it means a pass over the
+    whole school. Entries are tagged with the global data version, which every
+    mutation bumps: checking it costs one query, and the school is only
+    re-read after grades, enrollments or credits changed.
+    """
+
+    def __init__(self, size: int = STANDING_CACHE_SIZE):
+        self.size = size
+        self._standings: "OrderedDict[tuple, Tuple[int, int, Dict[int, Tuple[int, float]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, scale: GradeScale) -> Tuple[int, Dict[int, Tuple[int, float]]]:
+        """Return (cohort size, {student ID: (class rank, percentile)}) for ranked students."""
+        key = tuple(scale.bands)
+        version = get_versions(db, [GLOBAL_SCOPE])[GLOBAL_SCOPE]
+        with self._lock:
+            cached = self._standings.get(key)
+            if cached is not None and cached[0] == version:
+                self._standings.move_to_end(key)
+        hit = cached is not None and cached[0] == version
+        metrics.record_cache("class_standing", hit)
+        if hit:
+            return cached[1], cached[2]
+
+        transcripts = compute_transcripts(load_transcript_inputs(db), scale)
+        ranked = {t["student_id"]: (t["class_rank"], t["percentile"]) for t in transcripts if t["class_rank"] is not None}
+        with self._lock:
+            self._standings[key] = (version, len(ranked), ranked)
+            self._standings.move_to_end(key)
+            while len(self._standings) > self.size:
+                self._standings.popitem(last=False)
+        return len(ranked), ranked
+
+    def clear(self) -> None:
+        with self._lock:
+            self._standings.clear()
+
+
+class_standings = ClassStandingCache()
+
+
+def get_student_transcript(db: Session, student_id: int, scale: GradeScale) -> Dict[str, Any]:
+    """
+    Compute one student's transcript, including standing within the whole school.
+
+    The transcript itself is built from the student's own rows; the standing
+    comes from class_standings, which only recomputes the school after a change.
+    """
+    cohort_size, standings = class_standings.get(db, scale)
+    inputs = load_transcript_inputs(db, student_ids=[student_id])
+    transcript = compute_transcript(
+        student_id, inputs["enrollments"][student_id], inputs["grades"][student_id], inputs["courses"], scale
+    )
+    class_rank, percentile = standings.get(student_id, (None, None))
+    transcript.update(class_rank=class_rank, cohort_size=cohort_size, percentile=percentile)
+    return transcript
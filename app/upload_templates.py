@@ -0,0 +1,121 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from typing import Sequence, Tuple
+from sqlalchemy.orm import Session
+from app.database import Course, StudentCourse
+from app.metrics import registry as metrics
+from app.versions import course_scope, get_versions
+
+TEMPLATE_COLUMNS = ("student_id", "subject", "grade")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "excel": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXTENSIONS = {"csv": "csv", "excel": "xlsx"}
+
+# Course roster templates kept in memory (one per course and format)
+ROSTER_TEMPLATE_CACHE_SIZE = int(os.getenv("ROSTER_TEMPLATE_CACHE_SIZE", "256"))
+
+# A rendered template; ``content`` is immutable and shared by every response that serves it
+UploadTemplate = namedtuple("UploadTemplate", ["content", "media_type", "filename", "etag"])
+
+
+def _csv_bytes(rows: Sequence[Sequence[str]]) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(TEMPLATE_COLUMNS)
+    writer.writerows(rows)
+    return output.getvalue().encode("utf-8")
+
+
+def _excel_bytes(rows: Sequence[Sequence[str]]) -> bytes:
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(TEMPLATE_COLUMNS)
+    for row in rows:
+        sheet.append(list(row))
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def render_template(file_format: str, rows: Sequence[Sequence[str]], filename: str) -> UploadTemplate:
+    """
+    Render template rows as CSV or Excel.
+
+    The ETag is derived from the rows rather than the file bytes (Excel files
+    embed their creation time), so every worker gives a template the same ETag.
+
+    Raises:
+        ImportError: If Excel is requested and openpyxl is not installed
+    """
+    content = _excel_bytes(rows) if file_format == "excel" else _csv_bytes(rows)
+    state = json.dumps([file_format, TEMPLATE_COLUMNS, rows])
+    etag = '"' + hashlib.sha1(state.encode()).hexdigest() + '"'
+    return UploadTemplate(content, MEDIA_TYPES[file_format], f"{filename}.{EXTENSIONS[file_format]}", etag)
+
+
+@lru_cache(maxsize=128)
+def grade_template(file_format: str, min_grade: int = 0, max_grade: int = 100) -> UploadTemplate:
+    """The sample grade upload template, rendered once per format and grade range."""
+    rows = (
+        ("1", f"Math (Range: {min_grade}-{max_grade})", str(min(95, max_grade))),
+        ("2", "Science", str(min(87, max_grade))),
+        ("3", "History", str(min(78, max_grade))),
+    )
+    return render_template(file_format, rows, "grade_upload_template")
+
+
+class RosterTemplateCache:
+    """
+    Grade upload templates pre-filled with a course's enrolled students.
+
+    Entries are tagged with the course's data version, which every
+    enrollment change bumps, so a stale roster is never served: checking
+    the version costs one query, and the roster is only re-read and
+    re-rendered after it changed.
+    """
+
+    def __init__(self, size: int = ROSTER_TEMPLATE_CACHE_SIZE):
+        self.size = size
+        self._templates: "OrderedDict[Tuple[int, str], Tuple[int, UploadTemplate]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, course: Course, file_format: str) -> UploadTemplate:
+        key = (course.id, file_format)
+        version = get_versions(db, [course_scope(course.id)])[course_scope(course.id)]
+        with self._lock:
+            cached = self._templates.get(key)
+            if cached is not None and cached[0] == version:
+                self._templates.move_to_end(key)
+        hit = cached is not None and cached[0] == version
+        metrics.record_cache("roster_template", hit)
+        if hit:
+            return cached[1]
+
+        student_ids = db.query(StudentCourse.student_id).filter(
+            StudentCourse.course_id == course.id
+        ).order_by(StudentCourse.student_id)
+        rows = [(str(student_id), course.name, "") for (student_id,) in student_ids]
+        template = render_template(file_format, rows, f"grade_upload_course_{course.id}")
+        with self._lock:
+            self._templates[key] = (version, template)
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.size:
+                self._templates.popitem(last=False)
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+
+roster_templates = RosterTemplateCache()
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import UploadReceipt
+from app.metrics import registry as metrics
+from app.versions import get_versions, student_scope
+
+# Receipts older than this are ignored: the key can be reused and the same file is processed again
+UPLOAD_RECEIPT_TTL_SECONDS = int(os.getenv("UPLOAD_RECEIPT_TTL_SECONDS", str(24 * 3600)))
+# A receipt still "processing" after this long belongs to a request that died; a retry takes it over
+UPLOAD_PROCESSING_LEASE_SECONDS = int(os.getenv("UPLOAD_PROCESSING_LEASE_SECONDS", "120"))
+
+metrics.describe("upload_replays_total", "counter", "Grade uploads answered from a stored receipt, by what matched")
+
+
+class UploadInProgress(Exception):
+    """An upload with the same key or file is still being processed."""
+
+
+class IdempotencyKeyReused(Exception):
+    """The Idempotency-Key was already used for a different file or different options."""
+
+
+def content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def _cutoff(seconds: int = UPLOAD_RECEIPT_TTL_SECONDS) -> str:
+    return (datetime.now() - timedelta(seconds=seconds)).isoformat()
+
+
+def _abandoned():
+    # Processing receipts whose request was killed before completing or abandoning them
+    return and_(UploadReceipt.status == "processing", UploadReceipt.created_at < _cutoff(UPLOAD_PROCESSING_LEASE_SECONDS))
+
+
+def find_replay(
+    db: Session,
+    user_id: str,
+    digest: str,
+    parameters: str,
+    idempotency_key: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    The stored response for a repeated upload, if it may be replayed.
+
+    With an Idempotency-Key the receipt for that key is authoritative: its
+    response is returned whatever happened since. Without one, an earlier
+    upload of the same file with the same options is replayed only while
+    none of the students it touched has changed since; otherwise the upload
+    is processed again.
+
+    Raises:
+        UploadInProgress: The matching upload has not finished yet
+        IdempotencyKeyReused: The key belongs to a different upload
+    """
+    query = db.query(UploadReceipt).filter(UploadReceipt.user_id == user_id, UploadReceipt.created_at >= _cutoff())
+    if idempotency_key:
+        receipt = query.filter(UploadReceipt.idempotency_key == idempotency_key).first()
+        if receipt is None:
+            return None
+        if receipt.content_hash != digest or receipt.parameters != parameters:
+            raise IdempotencyKeyReused(idempotency_key)
+    else:
+        receipt = query.filter(
+            UploadReceipt.content_hash == digest, UploadReceipt.parameters == parameters
+        ).order_by(UploadReceipt.id.desc()).first()
+        if receipt is None:
+            return None
+
+    if receipt.status != "done":
+        if receipt.created_at < _cutoff(UPLOAD_PROCESSING_LEASE_SECONDS):
+            return None  # Abandoned; begin_receipt takes it over
+        raise UploadInProgress()
+    if not idempotency_key:
+        versions = json.loads(receipt.versions or "{}")
+        if get_versions(db, versions) != versions:
+            return None
+    metrics.inc("upload_replays_total", (("match", "key" if idempotency_key else "content"),))
+    return json.loads(receipt.response)
+
+
+def begin_receipt(
+    db: Session,
+    user_id: str,
+    digest: str,
+    parameters: str,
+    idempotency_key: Optional[str] = None
+) -> UploadReceipt:
+    """
+    Record that an upload is being processed, so a concurrent retry waits instead of repeating it.
+
+    An expired receipt holding the same key, or a receipt for the same
+    upload left "processing" past UPLOAD_PROCESSING_LEASE_SECONDS, is replaced.
+
+    Raises:
+        UploadInProgress: Another request claimed the same key first
+    """
+    if idempotency_key:
+        db.query(UploadReceipt).filter(
+            UploadReceipt.user_id == user_id,
+            UploadReceipt.idempotency_key == idempotency_key,
+            or_(UploadReceipt.created_at < _cutoff(), _abandoned())
+        ).delete(synchronize_session=False)
+    else:
+        db.query(UploadReceipt).filter(
+            UploadReceipt.user_id == user_id,
+            UploadReceipt.idempotency_key.is_(None),
+            UploadReceipt.content_hash == digest,
+            UploadReceipt.parameters == parameters,
+            _abandoned()
+        ).delete(synchronize_session=False)
+    receipt = UploadReceipt(
+        user_id=user_id,
+        idempotency_key=idempotency_key,
+        content_hash=digest,
+        parameters=parameters,
+        status="processing",
+        created_at=datetime.now().isoformat()
+    )
+    db.add(receipt)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise UploadInProgress()
+    return receipt
+
+
+def complete_receipt(db: Session, receipt: UploadReceipt, response: Dict[str, Any], student_ids: Iterable[int]) -> None:
+    """Store the response, and the versions of the students it touched, for replays."""
+    receipt.status = "done"
+    receipt.response = json.dumps(response)
+    receipt.versions = json.dumps(get_versions(db, [student_scope(student_id) for student_id in set(student_ids)]))
+    db.commit()
+
+
+def abandon_receipt(db: Session, receipt: UploadReceipt) -> None:
+    """Forget a failed upload so a retry processes it again."""
+    db.rollback()
+    db.query(UploadReceipt).filter(UploadReceipt.id == receipt.id).delete(synchronize_session=False)
+    db.commit()
@@ -1,4 +1,26 @@
-from typing import Tuple, Optional, Dict, Any
+import re
+from typing import Tuple, Optional, Dict, Any, List, Sequence
+from sqlalchemy.orm import Session
+from app.database import Student, StudentCourse, chunked
+
+# Fields every grade row must have
+REQUIRED_FIELDS = ("student_id", "subject", "grade")
+
+# Placeholder in a column for a row that lacks the field altogether
+MISSING = object()
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def grade_columns(rows: Sequence[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """Turn grade row dicts into the column-oriented form taken by GradeValidator.validate_batch."""
+    return {field: [row.get(field, MISSING) for row in rows] for field in REQUIRED_FIELDS}
+
 
 class GradeValidator:
     """Validator for grade data with configurable rules."""
@@ -47,9 +69,8 @@ class GradeValidator:
             Tuple of (is_valid, error_message)
         """
         # Check if required fields exist
-        required_fields = ["student_id", "subject", "grade"]
-        if not all(field in grade_data for field in required_fields):
-            missing = [field for field in required_fields if field not in grade_data]
+        if not all(field in grade_data for field in REQUIRED_FIELDS):
+            missing = [field for field in REQUIRED_FIELDS if field not in grade_data]
             return False, f"Missing required fields: {', '.join(missing)}"
         
         # Validate student_id
@@ -70,4 +91,114 @@ class GradeValidator:
         if not is_valid:
             return False, error_message
         
-        return True, None
\ No newline at end of file
+        return True, None
+
+    def validate_batch(
+        self,
+        columns: Dict[str, Sequence[Any]],
+        db: Optional[Session] = None,
+        course_id: Optional[int] = None
+    ) -> List[Tuple[int, str]]:
+        """
+        Validate a column-oriented chunk of grade rows.
+
+        Each check runs over a whole column before rows are looked at
+        individually, and reports the same messages as validate_grade_data.
+        With ``db``, the chunk's distinct student IDs are resolved with IN
+        queries of at most IN_CLAUSE_CHUNK_SIZE IDs, so any chunk size stays
+        within SQLite's bound-parameter limit; with ``course_id`` as well,
+        enrollment in that course is checked the same way.
+
+        Args:
+            columns: Equal-length "student_id", "subject" and "grade" columns
+                (see grade_columns); MISSING marks a row without the field
+            db: Database session for the student checks, if any
+            course_id: Course the students must be enrolled in, if any
+
+        Returns:
+            (row index, error_message) for each invalid row, in row order
+        """
+        size = max((len(values) for values in columns.values()), default=0)
+        raw_ids, subjects, raw_grades = (columns.get(field) or [MISSING] * size for field in REQUIRED_FIELDS)
+        student_ids = [_to_int(value) for value in raw_ids]
+        grades = [_to_int(value) for value in raw_grades]
+        has_subject = [value is not MISSING and bool(str(value).strip()) for value in subjects]
+        min_grade, max_grade = self.min_grade, self.max_grade
+
+        errors = []
+        valid = []
+        for index, student_id in enumerate(student_ids):
+            grade = grades[index]
+            if student_id is not None and student_id > 0 and has_subject[index] and grade is not None and min_grade <= grade <= max_grade:
+                valid.append(index)
+                continue
+            # Slow path, only for rows that failed something: find the first failing check
+            row = (raw_ids[index], subjects[index], raw_grades[index])
+            if MISSING in row:
+                missing = [field for field, value in zip(REQUIRED_FIELDS, row) if value is MISSING]
+                errors.append((index, f"Missing required fields: {', '.join(missing)}"))
+            elif student_id is None:
+                errors.append((index, f"Student ID must be a valid integer, got: {raw_ids[index]}"))
+            elif student_id <= 0:
+                errors.append((index, f"Student ID must be a positive integer, got: {student_id}"))
+            elif not has_subject[index]:
+                errors.append((index, "Subject cannot be empty"))
+            elif grade is None:
+                errors.append((index, f"Grade must be a valid integer, got: {raw_grades[index]}"))
+            else:
+                errors.append((index, f"Grade must be between {min_grade} and {max_grade}, got: {grade}"))
+
+        if db is None or not valid:
+            return errors
+
+        existing = set()
+        enrolled = set()
+        for ids in chunked(list({student_ids[index] for index in valid})):
+            existing.update(student_id for (student_id,) in db.query(Student.id).filter(Student.id.in_(ids)))
+            if course_id:
+                enrolled.update(student_id for (student_id,) in db.query(StudentCourse.student_id).filter(
+                    StudentCourse.course_id == course_id, StudentCourse.student_id.in_(ids)
+                ))
+        if not course_id:
+            enrolled = existing
+        for index in valid:
+            student_id = student_ids[index]
+            if student_id not in existing:
+                errors.append((index, f"Student {student_id} does not exist"))
+            elif student_id not in enrolled:
+                errors.append((index, f"Student {student_id} is not enrolled in course {course_id}"))
+        errors.sort()
+        return errors
+
+
+class StudentValidator:
+    """Validator for student records used by bulk imports."""
+
+    EMAIL_PATTERN = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+    DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+    def validate_student_data(self, student_data: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
+        """
+        Validate a student data dictionary containing name, email and optional date_of_birth.
+
+        Args:
+            student_data: Dictionary with student data
+
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        name = str(student_data.get("name") or "").strip()
+        if not name:
+            return False, "Name cannot be empty"
+
+        email = str(student_data.get("email") or "").strip()
+        if not email:
+            return False, "Email cannot be empty"
+        if not self.EMAIL_PATTERN.match(email):
+            return False, f"Invalid email address: {email}"
+
+        date_of_birth = str(student_data.get("date_of_birth") or "").strip()
+        if date_of_birth and not self.DATE_PATTERN.match(date_of_birth):
+            return False, f"Date of birth must use YYYY-MM-DD format, got: {date_of_birth}"
+
+        return True, None
@@ -0,0 +1,43 @@
+from typing import Dict, Iterable
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from app.database import DataVersion
+
+# Bumped by every mutation
+GLOBAL_SCOPE = "global"
+# The course catalogue (course rows as listed by /courses/)
+COURSES_SCOPE = "courses"
+
+
+def student_scope(student_id: int) -> str:
+    """Grades and enrollments of one student."""
+    return f"student:{student_id}"
+
+
+def course_scope(course_id: int) -> str:
+    """One course's details, credits and enrollments."""
+    return f"course:{course_id}"
+
+
+def bump_versions(db: Session, scopes: Iterable[str]) -> None:
+    """
+    Increment the counters of ``scopes`` and the global counter.
+
+    Runs in the caller's transaction, so call it before the commit that
+    makes the change visible: the new version and the new data are
+    committed together.
+    """
+    scopes = sorted(set(scopes) | {GLOBAL_SCOPE})
+    statement = sqlite_insert(DataVersion).values([{"scope": scope, "version": 1} for scope in scopes])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[DataVersion.scope],
+        set_={"version": DataVersion.version + 1}
+    ))
+
+
+def get_versions(db: Session, scopes: Iterable[str]) -> Dict[str, int]:
+    """Current counters for ``scopes`` in one query; scopes never bumped are at 0."""
+    scopes = list(scopes)
+    versions = dict.fromkeys(scopes, 0)
+    versions.update(db.query(DataVersion.scope, DataVersion.version).filter(DataVersion.scope.in_(scopes)).all())
+    return versions
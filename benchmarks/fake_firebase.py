@@ -0,0 +1,112 @@
+"""
+Local stand-in for Firebase ID token verification.
+
+Tokens are RS256 JWTs signed with a freshly generated RSA key, shaped like
+Firebase ID tokens (iss/aud/sub/auth_time plus custom "roles" claims). The
+matching public key is served as a self-signed x509 certificate to the app's
+local token verifier (app.token_verifier), so the real verification code
+path runs without network access.
+
+Call install() before the first request is handled.
+"""
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+import jwt
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+PROJECT_ID = "benchmark-project"
+ISSUER = f"https://securetoken.google.com/{PROJECT_ID}"
+
+
+class FakeFirebaseAuth:
+    """Issues and verifies Firebase-shaped ID tokens with a local RSA key."""
+
+    def __init__(self, project_id: str = PROJECT_ID):
+        self.project_id = project_id
+        self.issuer = f"https://securetoken.google.com/{project_id}"
+        self.key_id = uuid.uuid4().hex
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.public_key = self.private_key.public_key()
+        self.fetches = 0
+
+    def certificates(self) -> Dict[str, str]:
+        """The public key as {kid: PEM certificate}, the shape Google serves."""
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken.system.gserviceaccount.com")])
+        now = datetime.now(timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(self.public_key)
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - timedelta(days=1))
+            .not_valid_after(now + timedelta(days=1))
+            .sign(self.private_key, hashes.SHA256())
+        )
+        return {self.key_id: certificate.public_bytes(serialization.Encoding.PEM).decode()}
+
+    def fetch_certificates(self) -> Tuple[Dict[str, str], int]:
+        """Stand-in for app.token_verifier.fetch_securetoken_certificates."""
+        self.fetches += 1
+        return self.certificates(), 3600
+
+    def issue_token(
+        self,
+        uid: str,
+        email: Optional[str] = None,
+        roles: Iterable[str] = ("admin", "teacher"),
+        lifetime: int = 3600,
+        audience: Optional[str] = None
+    ) -> str:
+        """Create a signed ID token for ``uid`` with the given custom role claims."""
+        now = int(time.time())
+        claims = {
+            "iss": self.issuer,
+            "aud": audience or self.project_id,
+            "sub": uid,
+            "auth_time": now,
+            "iat": now,
+            "exp": now + lifetime,
+            "email": email or f"{uid}@bench.example",
+            "roles": list(roles),
+        }
+        return jwt.encode(claims, self.private_key, algorithm="RS256", headers={"kid": self.key_id})
+
+    def verify_id_token(self, id_token: str, app=None, check_revoked: bool = False, clock_skew_seconds: int = 0) -> dict:
+        """Drop-in replacement for firebase_admin.auth.verify_id_token."""
+        from firebase_admin import auth
+        try:
+            claims = jwt.decode(
+                id_token,
+                self.public_key,
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=self.issuer,
+                leeway=clock_skew_seconds
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise auth.ExpiredIdTokenError(str(e), cause=e)
+        except jwt.PyJWTError as e:
+            raise auth.InvalidIdTokenError(str(e), cause=e)
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+def install(fake: Optional[FakeFirebaseAuth] = None) -> FakeFirebaseAuth:
+    """Point the app's token verification at the fake so it needs no service account or network."""
+    import firebase_admin
+    from firebase_admin import auth
+    from app.auth import set_token_verifier
+    from app.token_verifier import KeyCache, TokenVerifier
+
+    fake = fake or FakeFirebaseAuth()
+    set_token_verifier(TokenVerifier(fake.project_id, KeyCache(fetch=fake.fetch_certificates, cache_path=None)))
+    # Covers FIREBASE_LOCAL_VERIFY=0, which delegates to firebase_admin
+    firebase_admin.initialize_app = lambda *args, **kwargs: None
+    auth.verify_id_token = fake.verify_id_token
+    return fake
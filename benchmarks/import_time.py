@@ -0,0 +1,111 @@
+"""
+Measure how long a fresh interpreter takes to import app.main.
+
+Each run starts a new Python process so nothing is cached in sys.modules.
+The wall time of the import is reported alongside the heaviest modules from
+``-X importtime``, and the result is saved as JSON per commit:
+
+    python -m benchmarks.import_time --runs 10
+    python -m benchmarks.import_time --compare benchmarks/results/import-<baseline>.json --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from benchmarks.loadtest import RESULTS_DIR, git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports the app and prints the import wall time; must not touch the network or the certificate
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import {module}; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def time_import(module: str) -> Tuple[float, List[Tuple[str, int]]]:
+    """Import ``module`` in a fresh interpreter; return wall seconds and (module, cumulative us) pairs."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time: self | cumulative | <indent>name", indentation marks nesting depth
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name[1:].rstrip(), int(cumulative_us)))
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def top_level_modules(modules: List[Tuple[str, int]], limit: int) -> List[Dict[str, object]]:
+    """Heaviest modules imported at the top level or directly by a top-level module."""
+    totals: Dict[str, int] = {}
+    for name, cumulative_us in modules:
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            totals[name.strip()] = max(totals.get(name.strip(), 0), cumulative_us)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 2)} for name, us in ranked]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold import time of the app")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Heaviest modules to report")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/import-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    parser.add_argument("--max-seconds", type=float, help="Exit non-zero if the median import time exceeds this")
+    args = parser.parse_args()
+
+    timings = []
+    modules: List[Tuple[str, int]] = []
+    for _ in range(args.runs):
+        seconds, modules = time_import(args.module)
+        timings.append(seconds)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "module": args.module,
+        "runs": args.runs,
+        "median_s": round(statistics.median(timings), 4),
+        "min_s": round(min(timings), 4),
+        "max_s": round(max(timings), 4),
+        "heaviest_modules": top_level_modules(modules, args.top),
+    }
+    print(f"import {args.module}: median={report['median_s']}s min={report['min_s']}s max={report['max_s']}s")
+    for entry in report["heaviest_modules"]:
+        print(f"  {entry['module']:40} {entry['cumulative_ms']:>9.2f}ms")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"import-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        change = (report["median_s"] - baseline["median_s"]) / baseline["median_s"] if baseline["median_s"] else 0.0
+        print(f"median import time: {baseline['median_s']}s -> {report['median_s']}s ({change:+.1%})")
+
+    if args.max_seconds is not None and report["median_s"] > args.max_seconds:
+        print(f"Import time {report['median_s']}s exceeds the {args.max_seconds}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
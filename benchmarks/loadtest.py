@@ -0,0 +1,230 @@
+"""
+Drive the real ASGI app with concurrent httpx clients and report latency.
+
+Builds a synthetic school (benchmarks.synthetic), swaps Firebase token
+verification for a local RSA-signed stand-in (benchmarks.fake_firebase) and
+runs every scenario below in-process. Results are saved as JSON per commit so
+runs can be compared:
+
+    python -m benchmarks.loadtest --students 2000 --grades 50000
+    python -m benchmarks.loadtest --compare benchmarks/results/<baseline>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks import fake_firebase
+from benchmarks.synthetic import generate_school
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# A scenario builds (method, url, json body) for the i-th request
+Scenario = Callable[[int, random.Random], Tuple[str, str, Optional[dict]]]
+
+
+def build_scenarios(students: int, courses: int, grades: int) -> Dict[str, Scenario]:
+    """Request generators for each endpoint, keyed by a stable scenario name."""
+    def student(rng):
+        return rng.randint(1, students)
+
+    def course(rng):
+        return rng.randint(1, courses)
+
+    return {
+        "GET /grades/{student_id}": lambda i, rng: ("GET", f"/grades/{student(rng)}", None),
+        "GET /grades?ids=": lambda i, rng: ("GET", "/grades?ids=" + ",".join(str(rng.randint(1, grades)) for _ in range(50)), None),
+        "POST /grades/": lambda i, rng: ("POST", "/grades/", {"student_id": student(rng), "subject": "Math Exam", "grade": rng.randint(0, 100)}),
+        "PUT /grades/{grade_id}": lambda i, rng: ("PUT", f"/grades/{rng.randint(1, grades)}", {"grade": rng.randint(0, 100)}),
+        "GET /grades/{grade_id}/history": lambda i, rng: ("GET", f"/grades/{rng.randint(1, grades)}/history", None),
+        "GET /students/{student_id}/grades/history": lambda i, rng: ("GET", f"/students/{student(rng)}/grades/history", None),
+        "GET /admin/grades/history": lambda i, rng: ("GET", f"/admin/grades/history?page={rng.randint(1, 20)}", None),
+        "GET /students/{student_id}": lambda i, rng: ("GET", f"/students/{student(rng)}", None),
+        "GET /students": lambda i, rng: ("GET", "/students?limit=50", None),
+        "POST /students:batchGet": lambda i, rng: ("POST", "/students:batchGet", {"ids": [student(rng) for _ in range(100)]}),
+        "GET /students/{student_id}/averages": lambda i, rng: ("GET", f"/students/{student(rng)}/averages", None),
+        "GET /students/{student_id}/courses": lambda i, rng: ("GET", f"/students/{student(rng)}/courses", None),
+        "GET /students/{student_id}/transcript": lambda i, rng: ("GET", f"/students/{student(rng)}/transcript", None),
+        "GET /courses/": lambda i, rng: ("GET", "/courses/", None),
+        "GET /courses/{course_id}": lambda i, rng: ("GET", f"/courses/{course(rng)}", None),
+        "GET /courses/{course_id}/students": lambda i, rng: ("GET", f"/courses/{course(rng)}/students", None),
+        "GET /courses/{course_id}/averages": lambda i, rng: ("GET", f"/courses/{course(rng)}/averages", None),
+        "POST /courses/{course_id}/students": lambda i, rng: ("POST", f"/courses/{course(rng)}/students", {"student_ids": [student(rng) for _ in range(20)]}),
+        "POST /transcripts/batch": lambda i, rng: ("POST", "/transcripts/batch", {"course_id": course(rng)}),
+        "GET /admin/logs": lambda i, rng: ("GET", f"/admin/logs?page={rng.randint(1, 20)}", None),
+        "POST /auth/signup": lambda i, rng: ("POST", "/auth/signup", {"username": f"bench_{i}_{rng.randint(0, 10**9)}", "email": f"bench{i}_{rng.randint(0, 10**9)}@bench.example", "password": "benchpass1"}),
+        "GET /metrics": lambda i, rng: ("GET", "/metrics", None),
+    }
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int, headers: dict, seed: int) -> Dict[str, Any]:
+    """Send ``requests`` requests from ``concurrency`` concurrent clients and summarize latency."""
+    rng = random.Random(seed)
+    plan = [scenario(i, rng) for i in range(requests)]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    queue = iter(plan)
+
+    async def worker():
+        for method, url, body in queue:
+            start = time.perf_counter()
+            response = await client.request(method, url, json=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "statuses": statuses,
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+def setup_app(database_path: str):
+    """Import the app with the Firebase stand-in and point it at the benchmark database."""
+    fake = fake_firebase.install()
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import app.main as main
+
+    engine = create_engine(f"sqlite:///{database_path}", connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[main.get_db] = get_bench_db
+    # The activity logging middleware opens sessions directly
+    main.SessionLocal = session_factory
+    return main.app, fake
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print a comparison table and return the scenarios whose p95 regressed beyond ``threshold``."""
+    regressions = []
+    print(f"\n{'scenario':45} {'p95 base':>10} {'p95 now':>10} {'change':>8} {'rps base':>10} {'rps now':>10}")
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"{name:45} {'-':>10} {result['p95_ms']:>10} {'new':>8}")
+            continue
+        change = (result["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        flag = " !" if change > threshold else ""
+        print(f"{name:45} {base['p95_ms']:>10} {result['p95_ms']:>10} {change:>+8.1%} {base['throughput_rps']:>10} {result['throughput_rps']:>10}{flag}")
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="school-bench-")
+    database_path = os.path.join(workdir, "bench.db")
+    counts = generate_school(
+        f"sqlite:///{database_path}",
+        students=args.students,
+        courses=args.courses,
+        grades=args.grades,
+        logs=args.logs,
+        seed=args.seed
+    )
+
+    app, fake = setup_app(database_path)
+    headers = {"Authorization": f"Bearer {fake.issue_token('bench-admin', roles=['admin', 'teacher'])}"}
+    scenarios = build_scenarios(args.students, args.courses, args.grades)
+    if args.only:
+        scenarios = {name: s for name, s in scenarios.items() if any(part in name for part in args.only)}
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for index, (name, scenario) in enumerate(scenarios.items()):
+            requests = args.signup_requests if name == "POST /auth/signup" else args.requests
+            # Warm-up request so imports and caches don't skew the first samples
+            method, url, body = scenario(-1, random.Random(args.seed))
+            await client.request(method, url, json=body, headers=headers)
+            results[name] = await run_scenario(client, scenario, requests, args.concurrency, headers, args.seed + index)
+            print(f"{name:45} p50={results[name]['p50_ms']:>9}ms p95={results[name]['p95_ms']:>9}ms "
+                  f"p99={results[name]['p99_ms']:>9}ms {results[name]['throughput_rps']:>9} rps {results[name]['statuses']}")
+
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "parameters": {**counts, "requests": args.requests, "concurrency": args.concurrency, "seed": args.seed},
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test every endpoint against a synthetic school")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--grades", type=int, default=20000)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--signup-requests", type=int, default=20, help="Requests for the bcrypt-heavy signup scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", help="Only run scenarios whose name contains one of these strings")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p95 increase counted as a regression")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"\np95 regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Microbenchmarks for the crud, validator, parsing and backup hot paths.
+
+Each benchmark runs at several data sizes and reports the best and median
+wall time over a few repeats, the time per operation, the tracemalloc peak
+(measured in a separate, untimed run) and the scaling exponent k between
+sizes (time ~ size**k, so 1.0 = linear). Sizes projected to exceed --budget
+are skipped. Results are written as JSON so the impact of a change
+to app/crud.py can be compared between commits:
+
+    python -m benchmarks.micro --sizes 1000 10000 100000
+    python -m benchmarks.micro --only bulk_create_grades --compare benchmarks/results/micro-<baseline>.json
+"""
+import argparse
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app.database import ActivityLog, Base, Grade
+from benchmarks.loadtest import RESULTS_DIR, git_commit
+from benchmarks.synthetic import generate_school
+
+# Number of log_activity calls timed on top of a table holding ``size`` rows
+LOG_CALLS = 200
+
+
+@contextmanager
+def working_directory(path: str):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _session(database_path: str, reset: bool = True):
+    engine = create_engine(f"sqlite:///{database_path}", connect_args={"check_same_thread": False})
+    if reset:
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)(), engine
+
+
+def _grade_rows(size: int, students: int = 1) -> List[Dict[str, Any]]:
+    subjects = ["Math", "Science", "History", "Art", "Music"]
+    return [
+        {"student_id": str(i % students + 1), "subject": subjects[i % len(subjects)], "grade": str(i % 101)}
+        for i in range(size)
+    ]
+
+
+# Each prepare function builds the data for one size and returns the operation to time
+
+def prepare_validate_grade_data(size: int, workdir: str) -> Callable[[], Any]:
+    from app.validators import GradeValidator
+    validator = GradeValidator()
+    rows = _grade_rows(size, students=100)
+    return lambda: [validator.validate_grade_data(row) for row in rows]
+
+
+def prepare_bulk_create_grades(size: int, workdir: str) -> Callable[[], Any]:
+    from app.crud import bulk_create_grades
+    db, _ = _session(os.path.join(workdir, "bulk.db"))
+    rows = _grade_rows(size, students=100)
+    return lambda: bulk_create_grades(db, rows, changed_by="bench")
+
+
+def prepare_calculate_student_averages(size: int, workdir: str) -> Callable[[], Any]:
+    from app.crud import calculate_student_averages
+    db, engine = _session(os.path.join(workdir, "student.db"))
+    with engine.begin() as conn:
+        conn.execute(insert(Grade), [
+            {"student_id": 1, "subject": row["subject"], "grade": int(row["grade"])} for row in _grade_rows(size)
+        ])
+    return lambda: calculate_student_averages(db, 1)
+
+
+def prepare_calculate_course_averages(size: int, workdir: str) -> Callable[[], Any]:
+    from app.crud import calculate_course_averages
+    database_path = os.path.join(workdir, "course.db")
+    # Every student in every course, 20 grades per student
+    generate_school(f"sqlite:///{database_path}", students=max(size // 20, 1), courses=4, grades=size, logs=0)
+    db, _ = _session(database_path, reset=False)
+    return lambda: calculate_course_averages(db, 1)
+
+
+def prepare_log_activity(size: int, workdir: str) -> Callable[[], Any]:
+    from app.logging_utils import log_activity
+    db, engine = _session(os.path.join(workdir, "logs.db"))
+    with engine.begin() as conn:
+        conn.execute(insert(ActivityLog), [
+            {"action": "GET:/grades", "user_id": f"user-{i % 200}", "timestamp": datetime.now().isoformat(), "status_code": 200}
+            for i in range(size)
+        ])
+
+    def run():
+        for i in range(LOG_CALLS):
+            log_activity(db, action="bench", user_id="bench", details={"i": i}, status_code=200)
+    return run
+
+
+def prepare_parse_excel_file(size: int, workdir: str) -> Callable[[], Any]:
+    import openpyxl
+    from app.main import parse_excel_file
+    # A regular workbook: parse_excel_file relies on the sheet dimensions that write-only mode omits
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["student_id", "subject", "grade"])
+    for row in _grade_rows(size, students=100):
+        sheet.append([int(row["student_id"]), row["subject"], int(row["grade"])])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    content = buffer.getvalue()
+    return lambda: parse_excel_file(content)
+
+
+def prepare_create_backup(size: int, workdir: str) -> Callable[[], Any]:
+    from app.backup import create_backup
+    database_path = os.path.join(workdir, "backup_source.db")
+    generate_school(f"sqlite:///{database_path}", students=max(size // 20, 1), courses=10, grades=size, logs=0)
+
+    def run():
+        # create_backup writes into a relative "backups" directory
+        with working_directory(workdir):
+            return create_backup(f"sqlite:///{database_path}")
+    return run
+
+
+BENCHMARKS = {
+    "validate_grade_data": prepare_validate_grade_data,
+    "bulk_create_grades": prepare_bulk_create_grades,
+    "calculate_student_averages": prepare_calculate_student_averages,
+    "calculate_course_averages": prepare_calculate_course_averages,
+    "log_activity": prepare_log_activity,
+    "parse_excel_file": prepare_parse_excel_file,
+    "create_backup": prepare_create_backup,
+}
+
+
+# Benchmarks whose timed operation count differs from the data size
+OPERATIONS = {"log_activity": lambda size: LOG_CALLS}
+
+
+def measure(prepare: Callable[[int, str], Callable[[], Any]], size: int, repeats: int, operations: int) -> Dict[str, Any]:
+    """Time one benchmark at one size; every run gets freshly prepared data."""
+    timings = []
+    for _ in range(repeats):
+        with tempfile.TemporaryDirectory(prefix="school-micro-") as workdir:
+            operation = prepare(size, workdir)
+            start = time.perf_counter()
+            operation()
+            timings.append(time.perf_counter() - start)
+
+    # Memory is measured separately because tracemalloc slows execution down
+    with tempfile.TemporaryDirectory(prefix="school-micro-") as workdir:
+        operation = prepare(size, workdir)
+        tracemalloc.start()
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    best = min(timings)
+    return {
+        "size": size,
+        "repeats": repeats,
+        "best_s": round(best, 6),
+        "median_s": round(statistics.median(timings), 6),
+        "per_op_us": round(best / operations * 1e6, 3),
+        "peak_memory_bytes": peak,
+    }
+
+
+def scaling_exponent(previous: Dict[str, Any], current: Dict[str, Any]) -> float:
+    """Exponent k in time ~ size**k between two measured sizes."""
+    if previous["best_s"] <= 0 or current["best_s"] <= 0 or current["size"] == previous["size"]:
+        return 1.0
+    return math.log(current["best_s"] / previous["best_s"]) / math.log(current["size"] / previous["size"])
+
+
+def projected_seconds(points: List[Dict[str, Any]], size: int) -> float:
+    """Extrapolate the run time at ``size`` from the measured points (linearly from a single point)."""
+    last = points[-1]
+    exponent = scaling_exponent(points[-2], last) if len(points) > 1 else 1.0
+    return last["best_s"] * (size / last["size"]) ** max(exponent, 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run crud/validator microbenchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=300.0,
+                        help="Skip sizes whose projected run time exceeds this many seconds")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS), help="Benchmarks to run (default: all)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/micro-<commit>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        points = []
+        for size in sorted(args.sizes):
+            if points and projected_seconds(points, size) > args.budget:
+                # Super-linear paths would otherwise run for hours at the largest sizes
+                print(f"{name:28} n={size:>7} skipped, projected {projected_seconds(points, size):.0f}s > budget")
+                break
+            # Keep the largest sizes affordable: fewer repeats as data grows
+            repeats = args.repeats if size <= 10000 else 1
+            operations = OPERATIONS.get(name, lambda size: size)(size)
+            point = measure(BENCHMARKS[name], size, repeats, operations)
+            if points:
+                point["scaling_exponent"] = round(scaling_exponent(points[-1], point), 3)
+            points.append(point)
+            print(f"{name:28} n={size:>7} best={point['best_s']:>10.4f}s "
+                  f"per_op={point['per_op_us']:>9.2f}us peak={point['peak_memory_bytes'] / 1e6:>8.2f}MB "
+                  f"k={point.get('scaling_exponent', '-')}")
+        results[name] = points
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "log_activity_calls": LOG_CALLS,
+        "benchmarks": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"micro-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+        print(f"\n{'benchmark':28} {'size':>7} {'base s':>10} {'now s':>10} {'change':>8}")
+        for name, points in results.items():
+            base_points = {point["size"]: point for point in baseline.get(name, [])}
+            for point in points:
+                base = base_points.get(point["size"])
+                if base and base["best_s"]:
+                    change = (point["best_s"] - base["best_s"]) / base["best_s"]
+                    print(f"{name:28} {point['size']:>7} {base['best_s']:>10.4f} {point['best_s']:>10.4f} {change:>+8.1%}")
+
+
+if __name__ == "__main__":
+    main()
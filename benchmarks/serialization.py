@@ -0,0 +1,110 @@
+"""
+CPU cost of encoding large list responses, old path versus fast path.
+
+The baseline is what the list endpoints used to do. They built a model per
+row with from_orm and returned the list. FastAPI then ran
+serialize_response against the response_model and rendered a JSONResponse.
+The fast path copies row attributes into dicts (app.serialization) and
+encodes them with orjson or msgpack. Rows are transient ORM objects, so no
+database time is included:
+
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import msgpack
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.database import Course, Grade, GradeHistory
+from app.serialization import encode_json, rows_to_dicts
+from benchmarks.loadtest import RESULTS_DIR, git_commit
+
+
+def build_rows(rows: int) -> Dict[str, List[Any]]:
+    now = datetime(2025, 9, 1).isoformat()
+    return {
+        "grades": [Grade(id=i, student_id=i % 500 + 1, subject="Math Exam", grade=i % 101) for i in range(1, rows + 1)],
+        "grade_history": [
+            GradeHistory(id=i, grade_id=i, student_id=i % 500 + 1, subject="Math Exam", old_value=None,
+                         new_value=i % 101, action="create", timestamp=now, changed_by="teacher@school.example")
+            for i in range(1, rows + 1)
+        ],
+        "courses": [
+            Course(id=i, name=f"Course {i}", description="Synthetic course", teacher_id=i % 50, created_at=now)
+            for i in range(1, rows + 1)
+        ],
+    }
+
+
+def cpu_per_call(func: Callable[[], Any], repeats: int) -> Dict[str, float]:
+    """Best and mean process CPU time per call, plus the encoded size."""
+    times = []
+    body = b""
+    for _ in range(repeats):
+        start = time.process_time()
+        body = func()
+        times.append(time.process_time() - start)
+    return {"best_ms": round(min(times) * 1000, 3), "mean_ms": round(sum(times) / len(times) * 1000, 3), "bytes": len(body)}
+
+
+def main():
+    # Imported here: the response models live in app.main
+    from app.main import COURSE_FIELDS, GRADE_FIELDS, GRADE_HISTORY_FIELDS, CourseResponse, GradeHistoryResponse, GradeResponse
+
+    parser = argparse.ArgumentParser(description="Measure response serialization CPU per call")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/serialization-<commit>.json)")
+    args = parser.parse_args()
+
+    data = build_rows(args.rows)
+    cases = {
+        "grades": (GradeResponse, GRADE_FIELDS),
+        "grade_history": (GradeHistoryResponse, GRADE_HISTORY_FIELDS),
+        "courses": (CourseResponse, COURSE_FIELDS),
+    }
+
+    results = {}
+    for name, (model, fields) in cases.items():
+        rows = data[name]
+        field = create_model_field(name="Response_" + name, type_=List[model], mode="serialization")
+
+        def baseline():
+            content = [model.from_orm(row) for row in rows]
+            serialized = asyncio.run(serialize_response(field=field, response_content=content, is_coroutine=True))
+            return JSONResponse(serialized).body
+
+        results[name] = {
+            "pydantic_from_orm_json": cpu_per_call(baseline, args.repeats),
+            "dicts_stdlib_json": cpu_per_call(lambda: json.dumps(rows_to_dicts(rows, fields)).encode(), args.repeats),
+            "dicts_orjson": cpu_per_call(lambda: encode_json(rows_to_dicts(rows, fields)), args.repeats),
+            "dicts_msgpack": cpu_per_call(lambda: msgpack.packb(rows_to_dicts(rows, fields)), args.repeats),
+        }
+        for path, result in results[name].items():
+            print(f"{name:14} {path:24} best={result['best_ms']:>9.2f}ms mean={result['mean_ms']:>9.2f}ms {result['bytes']:>10} bytes")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "rows": args.rows,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"serialization-{report['commit']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
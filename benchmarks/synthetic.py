@@ -0,0 +1,153 @@
+"""
+Generate a synthetic school into a SQLite database for benchmarks.
+
+Usage:
+    python -m benchmarks.synthetic bench.db --students 5000 --courses 50 --grades 100000 --logs 50000
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Dict
+from sqlalchemy import create_engine, insert
+from app.database import ActivityLog, Base, Course, Grade, GradeHistory, Student, StudentCourse
+
+SUBJECT_SUFFIXES = ["", " Quiz", " Exam", " Homework", " Project"]
+COURSE_NAMES = [
+    "Math", "Science", "History", "Literature", "Art", "Music", "Biology", "Chemistry",
+    "Physics", "Geography", "Economics", "Latin", "Spanish", "French", "Computing",
+]
+
+# Rows per executemany call
+BATCH_SIZE = 5000
+
+
+def _batched_insert(conn, model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def generate_school(
+    database_url: str,
+    students: int = 1000,
+    courses: int = 20,
+    grades: int = 20000,
+    logs: int = 10000,
+    enrollments_per_student: int = 4,
+    seed: int = 42
+) -> Dict[str, int]:
+    """
+    Create all tables and fill them with reproducible synthetic data.
+
+    Grades are given subjects derived from course names so that course
+    filtering (see crud.filter_grades_for_course) matches them.
+
+    Returns:
+        Row counts per table
+    """
+    rng = random.Random(seed)
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    start = datetime(2025, 9, 1)
+    course_names = [
+        f"{COURSE_NAMES[i % len(COURSE_NAMES)]} {i // len(COURSE_NAMES) + 1}" for i in range(courses)
+    ]
+
+    with engine.begin() as conn:
+        _batched_insert(conn, Student, [
+            {
+                "id": i,
+                "name": f"Student {i}",
+                "email": f"student{i}@school.example",
+                "date_of_birth": f"20{rng.randint(5, 12):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "created_at": start.isoformat(),
+            }
+            for i in range(1, students + 1)
+        ])
+
+        _batched_insert(conn, Course, [
+            {"id": i, "name": name, "description": f"Synthetic course {i}", "teacher_id": rng.randint(1, 50), "created_at": start.isoformat()}
+            for i, name in enumerate(course_names, 1)
+        ])
+
+        enrollments = []
+        student_courses = {}
+        for student_id in range(1, students + 1):
+            chosen = rng.sample(range(1, courses + 1), min(enrollments_per_student, courses))
+            student_courses[student_id] = chosen
+            enrollments.extend(
+                {"student_id": student_id, "course_id": course_id, "joined_at": start.isoformat(), "added_by": "synthetic"}
+                for course_id in chosen
+            )
+        _batched_insert(conn, StudentCourse, enrollments)
+
+        grade_rows = []
+        history_rows = []
+        for grade_id in range(1, grades + 1):
+            student_id = rng.randint(1, students)
+            course_name = course_names[rng.choice(student_courses[student_id]) - 1]
+            subject = course_name.split()[0] + rng.choice(SUBJECT_SUFFIXES)
+            value = max(0, min(100, int(rng.gauss(75, 12))))
+            timestamp = (start + timedelta(minutes=grade_id)).isoformat()
+            grade_rows.append({"id": grade_id, "student_id": student_id, "subject": subject, "grade": value})
+            history_rows.append({
+                "grade_id": grade_id, "student_id": student_id, "subject": subject,
+                "old_value": None, "new_value": value, "action": "create",
+                "timestamp": timestamp, "changed_by": "synthetic",
+            })
+        _batched_insert(conn, Grade, grade_rows)
+        _batched_insert(conn, GradeHistory, history_rows)
+
+        actions = ["GET:/grades", "POST:/grades/", "GET:/courses/", "login_success", "create_grade"]
+        _batched_insert(conn, ActivityLog, [
+            {
+                "user_id": f"user-{rng.randint(1, 200)}",
+                "user_email": None,
+                "timestamp": (start + timedelta(seconds=30 * i)).isoformat(),
+                "action": rng.choice(actions),
+                "resource_type": "grades",
+                "resource_id": str(rng.randint(1, max(grades, 1))),
+                "details": json.dumps({"processing_time_ms": round(rng.uniform(1, 80), 2)}),
+                "ip_address": "10.0.0.1",
+                "user_agent": "synthetic",
+                "status_code": 200,
+            }
+            for i in range(logs)
+        ])
+
+    engine.dispose()
+    return {
+        "students": students,
+        "courses": courses,
+        "enrollments": len(enrollments),
+        "grades": grades,
+        "grade_history": grades,
+        "activity_logs": logs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic school database")
+    parser.add_argument("path", help="SQLite file to (re)create")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--courses", type=int, default=20)
+    parser.add_argument("--grades", type=int, default=20000)
+    parser.add_argument("--logs", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    counts = generate_school(
+        f"sqlite:///{args.path}",
+        students=args.students,
+        courses=args.courses,
+        grades=args.grades,
+        logs=args.logs,
+        seed=args.seed
+    )
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
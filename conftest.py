@@ -0,0 +1,59 @@
+# conftest.py
+
+from contextlib import contextmanager
+
+import pytest
+
+import app.auth
+from app.query_stats import request_observers
+from app.token_verifier import KeyCache, TokenVerifier
+from benchmarks.fake_firebase import FakeFirebaseAuth
+
+
+@pytest.fixture(autouse=True)
+def fake_firebase(monkeypatch):
+    """
+    Verify bearer tokens against in-process fake Firebase keys.
+
+    Any token other than "test-token" reaches the shared TokenVerifier; the
+    real one would fetch Google's signing keys over the network and write
+    them to .cache/. Tests issue tokens with ``fake_firebase.issue_token``.
+    """
+    fake = FakeFirebaseAuth()
+    keys = KeyCache(fetch=fake.fetch_certificates, cache_path=None)
+    monkeypatch.setattr(app.auth, "_token_verifier", TokenVerifier(fake.project_id, keys))
+    return fake
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Assert a maximum number of SQL queries per request.
+
+    Usage:
+        with query_budget(5):
+            client.get("/grades/1")
+
+    Every request made inside the block must run at most the given number of
+    queries and must not trip the repeated-statement (N+1) detector.
+    """
+    @contextmanager
+    def budget(max_queries, allow_repeats=False):
+        recorded = []
+        observer = lambda scope, stats: recorded.append((scope["method"], scope["path"], stats))
+        request_observers.append(observer)
+        try:
+            yield recorded
+        finally:
+            request_observers.remove(observer)
+
+        for method, path, stats in recorded:
+            assert stats.count <= max_queries, (
+                f"{method} {path} ran {stats.count} queries (budget {max_queries}): {stats.shapes}"
+            )
+            if not allow_repeats:
+                assert not stats.repeated_statements(), (
+                    f"{method} {path} repeated statements: {stats.repeated_statements()}"
+                )
+
+    return budget
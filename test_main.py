@@ -4,6 +4,7 @@
 import firebase_admin
 firebase_admin.initialize_app = lambda *args, **kwargs: None
 
+import json
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -81,4 +82,744 @@ def test_create_student():
     assert response.status_code == 200
     data = response.json()
     assert data["name"] == "John Doe"
-    assert data["email"] == "john@example.com"
\ No newline at end of file
+    assert data["email"] == "john@example.com"
+
+def test_transcript_weighted_gpa():
+    headers = {"Authorization": "Bearer test-token"}
+    math = client.post("/courses/", json={"name": "Math"}, headers=headers).json()
+    art = client.post("/courses/", json={"name": "Art"}, headers=headers).json()
+    client.put(f"/courses/{math['id']}/credits", json={"credit_hours": 3}, headers=headers)
+    client.put(f"/courses/{art['id']}/credits", json={"credit_hours": 1}, headers=headers)
+    for course in (math, art):
+        client.post(f"/courses/{course['id']}/students", json={"student_ids": [901]}, headers=headers)
+    client.post("/grades/", json={"student_id": 901, "subject": "Math", "grade": 95}, headers=headers)
+    client.post("/grades/", json={"student_id": 901, "subject": "Art", "grade": 75}, headers=headers)
+
+    response = client.get("/students/901/transcript", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    # (4.0 * 3 + 2.0 * 1) / 4 credit hours
+    assert data["gpa"] == 3.5
+    assert data["total_credits"] == 4
+    assert data["class_rank"] is not None
+
+    response = client.post("/transcripts/batch", json={"student_ids": [901]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["transcripts"][0]["gpa"] == 3.5
+
+    # Requested students outside the course are not part of its cohort
+    response = client.post("/transcripts/batch", json={"student_ids": [901, 902], "course_id": math["id"]}, headers=headers)
+    assert [t["student_id"] for t in response.json()["transcripts"]] == [901]
+
+def test_transcript_batch_binds_ids_in_chunks():
+    from sqlalchemy import event
+    from app.database import IN_CLAUSE_CHUNK_SIZE
+
+    headers = {"Authorization": "Bearer test-token"}
+    course = client.post("/courses/", json={"name": "Logic"}, headers=headers).json()
+    client.post(f"/courses/{course['id']}/students", json={"student_ids": [921]}, headers=headers)
+    client.post("/grades/", json={"student_id": 921, "subject": "Logic", "grade": 88}, headers=headers)
+
+    parameter_counts = []
+    record = lambda conn, cursor, statement, parameters, *args: parameter_counts.append(len(parameters))
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        # More IDs than SQLite binds in one statement before 3.32
+        response = client.post("/transcripts/batch", json={"student_ids": list(range(20000, 22000)) + [921]}, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert response.status_code == 200
+    transcripts = {t["student_id"]: t for t in response.json()["transcripts"]}
+    assert len(transcripts) == 2001
+    assert transcripts[921]["gpa"] == 3.0
+    assert max(parameter_counts) <= IN_CLAUSE_CHUNK_SIZE
+
+def test_transcript_standing_reuses_cohort_until_data_changes(query_budget):
+    from app.transcripts import class_standings
+
+    headers = {"Authorization": "Bearer test-token"}
+    course = client.post("/courses/", json={"name": "Rhetoric"}, headers=headers).json()
+    client.post(f"/courses/{course['id']}/students", json={"student_ids": [911, 912]}, headers=headers)
+    client.post("/grades/", json={"student_id": 911, "subject": "Rhetoric", "grade": 95}, headers=headers)
+    grade = client.post("/grades/", json={"student_id": 912, "subject": "Rhetoric", "grade": 85}, headers=headers).json()
+
+    class_standings.clear()
+    first = client.get("/students/912/transcript", headers=headers).json()
+    # Version check, the student's own courses, enrollments and grades, and the activity log; the school is not re-read
+    with query_budget(6):
+        again = client.get("/students/912/transcript", headers=headers).json()
+    assert again == first
+
+    client.put(f"/grades/{grade['id']}", json={"student_id": 912, "subject": "Rhetoric", "grade": 100}, headers=headers)
+    updated = client.get("/students/912/transcript", headers=headers).json()
+    assert updated["gpa"] == 4.0
+    assert updated["class_rank"] == 1
+    assert updated["cohort_size"] == first["cohort_size"]
+    assert client.get("/students/913/transcript", headers=headers).json()["class_rank"] is None
+
+def test_report_card_export():
+    headers = {"Authorization": "Bearer test-token"}
+    response = client.post("/exports/report-cards?format=csv", headers=headers)
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+
+    # TestClient runs background tasks before returning
+    response = client.get(f"/exports/{job_id}", headers=headers)
+    assert response.json()["status"] == "complete"
+
+    response = client.get(f"/exports/{job_id}/download", headers=headers)
+    assert response.status_code == 200
+    lines = response.text.strip().splitlines()
+    assert lines[0].startswith("student_id,student_name")
+    assert any(line.startswith("901,") for line in lines[1:])
+
+def test_batch_enrollment_reports_duplicates():
+    headers = {"Authorization": "Bearer test-token"}
+    course = client.post("/courses/", json={"name": "Biology"}, headers=headers).json()
+    url = f"/courses/{course['id']}/students"
+
+    response = client.post(url, json={"student_ids": [11, 12, 11]}, headers=headers)
+    data = response.json()
+    assert data["successful"] == [11, 12]
+    assert data["failed"] == [{"student_id": 11, "reason": f"Student 11 is already enrolled in course {course['id']}"}]
+
+    response = client.post(url, json={"student_ids": [12, 13]}, headers=headers)
+    assert response.json()["successful"] == [13]
+    assert sorted(client.get(url, headers=headers).json()) == [11, 12, 13]
+
+    response = client.post("/courses/99999/students", json={"student_ids": [1]}, headers=headers)
+    assert response.json()["failed"][0]["reason"] == "Course with ID 99999 does not exist"
+
+def test_import_students_reports_row_errors():
+    headers = {"Authorization": "Bearer test-token"}
+    content = (
+        '{"name": "Ada", "email": "ada@example.com", "date_of_birth": "2001-02-03"}\n'
+        '{"name": "Ada Again", "email": "ada@example.com"}\n'
+        'not json\n'
+        '{"name": "", "email": "blank@example.com"}\n'
+        '{"name": "Alan", "email": "alan@example.com"}\n'
+    )
+    response = client.post(
+        "/students/import",
+        files={"file": ("students.ndjson", content, "application/x-ndjson")},
+        headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["successful"] == 2
+    assert data["failed"] == 3
+    assert data["errors"][0] == "Row 2: Duplicate email in file: ada@example.com"
+
+    csv_content = "name,email,date_of_birth\nAda,ada@example.com,2001-02-03\nGrace,grace@example.com,\n"
+    response = client.post(
+        "/students/import",
+        files={"file": ("students.csv", csv_content, "text/csv")},
+        headers=headers
+    )
+    data = response.json()
+    assert data["successful"] == 1
+    assert data["errors"] == ["Row 2: Email already registered: ada@example.com"]
+
+def test_batch_get_preserves_order_and_reports_missing():
+    headers = {"Authorization": "Bearer test-token"}
+    first = client.post("/courses/", json={"name": "Chemistry"}, headers=headers).json()
+    second = client.post("/courses/", json={"name": "Physics"}, headers=headers).json()
+
+    response = client.get(f"/courses/?ids={second['id']},99999,{first['id']}", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [course["id"] for course in data["items"]] == [second["id"], first["id"]]
+    assert data["missing"] == [99999]
+
+    response = client.post("/courses:batchGet", json={"ids": [first["id"]]}, headers=headers)
+    assert response.json()["items"][0]["name"] == "Chemistry"
+
+    response = client.post("/students:batchGet", json={"ids": [424242]})
+    assert response.json() == {"items": [], "missing": [424242]}
+
+def test_metrics_endpoint_reports_route_templates():
+    client.get("/grades/12345")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_requests_total{method="GET",route="/grades/{student_id}",status="200"}' in response.text
+    assert "http_request_duration_seconds_bucket" in response.text
+    assert 'http_request_db_seconds_count{route="/grades/{student_id}"}' in response.text
+
+def test_batch_enrollment_query_budget(query_budget):
+    headers = {"Authorization": "Bearer test-token"}
+    course = client.post("/courses/", json={"name": "Geography"}, headers=headers).json()
+
+    # Course lookup, existing-enrollment check, one executemany insert each for the
+    # enrollments and their outbox events, and the activity log
+    with query_budget(7) as requests:
+        client.post(f"/courses/{course['id']}/students", json={"student_ids": list(range(2000, 2200))}, headers=headers)
+    assert len(requests) == 1
+
+def test_ensure_schema_upgrades_existing_tables_once():
+    from sqlalchemy import inspect, text
+    from app.database import ensure_schema
+
+    legacy = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE students (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, email VARCHAR NOT NULL)"))
+
+    assert ensure_schema(legacy) is True
+    columns = [column["name"] for column in inspect(legacy).get_columns("students")]
+    assert "date_of_birth" in columns
+    assert "ix_students_email" in [index["name"] for index in inspect(legacy).get_indexes("students")]
+    # Already applied: only the fingerprint lookup runs
+    assert ensure_schema(legacy) is False
+
+def test_signup_rejected_when_password_pool_saturated(monkeypatch):
+    import app.main as main
+    from app.passwords import PasswordHasher
+
+    saturated = PasswordHasher(workers=1, max_pending=1)
+    saturated._slots.acquire()
+    monkeypatch.setattr(main, "password_hasher", saturated)
+
+    response = client.post(
+        "/auth/signup",
+        json={"username": "burst", "email": "burst@example.com", "password": "secret123"}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+
+def test_local_token_verifier_offline(tmp_path):
+    from app.auth import ExpiredIdTokenError, InvalidIdTokenError
+    from app.token_verifier import KeyCache, TokenVerifier
+    from benchmarks.fake_firebase import FakeFirebaseAuth
+
+    fake = FakeFirebaseAuth()
+    cache_path = str(tmp_path / "certs.json")
+    verifier = TokenVerifier(fake.project_id, KeyCache(fetch=fake.fetch_certificates, cache_path=cache_path))
+
+    token = fake.issue_token("teacher-1", roles=["teacher"])
+    claims = verifier.verify(token)
+    assert claims["uid"] == "teacher-1"
+    assert claims["roles"] == ["teacher"]
+    assert verifier.verify(token)["uid"] == "teacher-1"
+    assert fake.fetches == 1
+
+    with pytest.raises(ExpiredIdTokenError):
+        verifier.verify(fake.issue_token("teacher-1", lifetime=-10))
+    with pytest.raises(InvalidIdTokenError):
+        verifier.verify(fake.issue_token("teacher-1", audience="another-project"))
+    with pytest.raises(InvalidIdTokenError):
+        verifier.verify(FakeFirebaseAuth().issue_token("teacher-1"))
+
+    # A restarted worker whose refresh fails still verifies with the keys cached on disk
+    def unreachable():
+        raise OSError("network unreachable")
+    restarted = TokenVerifier(fake.project_id, KeyCache(fetch=unreachable, cache_path=cache_path))
+    assert restarted.verify(fake.issue_token("teacher-2"))["uid"] == "teacher-2"
+
+def test_students_only_see_their_own_records(fake_firebase):
+    fake = fake_firebase
+    student = {"Authorization": f"Bearer {fake.issue_token('7', roles=['student'])}"}
+    teacher = {"Authorization": f"Bearer {fake.issue_token('t-1', roles=['teacher'])}"}
+    guest = {"Authorization": f"Bearer {fake.issue_token('g-1', roles=[])}"}
+
+    assert client.get("/students/7/courses", headers=student).status_code == 200
+    response = client.get("/students/8/courses", headers=student)
+    assert response.status_code == 403
+    assert response.json()["detail"] == "You can only view your own courses"
+    assert client.get("/students/8/averages", headers=student).status_code == 403
+    assert client.get("/students/8/courses", headers=teacher).status_code == 200
+    assert client.get("/students/8/courses", headers=guest).status_code == 403
+    assert client.get("/courses/1/averages", headers=student).status_code == 403
+
+def test_list_endpoints_negotiate_json_and_msgpack():
+    import msgpack
+    client.post("/grades/", json={"student_id": 31, "subject": "Art", "grade": 91}, headers={"Authorization": "Bearer test-token"})
+
+    response = client.get("/grades/31")
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [{"subject": "Art", "grade": 91, "id": response.json()[0]["id"], "student_id": 31}]
+
+    packed = client.get("/grades/31", headers={"Accept": "application/msgpack"})
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert msgpack.unpackb(packed.content) == response.json()
+    assert packed.headers["vary"] == "Accept"
+
+def test_conditional_get_with_data_versions(query_budget):
+    headers = {"Authorization": "Bearer test-token"}
+    client.post("/grades/", json={"student_id": 41, "subject": "Music", "grade": 70}, headers=headers)
+
+    first = client.get("/grades/41")
+    etag = first.headers["etag"]
+    # An unchanged poll is answered from the version counter alone
+    with query_budget(3):
+        cached = client.get("/grades/41", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # Other students' changes leave the ETag alone; this student's changes replace it
+    client.post("/grades/", json={"student_id": 42, "subject": "Music", "grade": 80}, headers=headers)
+    assert client.get("/grades/41", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/grades/", json={"student_id": 41, "subject": "Art", "grade": 75}, headers=headers)
+    changed = client.get("/grades/41", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
+
+    averages = client.get("/students/41/averages", headers=headers)
+    assert client.get("/students/41/averages", headers={**headers, "If-None-Match": averages.headers["etag"]}).status_code == 304
+
+def test_change_feed_delivers_and_resumes_events():
+    import asyncio
+    import threading
+    from app.events import ChangeBroker, broker, stream_events
+    from app.outbox import process_outbox
+
+    # Grade writes through the API are published to the student's topic once relayed
+    client.post("/grades/", json={"student_id": 51, "subject": "Drama", "grade": 88}, headers={"Authorization": "Bearer test-token"})
+    process_outbox(TestingSessionLocal())
+    published = broker.replay(["student:51"], f"{broker.epoch}-0")
+    assert [(event.type, event.data["new_value"]) for event in published] == [("grade.create", 88)]
+
+    async def scenario():
+        feed = ChangeBroker()
+        first = feed.publish("grade.create", ["student:1"], {"grade_id": 1})
+        feed.publish("grade.create", ["student:2"], {"grade_id": 2})
+        missed = feed.publish("enrollment.added", ["student:1", "course:3"], {"course_id": 3})
+
+        stream = stream_events(["student:1"], first.id, change_broker=feed, heartbeat=0.05)
+        assert await stream.__anext__() == "retry: 3000\n\n"
+        assert (await stream.__anext__()).startswith(f"id: {missed.id}\nevent: enrollment.added\n")
+        assert await stream.__anext__() == ": keep-alive\n\n"
+        # Sync endpoints publish from the threadpool
+        worker = threading.Thread(target=feed.publish, args=("grade.update", ["student:1"], {"grade_id": 1}))
+        worker.start()
+        worker.join()
+        assert "event: grade.update" in await stream.__anext__()
+        assert feed.subscriber_count() == 1
+        await stream.aclose()
+        assert feed.subscriber_count() == 0
+
+        # IDs from another worker cannot be resumed
+        stale = stream_events(["student:1"], "0000-5", change_broker=feed)
+        await stale.__anext__()
+        assert await stale.__anext__() == "event: reset\ndata: {}\n\n"
+        await stale.aclose()
+
+    asyncio.run(scenario())
+
+def test_grade_write_commits_once_and_relays_outbox():
+    from sqlalchemy import event
+    from app.database import ActivityLog, GradeHistory, OutboxEvent
+    from app.outbox import process_outbox
+
+    commits = []
+    count_commit = lambda connection: commits.append(connection)
+    event.listen(engine, "commit", count_commit)
+    try:
+        response = client.post("/grades/", json={"student_id": 61, "subject": "Latin", "grade": 64}, headers={"Authorization": "Bearer test-token"})
+    finally:
+        event.remove(engine, "commit", count_commit)
+    assert response.status_code == 200
+    # Grade, history entry and outbox event share one transaction
+    assert len(commits) == 1
+    grade_id = response.json()["id"]
+
+    db = TestingSessionLocal()
+    try:
+        assert db.query(GradeHistory).filter(GradeHistory.grade_id == grade_id).count() == 1
+        assert db.query(OutboxEvent).count() >= 1
+        assert process_outbox(db) >= 1
+        assert db.query(OutboxEvent).count() == 0
+        log = db.query(ActivityLog).filter(ActivityLog.action == "create_grade", ActivityLog.resource_id == str(grade_id)).one()
+        assert log.status_code == 201
+        assert process_outbox(db) == 0
+    finally:
+        db.close()
+
+def test_grades_and_averages_as_of_past_moments():
+    from app.database import GradeHistory, GradeSnapshot
+    from app.history import SNAPSHOT_KEEP, grades_as_of, take_grade_snapshot
+
+    headers = {"Authorization": "Bearer test-token"}
+    grade_id = client.post("/grades/", json={"student_id": 71, "subject": "Physics", "grade": 60}, headers=headers).json()["id"]
+    client.put(f"/grades/{grade_id}", json={"grade": 80}, headers=headers)
+    other_id = client.post("/grades/", json={"student_id": 71, "subject": "Chemistry", "grade": 90}, headers=headers).json()["id"]
+    client.delete(f"/grades/{grade_id}", headers=headers)
+
+    db = TestingSessionLocal()
+    try:
+        created, updated, added, deleted = [
+            change.timestamp for change in
+            db.query(GradeHistory).filter(GradeHistory.student_id == 71).order_by(GradeHistory.id)
+        ]
+        expected = {
+            created: {grade_id: 60},
+            updated: {grade_id: 80},
+            added: {grade_id: 80, other_id: 90},
+            deleted: {other_id: 90},
+        }
+        replayed = {moment: {g.id: g.grade for g in grades_as_of(db, [71], moment).get(71, [])} for moment in expected}
+        assert replayed == expected
+        # A snapshot in the middle of the history gives the same answers
+        take_grade_snapshot(db, taken_at=updated)
+        assert {moment: {g.id: g.grade for g in grades_as_of(db, [71], moment).get(71, [])} for moment in expected} == expected
+        # Older snapshots are pruned as new ones are taken, without changing the answers
+        for moment in [added] * 20 + [deleted]:
+            take_grade_snapshot(db, taken_at=moment)
+        # About SNAPSHOT_KEEP per doubling of age: 1-4, 5-8, 9-16 and 17-22 snapshots back
+        assert db.query(GradeSnapshot).count() <= 4 * SNAPSHOT_KEEP
+        assert {moment: {g.id: g.grade for g in grades_as_of(db, [71], moment).get(71, [])} for moment in expected} == expected
+    finally:
+        db.close()
+
+    response = client.get("/grades/71", params={"as_of": added})
+    assert sorted(grade["grade"] for grade in response.json()) == [80, 90]
+    averages = client.get("/students/71/averages", params={"as_of": updated}, headers=headers).json()
+    assert averages["subject_averages"] == {"Physics": 80}
+    assert client.get("/grades/71", params={"as_of": "2000-01-01T00:00:00"}).json() == []
+
+def test_bulk_grade_mutations_in_one_transaction(query_budget):
+    from app.database import ActivityLog, GradeHistory
+    from app.outbox import process_outbox
+
+    headers = {"Authorization": "Bearer test-token"}
+    course = client.post("/courses/", json={"name": "Optics"}, headers=headers).json()
+    ids = []
+    for student_id in range(81, 91):
+        ids.append(client.post("/grades/", json={"student_id": student_id, "subject": "Optics Exam", "grade": 90}, headers=headers).json()["id"])
+        if student_id < 86:
+            client.post(f"/courses/{course['id']}/students/{student_id}", headers=headers)
+
+    # Lookup, one executemany UPDATE, history, outbox, activity and version inserts, independent of batch size
+    with query_budget(8):
+        response = client.post("/grades:batchUpdate", json={"updates": [{"grade_id": i, "grade": 70} for i in ids] + [{"grade_id": 999999, "grade": 50}]}, headers=headers)
+    assert response.status_code == 200
+    assert [item["grade"] for item in response.json()["items"]] == [70] * 10
+    assert response.json()["missing"] == [999999]
+
+    rejected = client.post("/grades:batchUpdate", json={"updates": [{"grade_id": ids[0], "grade": 60}, {"grade_id": ids[1], "grade": 101}]}, headers=headers)
+    assert rejected.status_code == 400
+    assert rejected.json()["detail"]["errors"] == [f"Grade {ids[1]}: Grade must be between 0 and 100, got: 101"]
+    assert client.get("/grades/81").json()[0]["grade"] == 70
+
+    # Curve only the enrolled students; results above 100 are clamped when asked to
+    curve = {"subject": "Optics Exam", "delta": 35, "course_id": course["id"]}
+    assert client.post("/grades:adjust", json=curve, headers=headers).status_code == 400
+    curved = client.post("/grades:adjust", json={**curve, "clamp": True}, headers=headers).json()["items"]
+    assert sorted(item["student_id"] for item in curved) == [81, 82, 83, 84, 85]
+    assert {item["grade"] for item in curved} == {100}
+    assert client.get("/grades/86").json()[0]["grade"] == 70
+
+    deleted = client.post("/grades:batchDelete", json={"ids": ids[:3]}, headers=headers).json()
+    assert [item["id"] for item in deleted["items"]] == ids[:3]
+    assert client.get("/grades/81").json() == []
+
+    db = TestingSessionLocal()
+    try:
+        actions = [action for (action,) in db.query(GradeHistory.action).filter(GradeHistory.grade_id == ids[0]).order_by(GradeHistory.id)]
+        assert actions == ["create", "update", "update", "delete"]
+
+        # Each batch request leaves one activity log naming the grades it changed
+        while process_outbox(db):
+            pass
+        logs = {log.action: json.loads(log.details) for log in db.query(ActivityLog).order_by(ActivityLog.id).filter(
+            ActivityLog.action.in_(["batch_update_grades", "adjust_grades", "batch_delete_grades"])
+        )}
+        assert logs["batch_update_grades"]["count"] == 10
+        assert logs["batch_update_grades"]["grade_ids"] == ids
+        assert logs["adjust_grades"]["count"] == 5
+        assert logs["adjust_grades"]["subject"] == "Optics Exam"
+        assert logs["batch_delete_grades"] == {"count": 3, "grade_ids": ids[:3]}
+    finally:
+        db.close()
+
+def test_grade_upload_retries_are_idempotent():
+    headers = {"Authorization": "Bearer test-token"}
+    csv_file = b"student_id,subject,grade,assessment\n91,Biology,70,Midterm\n91,Biology,80,Final\n92,Biology,65,Midterm\n"
+
+    first = client.post("/grades/upload", files={"file": ("grades.csv", csv_file, "text/csv")}, headers=headers)
+    assert first.status_code == 200
+    assert first.json()["successful"] == 3
+    # A blind retry of the same file is answered from the receipt and inserts nothing
+    retry = client.post("/grades/upload", files={"file": ("grades.csv", csv_file, "text/csv")}, headers=headers)
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert retry.json() == first.json()
+    assert len(client.get("/grades/91").json()) == 2
+
+    # Upsert matches (student_id, subject, assessment): one change, the rest skipped
+    corrected = csv_file.replace(b"91,Biology,80,Final", b"91,Biology,85,Final")
+    upsert = client.post("/grades/upload", params={"mode": "upsert"}, files={"file": ("grades.csv", corrected, "text/csv")}, headers=headers).json()
+    assert (upsert["created"], upsert["updated"], upsert["unchanged"]) == (0, 1, 2)
+    assert sorted(grade["grade"] for grade in client.get("/grades/91").json()) == [70, 85]
+
+    keyed = {**headers, "Idempotency-Key": "biology-upload-1"}
+    new_rows = b"student_id,subject,grade\n93,Biology,90\n"
+    assert client.post("/grades/upload", files={"file": ("b.csv", new_rows, "text/csv")}, headers=keyed).json()["created"] == 1
+    replayed = client.post("/grades/upload", files={"file": ("b.csv", new_rows, "text/csv")}, headers=keyed)
+    assert replayed.headers["idempotent-replayed"] == "true"
+    assert len(client.get("/grades/93").json()) == 1
+    assert client.post("/grades/upload", files={"file": ("b.csv", csv_file, "text/csv")}, headers=keyed).status_code == 422
+
+
+    # A request killed mid-upload holds its key only until the processing lease runs out
+    from datetime import datetime, timedelta
+    from app.database import UploadReceipt
+    from app.uploads import UPLOAD_PROCESSING_LEASE_SECONDS, content_hash
+    crashed = {**headers, "Idempotency-Key": "crashed-upload"}
+    db = TestingSessionLocal()
+    receipt = UploadReceipt(
+        user_id="test-user-id", idempotency_key="crashed-upload", content_hash=content_hash(new_rows),
+        parameters="mode=insert;min=0;max=100;format=csv", status="processing", created_at=datetime.now().isoformat()
+    )
+    db.add(receipt)
+    db.commit()
+    assert client.post("/grades/upload", files={"file": ("b.csv", new_rows, "text/csv")}, headers=crashed).status_code == 409
+    receipt.created_at = (datetime.now() - timedelta(seconds=UPLOAD_PROCESSING_LEASE_SECONDS + 1)).isoformat()
+    db.commit()
+    db.close()
+    assert client.post("/grades/upload", files={"file": ("b.csv", new_rows, "text/csv")}, headers=crashed).json()["created"] == 1
+
+
+def test_resumable_chunked_upload(monkeypatch, tmp_path):
+    import hashlib
+    from app import chunked_uploads
+    monkeypatch.setattr(chunked_uploads, "UPLOAD_DIR", str(tmp_path))
+    headers = {"Authorization": "Bearer test-token"}
+    content = b"student_id,subject,grade\n" + b"".join(b"95,Chemistry,%d\n" % grade for grade in range(60, 90))
+    first, second = content[:100], content[100:]
+
+    def put(upload_id, offset, chunk, checksum=None):
+        chunk_headers = {**headers, "Upload-Offset": str(offset), "Chunk-SHA256": checksum or hashlib.sha256(chunk).hexdigest()}
+        return client.put(f"/grades/uploads/{upload_id}", content=chunk, headers=chunk_headers)
+
+    created = client.post("/grades/uploads", json={
+        "filename": "chemistry.csv", "size": len(content), "sha256": hashlib.sha256(content).hexdigest()
+    }, headers=headers)
+    assert created.status_code == 201
+    upload_id = created.json()["id"]
+
+    assert put(upload_id, 0, first).headers["upload-offset"] == "100"
+    # A corrupted chunk is dropped and the offset stays where it was
+    assert put(upload_id, 100, second, checksum="0" * 64).status_code == 422
+    # Resending an already stored chunk is answered with the offset to resume from
+    stale = put(upload_id, 0, first)
+    assert stale.status_code == 409 and stale.headers["upload-offset"] == "100"
+    assert client.post(f"/grades/uploads/{upload_id}/commit", headers=headers).status_code == 409
+
+    assert put(upload_id, 100, second).json()["offset"] == len(content)
+    assert client.post(f"/grades/uploads/{upload_id}/commit", headers=headers).status_code == 202
+    status = client.get(f"/grades/uploads/{upload_id}", headers=headers).json()
+    assert status["status"] == "done"
+    assert status["result"]["successful"] == 30 and status["rows_processed"] == 30
+    # A retried commit reports the state without importing the file again
+    assert client.post(f"/grades/uploads/{upload_id}/commit", headers=headers).json()["status"] == "done"
+    assert len(client.get("/grades/95").json()) == 30
+
+    # An import whose worker died stops holding the upload once its lease runs out
+    stalled = client.post("/grades/uploads", json={"filename": "stalled.csv", "size": 10}, headers=headers).json()
+    meta = chunked_uploads.get_upload(stalled["id"])
+    meta.update(status="processing")
+    chunked_uploads._save_upload(meta)
+    monkeypatch.setattr(chunked_uploads, "IMPORT_LEASE_SECONDS", 0)
+    assert client.get(f"/grades/uploads/{stalled['id']}", headers=headers).json()["status"] == "failed"
+    assert client.delete(f"/grades/uploads/{stalled['id']}", headers=headers).status_code == 204
+
+
+def test_grade_upload_dry_run_streams_row_errors(query_budget):
+    import json
+    from app.database import Student
+    headers = {"Authorization": "Bearer test-token"}
+    db = TestingSessionLocal()
+    students = [Student(name=f"Dry Run {i}", email=f"dry-run-{i}@example.com") for i in range(2)]
+    db.add_all(students)
+    db.commit()
+    enrolled, other = (student.id for student in students)
+    db.close()
+    course = client.post("/courses/", json={"name": "Geology"}, headers=headers).json()
+    client.post(f"/courses/{course['id']}/students", json={"student_ids": [enrolled]}, headers=headers)
+
+    rows = [f"{enrolled},Geology,80", f"{enrolled},Geology,120", "999999,Geology,70", f"{other},Geology,75"]
+    content = ("student_id,subject,grade\n" + "\n".join(rows * 250) + "\n").encode()
+    # Students are resolved per 1000-row batch, not per row
+    with query_budget(10):
+        response = client.post(
+            "/grades/upload", params={"dry_run": "true", "course_id": course["id"]},
+            files={"file": ("geology.csv", content, "text/csv")}, headers=headers
+        )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    # Rows are numbered like the errors of a real upload
+    assert lines[:3] == [
+        {"row": 2, "error": "Grade must be between 0 and 100, got: 120"},
+        {"row": 3, "error": "Student 999999 does not exist"},
+        {"row": 4, "error": f"Student {other} is not enrolled in course {course['id']}"},
+    ]
+    assert lines[-1] == {"summary": {"total_processed": 1000, "valid": 250, "invalid": 750}}
+    # Nothing was written
+    assert client.get(f"/grades/{enrolled}").json() == []
+
+    # Files a real upload would refuse are refused by the dry run too
+    too_long = content + f"{enrolled},Geology,80\n".encode()
+    ndjson = b'{"student_id": 1, "subject": "Geology", "grade": 80}\n'
+    missing_grade = b"student_id,subject\n1,Geology\n"
+    for filename, body in [("long.csv", too_long), ("rows.ndjson", ndjson), ("short.csv", missing_grade)]:
+        for dry_run in ("true", "false"):
+            response = client.post("/grades/upload", params={"dry_run": dry_run}, files={"file": (filename, body)}, headers=headers)
+            assert response.status_code == 400
+
+
+def test_resumable_upload_dry_run_streams_large_files(monkeypatch, tmp_path):
+    import hashlib
+    import json
+    from app import chunked_uploads
+    from app.database import Student
+    monkeypatch.setattr(chunked_uploads, "UPLOAD_DIR", str(tmp_path))
+    headers = {"Authorization": "Bearer test-token"}
+    db = TestingSessionLocal()
+    student = Student(name="Long File", email="long-file@example.com")
+    db.add(student)
+    db.commit()
+    student_id = student.id
+    db.close()
+
+    # Far past the row limit of POST /grades/upload, with the only bad row at the end
+    content = b"student_id,subject,grade\n" + b"%d,Astronomy,80\n" % student_id * 5000 + b"%d,Astronomy,180\n" % student_id
+    upload_id = client.post("/grades/uploads", json={"filename": "astronomy.csv", "size": len(content)}, headers=headers).json()["id"]
+    chunk_headers = {**headers, "Upload-Offset": "0", "Chunk-SHA256": hashlib.sha256(content).hexdigest()}
+    client.put(f"/grades/uploads/{upload_id}", content=content, headers=chunk_headers)
+
+    response = client.post(f"/grades/uploads/{upload_id}/commit", params={"dry_run": "true"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines == [
+        {"row": 5002, "error": "Grade must be between 0 and 100, got: 180"},
+        {"summary": {"total_processed": 5001, "valid": 5000, "invalid": 1}},
+    ]
+    # Nothing was written and the upload can still be committed
+    assert client.get(f"/grades/{student_id}").json() == []
+    assert client.get(f"/grades/uploads/{upload_id}", headers=headers).json()["status"] == "receiving"
+    assert client.post(f"/grades/uploads/{upload_id}/commit", headers=headers).status_code == 202
+    assert client.get(f"/grades/uploads/{upload_id}", headers=headers).json()["result"]["successful"] == 5000
+    assert client.post(f"/grades/uploads/{upload_id}/commit", params={"dry_run": "true"}, headers=headers).status_code == 409
+
+def test_grade_validator_batch_matches_row_checks():
+    from sqlalchemy import event
+    from app.database import IN_CLAUSE_CHUNK_SIZE, Student
+    from app.validators import GradeValidator, grade_columns
+    db = TestingSessionLocal()
+    student = Student(name="Batch Checked", email="batch-checked@example.com")
+    db.add(student)
+    db.commit()
+
+    rows = [
+        {"student_id": str(student.id), "subject": "Art", "grade": "88"},
+        {"student_id": "abc", "subject": "Art", "grade": "88"},
+        {"student_id": "-4", "subject": "Art", "grade": "88"},
+        {"student_id": "7", "subject": "  ", "grade": "88"},
+        {"student_id": "7", "subject": "Art", "grade": "A+"},
+        {"student_id": "7", "subject": "Art", "grade": "101"},
+        {"student_id": "7", "grade": "50"},
+        {"student_id": "999999", "subject": "Art", "grade": "50"},
+    ]
+    validator = GradeValidator()
+    expected = [(index, validator.validate_grade_data(row)[1]) for index, row in enumerate(rows) if not validator.validate_grade_data(row)[0]]
+    assert validator.validate_batch(grade_columns(rows)) == expected
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        # Referenced students are resolved with one IN query for the whole chunk
+        errors = validator.validate_batch(grade_columns(rows), db=db)
+        assert len(statements) == 1
+        assert errors[-1] == (7, "Student 999999 does not exist")
+        assert 0 not in dict(errors)
+
+        # Large chunks are split into IN lists the database accepts
+        statements.clear()
+        many = [{"student_id": str(student.id + offset), "subject": "Art", "grade": "60"} for offset in range(2 * IN_CLAUSE_CHUNK_SIZE + 1)]
+        assert len(validator.validate_batch(grade_columns(many), db=db)) == 2 * IN_CLAUSE_CHUNK_SIZE
+        assert len(statements) == 3
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    db.close()
+
+
+def test_upload_templates_are_cached_with_etags(query_budget):
+    headers = {"Authorization": "Bearer test-token"}
+    first = client.get("/grades/upload/template", headers=headers)
+    assert first.status_code == 200
+    assert first.text.splitlines()[0] == "student_id,subject,grade"
+    assert "max-age=86400" in first.headers["cache-control"]
+    assert client.get("/grades/upload/template", headers=headers).content == first.content
+    cached = client.get("/grades/upload/template", headers={**headers, "If-None-Match": first.headers["etag"]})
+    assert cached.status_code == 304
+    excel = client.get("/grades/upload/template", params={"format": "excel"}, headers=headers)
+    assert excel.headers["etag"] != first.headers["etag"]
+    assert excel.content[:2] == b"PK"
+
+    course = client.post("/courses/", json={"name": "Astronomy"}, headers=headers).json()
+    url = f"/courses/{course['id']}/grade-template"
+    client.post(f"/courses/{course['id']}/students", json={"student_ids": [31, 32]}, headers=headers)
+    roster = client.get(url, headers=headers)
+    assert roster.text.splitlines()[1:] == ["31,Astronomy,", "32,Astronomy,"]
+    # A repeat only looks up the course and its version (plus the activity log); the roster is not re-read
+    with query_budget(4):
+        assert client.get(url, headers={**headers, "If-None-Match": roster.headers["etag"]}).status_code == 304
+
+    client.post(f"/courses/{course['id']}/students", json={"student_ids": [33]}, headers=headers)
+    updated = client.get(url, headers={**headers, "If-None-Match": roster.headers["etag"]})
+    assert updated.status_code == 200
+    assert updated.text.splitlines()[-1] == "33,Astronomy,"
+
+
+def test_request_profiling_is_gated_and_captures_routes(monkeypatch):
+    from fastapi import FastAPI
+    from app import profiling
+    headers = {"Authorization": "Bearer test-token"}
+    assert client.get("/admin/profile/requests", headers=headers).status_code == 404
+    assert client.get("/admin/profile/cpu", params={"seconds": 0.05}, headers=headers).status_code == 404
+
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    profiled_app = FastAPI()
+    profiled_app.router.route_class = profiling.ProfilingRoute
+
+    def compute_report_totals():
+        return {"total": sum(range(1000))}
+
+    @profiled_app.get("/reports/{report_id}")
+    def get_report(report_id: int):
+        return compute_report_totals()
+
+    profiling.request_profiler.arm("/reports/{report_id}", 1)
+    profiled = TestClient(profiled_app)
+    assert profiled.get("/reports/1").json() == {"total": 499500}
+    assert profiled.get("/reports/2").status_code == 200  # Only the armed number of requests is captured
+    report = client.get("/admin/profile/requests", headers=headers).text
+    assert "'captured': 1" in report and "compute_report_totals" in report
+    assert client.delete("/admin/profile/requests", headers=headers).json()["route"] is None
+
+    stacks = client.get("/admin/profile/cpu", params={"seconds": 0.05, "interval_ms": 5}, headers=headers)
+    assert stacks.status_code == 200 and stacks.text
+    assert client.get("/admin/profile/cpu", params={"seconds": 31}, headers=headers).status_code == 422
+
+
+def test_repeated_statement_warning_printed_once_per_route(capsys):
+    import asyncio
+    from app.metrics import MetricsMiddleware, MetricsRegistry
+    from app.query_stats import current_query_stats
+
+    async def looping_endpoint(scope, receive, send):
+        current_query_stats.get().shapes["SELECT * FROM grades WHERE id = ?"] = 25
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    middleware = MetricsMiddleware(looping_endpoint, MetricsRegistry())
+    for _ in range(3):
+        asyncio.run(middleware({"type": "http", "method": "GET", "path": "/loop"}, None, noop_send))
+    assert capsys.readouterr().out.count("Possible N+1") == 1
+    # The counter stays the always-on signal
+    counters = middleware.metrics.snapshot()["counters"]
+    assert counters[("db_repeated_statement_requests_total", (("route", "unmatched"),))] == 3